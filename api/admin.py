@@ -1,22 +1,29 @@
 from django.contrib import admin
 from .models import (
     User, GoldWallet, RialWallet, GoldTransaction,
-    RialTransaction, Price, FAQ, License, BankAccount,
+    RialTransaction, Price, PriceCandle, MarketQuote, FAQ, License, BankAccount,
     Ticket, TicketAttachment, UserVerification,
-    TechnicalAnalysis, PricePrediction,
+    TechnicalAnalysis, PricePrediction, LedgerEntry, Notification, WebhookEvent,
 )
 
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_staff')
     search_fields = ('username', 'email')
 
-class GoldWalletAdmin(admin.ModelAdmin):
+class WalletAdmin(admin.ModelAdmin):
+    """Balances only change through wallets.adjust(), which records them in the ledger."""
     list_display = ('user', 'balance')
     search_fields = ('user__username',)
+    readonly_fields = ('user', 'balance')
 
-class RialWalletAdmin(admin.ModelAdmin):
-    list_display = ('user', 'balance')
-    search_fields = ('user__username',)
+    def has_add_permission(self, request): return False
+    def has_delete_permission(self, request, obj=None): return False
+
+class GoldWalletAdmin(WalletAdmin):
+    pass
+
+class RialWalletAdmin(WalletAdmin):
+    pass
 
 class GoldTransactionAdmin(admin.ModelAdmin):
     list_display = ('user', 'transaction_type', 'quantity', 'status', 'timestamp')
@@ -28,10 +35,45 @@ class RialTransactionAdmin(admin.ModelAdmin):
     list_filter = ('status', 'transaction_type', 'timestamp')
     search_fields = ('user__username','bank_account')
 
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'currency', 'amount', 'balance_after', 'entry_type', 'timestamp')
+    list_filter = ('currency', 'entry_type')
+    search_fields = ('user__username',)
+    ordering = ('-id',)
+
+    def has_add_permission(self, request): return False
+    def has_change_permission(self, request, obj=None): return False
+    def has_delete_permission(self, request, obj=None): return False
+
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = ('user', 'kind', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('user__username',)
+    ordering = ('-id',)
+    readonly_fields = ('user', 'kind', 'subject', 'body', 'attempts', 'last_error', 'created_at', 'sent_at')
+
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ('key', 'transaction_id', 'status', 'result', 'received_at')
+    list_filter = ('result',)
+    search_fields = ('key', 'transaction_id')
+    ordering = ('-id',)
+    def has_change_permission(self, request, obj=None): return False
+
 class PriceAdmin(admin.ModelAdmin):
     list_display = ('price', 'timestamp')
     ordering = ('-timestamp',)
 
+class PriceCandleAdmin(admin.ModelAdmin):
+    list_display = ('resolution', 'bucket_start', 'open', 'high', 'low', 'close', 'count')
+    list_filter = ('resolution',)
+    ordering = ('-bucket_start',)
+
+class MarketQuoteAdmin(admin.ModelAdmin):
+    list_display = ('symbol', 'category', 'price', 'unit', 'timestamp')
+    list_filter = ('category',)
+    search_fields = ('symbol', 'name')
+    ordering = ('-timestamp',)
+
 class FAQAdmin(admin.ModelAdmin):
     list_display = ('question', 'sort_order', 'is_active')
     list_filter = ('is_active',)
@@ -96,7 +138,12 @@ admin.site.register(GoldWallet, GoldWalletAdmin)
 admin.site.register(RialWallet, RialWalletAdmin)
 admin.site.register(GoldTransaction, GoldTransactionAdmin)
 admin.site.register(RialTransaction, RialTransactionAdmin)
+admin.site.register(LedgerEntry, LedgerEntryAdmin)
+admin.site.register(Notification, NotificationAdmin)
+admin.site.register(WebhookEvent, WebhookEventAdmin)
 admin.site.register(Price, PriceAdmin)
+admin.site.register(PriceCandle, PriceCandleAdmin)
+admin.site.register(MarketQuote, MarketQuoteAdmin)
 admin.site.register(FAQ, FAQAdmin)
 admin.site.register(License, LicenseAdmin)
 admin.site.register(BankAccount, BankAccountAdmin)
@@ -0,0 +1,81 @@
+from datetime import timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from .metrics import counters
+from .models import GoldTransaction, RialTransaction
+
+INTERVALS = {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}
+UTC = dt_timezone.utc
+BUCKET_KEY = 'analytics:{}:{}'
+FIELDS = ['trades', 'active_traders', 'gold_bought', 'gold_sold', 'fees', 'rial_deposits', 'rial_withdrawals']
+
+
+def floor(when, interval):
+    """The start of the UTC hour, day or (ISO, Monday) week containing `when`."""
+    when = when.astimezone(UTC).replace(minute=0, second=0, microsecond=0)
+    if interval != 'hour':
+        when = when.replace(hour=0)
+    if interval == 'week':
+        when -= timedelta(days=when.weekday())
+    return when
+
+
+def buckets(start, end, interval):
+    """The starts of the buckets overlapping [start, end)."""
+    bucket, starts = floor(start, interval), []
+    while bucket < end:
+        starts.append(bucket)
+        bucket += INTERVALS[interval]
+    return starts
+
+
+def _compute(start, end, interval):
+    """Totals of every bucket in [start, end) from one GROUP BY per table."""
+    bucket = Trunc('timestamp', interval, tzinfo=UTC)
+    totals = {start: dict.fromkeys(FIELDS, 0) for start in buckets(start, end, interval)}
+    buy, sell = Q(transaction_type='BUY'), Q(transaction_type='SELL')
+    trades = GoldTransaction.objects.filter(timestamp__gte=start, timestamp__lt=end).annotate(bucket=bucket).values('bucket').annotate(
+        trades=Count('id'),
+        active_traders=Count('user_id', distinct=True),
+        gold_bought=Sum('quantity', filter=buy, default=0),
+        gold_sold=Sum('quantity', filter=sell, default=0),
+        fees=Sum('fees', default=0),
+    ).order_by()
+    flows = RialTransaction.objects.filter(timestamp__gte=start, timestamp__lt=end, status='COMPLETED').annotate(bucket=bucket).values('bucket').annotate(
+        rial_deposits=Sum('amount', filter=Q(transaction_type='DEPOSIT'), default=0),
+        rial_withdrawals=Sum('amount', filter=Q(transaction_type='WITHDRAWAL'), default=0),
+    ).order_by()
+    for row in [*trades, *flows]:
+        totals[row.pop('bucket')].update(row)
+    return totals
+
+
+def invalidate(timestamps):
+    """Forgets the cached buckets containing `timestamps`, e.g. of transactions settled, edited or deleted after their bucket ended."""
+    cache.delete_many({BUCKET_KEY.format(interval, floor(when, interval).isoformat()) for when in timestamps for interval in INTERVALS})
+
+
+def series(interval, start, end):
+    """
+    Per-bucket totals (FIELDS) of trades and completed rial deposits and
+    withdrawals for the buckets overlapping [start, end). Buckets that ended
+    more than REPORT_SETTLE_SECONDS ago only change when a transaction in them
+    is settled, edited or deleted, which invalidate()s them, so they are cached
+    until then; only the missing span is queried.
+    """
+    step = INTERVALS[interval]
+    settled = timezone.now() - timedelta(seconds=getattr(settings, 'REPORT_SETTLE_SECONDS', 60))
+    starts = buckets(start, end, interval)
+    keys = {bucket: BUCKET_KEY.format(interval, bucket.isoformat()) for bucket in starts}
+    found = cache.get_many(keys.values())
+    missing = [bucket for bucket in starts if keys[bucket] not in found]
+    counters.incr('analytics.hit', len(starts) - len(missing))
+    counters.incr('analytics.miss', len(missing))
+    if missing:
+        computed = _compute(missing[0], missing[-1] + step, interval)
+        cache.set_many({keys[bucket]: computed[bucket] for bucket in missing if bucket + step <= settled}, timeout=None)
+        found.update({keys[bucket]: computed[bucket] for bucket in missing})
+    return [{'bucket': bucket, **found[keys[bucket]]} for bucket in starts]
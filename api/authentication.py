@@ -1,19 +1,157 @@
 # api/authentication.py
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils import timezone
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .metrics import counters
+from .models import TokenRevocation
+from .verification import LOCAL_CACHE_TTL
+
+REVOKED_TOKEN_KEY = 'jwt-revoked:{}'
+REVOKED_USER_KEY = 'jwt-revoked-user:{}'
+CLAIM_FIELDS = ['username', 'email', 'first_name', 'last_name', 'phone_number', 'is_staff']
+
+
+class ActiveFlagCache:
+    """A bounded, per-process LRU of users' is_active flags whose entries expire after JWT_ACTIVE_CACHE_TTL seconds."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[1] < time.monotonic():
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[0]
+
+    def set(self, user_id, active):
+        with self._lock:
+            self._entries[user_id] = (active, time.monotonic() + getattr(settings, 'JWT_ACTIVE_CACHE_TTL', 60))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > getattr(settings, 'JWT_ACTIVE_CACHE_SIZE', 10000):
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+active_users = ActiveFlagCache()
+
+
+def cache_ttl():
+    """JWT_REVOCATION_CACHE_TTL, cut to LOCAL_CACHE_TTL seconds when the cache is per process (see verification.cache_ttl)."""
+    ttl = getattr(settings, 'JWT_REVOCATION_CACHE_TTL', 60)
+    return min(ttl, LOCAL_CACHE_TTL) if isinstance(caches['default'], LocMemCache) else ttl
+
+
+def revoke_token(token):
+    """Rejects a token (access or refresh) until it would have expired anyway."""
+    key = REVOKED_TOKEN_KEY.format(token[api_settings.JTI_CLAIM])
+    TokenRevocation.objects.get_or_create(key=key, defaults={'expires_at': datetime.fromtimestamp(token['exp'], dt_timezone.utc)})
+    transaction.on_commit(lambda: cache.set(key, 1, timeout=max(1, int(token['exp'] - time.time()))))
+
+
+def revoke_user(user_id):
+    """Rejects every token issued to the user so far, e.g. after deactivation."""
+    key, now = REVOKED_USER_KEY.format(user_id), timezone.now()
+    TokenRevocation.objects.update_or_create(key=key, defaults={'revoked_at': now, 'expires_at': now + api_settings.REFRESH_TOKEN_LIFETIME})
+    transaction.on_commit(lambda: cache.set(key, int(now.timestamp()), timeout=cache_ttl()))
+    active_users.discard(user_id)
+
+
+def is_revoked(token):
+    """
+    Whether the token or its user was revoked. Revocations live in the
+    TokenRevocation table; the cache holds what was read (0 for none) for
+    cache_ttl() seconds, and revoking overwrites it once committed.
+    """
+    token_key = REVOKED_TOKEN_KEY.format(token[api_settings.JTI_CLAIM])
+    user_key = REVOKED_USER_KEY.format(token.get(api_settings.USER_ID_CLAIM))
+    revoked = cache.get_many([token_key, user_key])
+    missing = {token_key, user_key} - set(revoked)
+    if missing:
+        counters.incr('jwt_revocation.miss')
+        found = dict(TokenRevocation.objects.filter(key__in=missing, expires_at__gt=timezone.now()).values_list('key', 'revoked_at'))
+        fetched = {key: int(found[key].timestamp()) if key in found else 0 for key in missing}
+        cache.set_many(fetched, timeout=cache_ttl())
+        revoked.update(fetched)
+    return bool(revoked[token_key] or (revoked[user_key] and token.get('iat', 0) <= revoked[user_key]))
+
+
+def purge_revocations():
+    """Forgets revocations whose tokens have all expired. Returns how many were deleted."""
+    return TokenRevocation.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+def claims_user(token):
+    """An unsaved-style User built from the token claims; read-only, never save() it."""
+    model = get_user_model()
+    user = model(pk=model._meta.pk.to_python(token[api_settings.USER_ID_CLAIM]), is_active=True, **{field: token.get(field) or '' for field in CLAIM_FIELDS})
+    user.is_staff = bool(token.get('is_staff'))
+    user._state.adding = False
+    return user
+
 
 class CustomJWTAuthentication(JWTAuthentication):
     """
     A custom authentication class that reads the JWT from a custom header
     instead of the 'Authorization' header.
+
+    Revoked tokens (see LogoutView) are rejected. With JWT_CLAIMS_AUTH the user
+    is built from the token claims and only its active flag is looked up, from
+    the `active_users` cache or, on a miss, the database.
     """
     def get_header(self, request):
         header_name = 'X-Access-Token'
         token = request.headers.get(header_name)
-        
+
         if token:
             return token.encode('utf-8')
-        
+
         return None
 
     def get_raw_token(self, header):
-        return header
\ No newline at end of file
+        return header
+
+    def get_validated_token(self, raw_token):
+        token = super().get_validated_token(raw_token)
+        if is_revoked(token):
+            raise InvalidToken('Token has been revoked.')
+        return token
+
+    def get_user(self, validated_token):
+        if not getattr(settings, 'JWT_CLAIMS_AUTH', False):
+            return super().get_user(validated_token)
+        try:
+            user_id = get_user_model()._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+        active = active_users.get(user_id)
+        if active is None:
+            counters.incr('jwt_user.miss')
+            active = get_user_model().objects.filter(pk=user_id).values_list('is_active', flat=True).first()
+            if active is None:
+                raise AuthenticationFailed('User not found', code='user_not_found')
+            active_users.set(user_id, active)
+        else:
+            counters.incr('jwt_user.hit')
+        if not active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        return claims_user(validated_token)
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from django.conf import settings
+from .indicators import TIMEFRAMES, signal_history
+from .inference import score_window
+from .price_frame import load_price_frame
+
+LONG_SIGNALS = {'BUY', 'STRONG_BUY'}
+FLAT_SIGNALS = {'SELL', 'STRONG_SELL'}
+
+
+def technical_signals(label):
+    """
+    The summary signal of a registry timeframe after every closed candle, indexed
+    by the time it becomes known (the candle's end).
+    """
+    timeframe = TIMEFRAMES[label]
+    candles = load_price_frame(resample=timeframe.rule)
+    candles['high'] = candles['close']; candles['low'] = candles['close']
+    signals = signal_history(candles)
+    signals.index = signals.index + to_offset(timeframe.rule)
+    return signals
+
+
+def prediction_signals(horizon):
+    """
+    The current model's signal after every hourly candle, indexed by the
+    candle's end. The model has seen most of this history during training, so
+    these results are in-sample.
+    """
+    scores = score_window(horizon)
+    if scores is None:
+        return None
+    signals = scores['signal']
+    signals.index = signals.index + to_offset('h')
+    return signals
+
+
+def simulate(close, signals, fee=None):
+    """
+    Replays `signals` over the `close` series: a buy signal goes all-in on gold,
+    a sell signal goes back to rials and anything else keeps the position.
+    Orders fill at the next close, paying `fee` (default BACKTEST_FEE_RATE) of the
+    traded value. Everything is computed with array operations over the whole series.
+    """
+    fee = float(getattr(settings, 'BACKTEST_FEE_RATE', 0) if fee is None else fee)
+    prices = close.to_numpy(dtype=float)
+    known = signals[~signals.index.duplicated(keep='last')].reindex(close.index, method='ffill')
+    target = np.where(known.isin(LONG_SIGNALS), 1.0, np.where(known.isin(FLAT_SIGNALS), 0.0, np.nan))
+    position = pd.Series(target).ffill().fillna(0.0).to_numpy()
+    position = np.concatenate([[0.0], position[:-1]])  # act on the next close
+
+    returns = np.zeros(len(prices))
+    returns[1:] = prices[1:] / prices[:-1] - 1
+    change = np.diff(position, prepend=0.0)
+    held = np.concatenate([[0.0], position[:-1]])
+    equity = np.cumprod((1 + held * returns) * (1 - fee * np.abs(change)))
+
+    # Round trips: from the close before each entry to its exit, an open trade marked at the last close.
+    entries = np.flatnonzero(change > 0)
+    exits = np.concatenate([np.flatnonzero(change < 0), [len(prices) - 1]])[:len(entries)]
+    trade_returns = equity[exits] / equity[entries - 1] - 1
+
+    drawdown = equity / np.maximum.accumulate(equity) - 1
+    return {
+        'bars': len(prices),
+        'pnl_pct': float((equity[-1] - 1) * 100),
+        'buy_and_hold_pct': float((prices[-1] / prices[0] - 1) * 100),
+        'trades': len(entries),
+        'hit_rate_pct': float((trade_returns > 0).mean() * 100) if len(entries) else None,
+        'max_drawdown_pct': float(drawdown.min() * 100),
+        'exposure_pct': float(position.mean() * 100),
+        'equity': pd.Series(equity, index=close.index),
+    }
+
+
+def backtest(signals, since=None, resolution='1min', fee=None):
+    """Backtests `signals` on closes resampled to `resolution` since `since`."""
+    close = load_price_frame(since=since, resample=resolution)['close']
+    if len(close) < 2:
+        return None
+    return simulate(close, signals, fee=fee)
@@ -0,0 +1,121 @@
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from . import analytics, notifications, wallets
+from .models import BankAccount, LedgerEntry, RialTransaction, RialWallet, UserVerification
+from .verification import refresh_statuses
+
+NOT_FOUND = 'Not found.'
+
+
+def chunk_size():
+    return getattr(settings, 'BULK_ACTION_CHUNK_SIZE', 200)
+
+
+def _chunks(ids):
+    size = chunk_size()
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def settle(pending, new_status, credit_type=None, entry_type=None, notice=None, notes=None):
+    """
+    Moves the locked, pending rial transactions `pending` to `new_status` with
+    one bulk_update, crediting those of `credit_type` with one statement per
+    wallet table plus their `entry_type` ledger entries and `notice`
+    notifications. Returns the ids left pending because a wallet was missing.
+    """
+    credited = [tx for tx in pending if tx.transaction_type == credit_type]
+    balances = dict(RialWallet.objects.select_for_update().filter(
+        user_id__in={tx.user_id for tx in credited},
+    ).order_by('user_id').values_list('user_id', 'balance'))
+
+    settled, missing, deltas, entries, notices = [], set(), defaultdict(int), [], []
+    for tx in pending:
+        if tx.transaction_type == credit_type:
+            if tx.user_id not in balances:
+                missing.add(tx.pk)
+                continue
+            balances[tx.user_id] += tx.amount
+            deltas[tx.user_id] += tx.amount
+            entries.append(LedgerEntry(
+                user_id=tx.user_id, currency=wallets.RIAL, amount=tx.amount, balance_after=balances[tx.user_id],
+                entry_type=entry_type, rial_transaction=tx,
+            ))
+            notices.append(notifications.build(tx.user_id, notice, amount=tx.amount))
+        tx.status = new_status
+        if notes is not None:
+            tx.notes = notes
+        settled.append(tx)
+
+    RialTransaction.objects.bulk_update(settled, ['status', 'notes'])
+    transaction.on_commit(lambda: analytics.invalidate([tx.timestamp for tx in settled]))
+    wallets.add_balances(RialWallet, deltas)
+    LedgerEntry.objects.bulk_create(entries)
+    notifications.notify_many(notices)
+    return missing
+
+
+def settle_rial_transactions(ids, approve):
+    """
+    Approves (or rejects) the pending rial transactions `ids` in chunks of
+    BULK_ACTION_CHUNK_SIZE, one database transaction each, settle()-ing the
+    locked transactions: approving credits deposits and rejecting refunds
+    withdrawals. Returns {id: result}, where a result is the new status or an
+    'error' message.
+    """
+    new_status = 'COMPLETED' if approve else 'FAILED'
+    credit = {
+        'credit_type': 'DEPOSIT', 'entry_type': LedgerEntry.EntryType.DEPOSIT, 'notice': 'deposit_approved',
+    } if approve else {
+        'credit_type': 'WITHDRAWAL', 'entry_type': LedgerEntry.EntryType.REFUND, 'notice': 'withdrawal_rejected',
+    }
+    results = {}
+    for chunk in _chunks(ids):
+        with transaction.atomic():
+            found = list(RialTransaction.objects.select_for_update().filter(pk__in=chunk).order_by('pk'))
+            pending = [tx for tx in found if tx.status == 'PENDING']
+            missing = settle(pending, new_status, **credit)
+            settled = {tx.pk for tx in pending} - missing
+            for tx in found:
+                if tx.pk in missing:
+                    results[tx.pk] = {'error': 'Wallet not found.'}
+                elif tx.pk not in settled:
+                    results[tx.pk] = {'error': 'This transaction is not pending.'}
+                else:
+                    results[tx.pk] = {'status': new_status}
+    return {pk: results.get(pk, {'error': NOT_FOUND}) for pk in ids}
+
+
+def review_verifications(ids, status, admin_notes):
+    """Sets the status and notes of the pending verifications `ids`, chunk by chunk like settle_rial_transactions()."""
+    notice = 'verification_verified' if status == UserVerification.Status.VERIFIED else 'verification_rejected'
+    results = {}
+    for chunk in _chunks(ids):
+        with transaction.atomic():
+            found = list(UserVerification.objects.select_for_update().filter(pk__in=chunk).order_by('pk'))
+            reviewed = []
+            for verification in found:
+                if verification.status != UserVerification.Status.PENDING:
+                    results[verification.pk] = {'error': 'This verification is not pending.'}
+                    continue
+                verification.status, verification.admin_notes = status, admin_notes
+                reviewed.append(verification)
+                results[verification.pk] = {'status': status}
+            UserVerification.objects.bulk_update(reviewed, ['status', 'admin_notes'])
+            notifications.notify_many([
+                notifications.build(verification.user_id, notice, notes=admin_notes) for verification in reviewed
+            ])
+            refresh_statuses({verification.user_id for verification in reviewed})
+    return {pk: results.get(pk, {'error': NOT_FOUND}) for pk in ids}
+
+
+def set_bank_account_status(ids, status):
+    """Sets the status of the bank accounts `ids` with one UPDATE per chunk."""
+    results = {}
+    for chunk in _chunks(ids):
+        with transaction.atomic():
+            found = list(BankAccount.objects.filter(pk__in=chunk).values_list('pk', flat=True))
+            BankAccount.objects.filter(pk__in=found).update(status=status)
+            results.update({pk: {'status': status} for pk in found})
+    return {pk: results.get(pk, {'error': NOT_FOUND}) for pk in ids}
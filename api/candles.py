@@ -0,0 +1,137 @@
+from datetime import timedelta
+from django.db import transaction
+from django.utils import timezone
+from .models import Price, PriceCandle
+
+RESOLUTION_SECONDS = {
+    PriceCandle.Resolution.MINUTE: 60,
+    PriceCandle.Resolution.FIVE_MINUTES: 5 * 60,
+    PriceCandle.Resolution.HOUR: 60 * 60,
+    PriceCandle.Resolution.DAY: 24 * 60 * 60,
+}
+
+CHART_WINDOWS = {
+    'daily': timedelta(days=1),
+    'weekly': timedelta(days=7),
+    'monthly': timedelta(days=30),
+}
+
+DAY_SECONDS = RESOLUTION_SECONDS[PriceCandle.Resolution.DAY]
+
+
+def bucket_start(timestamp, seconds):
+    """Floors a timestamp to its bucket, aligned to local (TIME_ZONE) midnight."""
+    offset = int(timezone.localtime(timestamp).utcoffset().total_seconds())
+    epoch = int(timestamp.timestamp()) + offset
+    return timestamp - timedelta(seconds=epoch % seconds, microseconds=timestamp.microsecond)
+
+
+def _opening(price, timestamp):
+    return {'open': price, 'high': price, 'low': price, 'close': price, 'count': 1, 'opened_at': timestamp, 'closed_at': timestamp}
+
+
+def _new_candle(resolution, start, price, timestamp):
+    return PriceCandle(resolution=resolution, bucket_start=start, **_opening(price, timestamp))
+
+
+def _merge(candle, price, timestamp):
+    candle.high = max(candle.high, price)
+    candle.low = min(candle.low, price)
+    candle.count += 1
+    if timestamp < candle.opened_at:
+        candle.open, candle.opened_at = price, timestamp
+    if timestamp >= candle.closed_at:
+        candle.close, candle.closed_at = price, timestamp
+
+
+def ingest(price):
+    """
+    Folds a single new Price row into every rollup resolution. When two ticks
+    open the same bucket at once, get_or_create() lets the second one's insert
+    fail inside a savepoint and then locks and merges into the first one's row.
+    """
+    with transaction.atomic():
+        for resolution, seconds in RESOLUTION_SECONDS.items():
+            candle, created = PriceCandle.objects.select_for_update().get_or_create(
+                resolution=resolution, bucket_start=bucket_start(price.timestamp, seconds),
+                defaults=_opening(price.price, price.timestamp),
+            )
+            if not created:
+                _merge(candle, price.price, price.timestamp)
+                candle.save(update_fields=['open', 'high', 'low', 'close', 'count', 'opened_at', 'closed_at'])
+
+
+def rebuild(start=None, end=None, batch_size=1000):
+    """
+    Recomputes candles from the raw Price table. The range is widened to whole
+    days so that no partially covered bucket is left behind, and never starts
+    before the oldest raw tick so candles of compacted history are kept. Returns
+    the number of candles written.
+    """
+    oldest = Price.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+    if oldest is None:
+        return 0
+    start = bucket_start(max(start, oldest) if start is not None else oldest, DAY_SECONDS)
+    prices = Price.objects.filter(timestamp__gte=start).order_by('timestamp')
+    candles = PriceCandle.objects.filter(bucket_start__gte=start)
+    if end is not None:
+        end = bucket_start(end, DAY_SECONDS) + timedelta(days=1)
+        prices = prices.filter(timestamp__lt=end)
+        candles = candles.filter(bucket_start__lt=end)
+
+    written = 0
+    with transaction.atomic():
+        candles.delete()
+        current = {}
+        pending = []
+        for timestamp, price in prices.values_list('timestamp', 'price').iterator(chunk_size=5000):
+            for resolution, seconds in RESOLUTION_SECONDS.items():
+                bucket = bucket_start(timestamp, seconds)
+                candle = current.get(resolution)
+                if candle is not None and candle.bucket_start == bucket:
+                    _merge(candle, price, timestamp)
+                    continue
+                if candle is not None:
+                    pending.append(candle)
+                current[resolution] = _new_candle(resolution, bucket, price, timestamp)
+            if len(pending) >= batch_size:
+                PriceCandle.objects.bulk_create(pending)
+                written += len(pending)
+                pending = []
+        pending.extend(current.values())
+        PriceCandle.objects.bulk_create(pending)
+        written += len(pending)
+    return written
+
+
+def chart_series(timeframe, points):
+    """
+    Returns at most `points` candles covering the chart window, read from the
+    coarsest rollup that still has at least `points` buckets in the window.
+    Extra candles are merged into runs of consecutive ones, so no high or low
+    is dropped.
+    """
+    window = CHART_WINDOWS.get(timeframe, CHART_WINDOWS['daily'])
+    target_seconds = window.total_seconds() / points
+    resolution, seconds = PriceCandle.Resolution.MINUTE, RESOLUTION_SECONDS[PriceCandle.Resolution.MINUTE]
+    for candidate, candidate_seconds in RESOLUTION_SECONDS.items():
+        if candidate_seconds <= target_seconds:
+            resolution, seconds = candidate, candidate_seconds
+
+    start = bucket_start(timezone.now() - window, seconds)
+    candles = list(PriceCandle.objects.filter(resolution=resolution, bucket_start__gte=start).order_by('bucket_start'))
+
+    if len(candles) > points:
+        bounds = [len(candles) * i // points for i in range(points + 1)]
+        candles = [_combine(candles[first:last]) for first, last in zip(bounds, bounds[1:])]
+    return candles
+
+
+def _combine(run):
+    """One candle spanning a run of consecutive candles."""
+    first, last = run[0], run[-1]
+    return PriceCandle(
+        resolution=first.resolution, bucket_start=first.bucket_start,
+        open=first.open, high=max(candle.high for candle in run), low=min(candle.low for candle in run), close=last.close,
+        count=sum(candle.count for candle in run), opened_at=first.opened_at, closed_at=last.closed_at,
+    )
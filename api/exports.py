@@ -0,0 +1,101 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import GoldTransaction, RialTransaction
+
+FORMATS = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+FIELDS = {
+    GoldTransaction: ['id', 'user_id', 'timestamp', 'transaction_type', 'status', 'quantity', 'price_per_unit', 'total_price', 'fees', 'net_amount', 'notes'],
+    RialTransaction: ['id', 'user_id', 'timestamp', 'transaction_type', 'status', 'amount', 'bank_account_id', 'bank_transaction_id', 'notes'],
+}
+CHUNK_BYTES = 64 * 1024
+
+
+class ExportError(Exception):
+    pass
+
+
+class _Line:
+    """A write-only file for csv.writer that hands back each formatted row."""
+    def write(self, value):
+        return value
+
+
+def parse_bound(value, end=False, tz=None):
+    """
+    A datetime from an ISO date or datetime string; a bare date means the
+    start of that day, or with `end` the start of the next one. Naive values
+    are in `tz`, by default the current time zone. Raises ExportError.
+    """
+    if not value:
+        return None
+    try:
+        day = parse_date(value)
+        when = datetime.combine(day, time.min) + timedelta(days=1 if end else 0) if day else parse_datetime(value)
+    except ValueError:
+        when = None
+    if when is None:
+        raise ExportError(f"Invalid date: {value}")
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when, tz)
+    return when
+
+
+def export_rows(model, user=None, start=None, end=None):
+    """
+    The rows of `model`'s transactions, optionally of one user, with
+    start <= timestamp < end, read through a server-side cursor so only one
+    fetch of EXPORT_CHUNK_SIZE rows is held in memory at a time.
+    """
+    queryset = model.objects.all()
+    if user is not None:
+        queryset = queryset.filter(user=user).order_by('timestamp', 'id')
+    else:
+        queryset = queryset.order_by('id')
+    if start:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end:
+        queryset = queryset.filter(timestamp__lt=end)
+    return queryset.values_list(*FIELDS[model]).iterator(chunk_size=getattr(settings, 'EXPORT_CHUNK_SIZE', 2000))
+
+
+def _value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def stream(model, rows, output='csv'):
+    """Encodes `rows` as CSV (with a header) or NDJSON, yielding bytes in chunks of about CHUNK_BYTES."""
+    fields = FIELDS[model]
+    if output == 'csv':
+        writer = csv.writer(_Line())
+        encode = lambda row: writer.writerow([_value(value) for value in row])
+        lines = [writer.writerow(fields)]
+    else:
+        encode = lambda row: json.dumps(dict(zip(fields, map(_value, row))), ensure_ascii=False) + '\n'
+        lines = []
+    size = 0
+    for row in rows:
+        line = encode(row)
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield ''.join(lines).encode()
+            lines, size = [], 0
+    if lines:
+        yield ''.join(lines).encode()
+
+
+async def astream(chunks):
+    """
+    Serves a synchronous chunk iterator to an async server one chunk at a
+    time; StreamingHttpResponse would otherwise read it all into memory first.
+    The database work stays on the one thread that owns the connection.
+    """
+    chunks = iter(chunks)
+    next_chunk = sync_to_async(next, thread_sensitive=True)
+    while (chunk := await next_chunk(chunks, None)) is not None:
+        yield chunk
@@ -1,7 +1,7 @@
 from django_filters import rest_framework as filters
 from .models import (
     GoldTransaction, Ticket, RialTransaction,
-    
+    UserVerification, BankAccount,
 )
 
 class GoldTransactionFilter(filters.FilterSet):
@@ -19,3 +19,13 @@ class RialTransactionFilter(filters.FilterSet):
         model = RialTransaction
         fields = ['user', 'status', 'transaction_type']
 
+
+class UserVerificationFilter(filters.FilterSet):
+    class Meta:
+        model = UserVerification
+        fields = ['user']
+
+class BankAccountFilter(filters.FilterSet):
+    class Meta:
+        model = BankAccount
+        fields = ['user', 'status', 'bank_name']
@@ -0,0 +1,330 @@
+import math
+from collections import deque, namedtuple
+import numpy as np
+import pandas as pd
+from .models import TechnicalAnalysis
+
+MA_PERIODS = [10, 20, 30, 50, 100, 200]
+RSI_PERIOD = 14
+STOCH_PERIOD = 14
+
+# Older closes contribute less than this fraction to an EMA, so the batch pass
+# only needs this many trailing candles per timeframe.
+EMA_TOLERANCE = 1e-12
+EMA_HORIZON = math.ceil(math.log(EMA_TOLERANCE) / math.log(1 - 2 / (max(MA_PERIODS) + 1)))
+
+Timeframe = namedtuple('Timeframe', ['label', 'rule', 'min_candles'])
+
+# Registry of analysed timeframes: stored label -> pandas resample rule of its candles.
+TIMEFRAMES = {
+    timeframe.label: timeframe for timeframe in [
+        Timeframe('15m', '15min', 50),
+        Timeframe('1h', 'h', 50),
+        Timeframe('4h', '4h', 50),
+        Timeframe('1D', 'D', 50),
+        Timeframe('1W', 'W-MON', 20),
+        Timeframe('1M', 'MS', 14),
+    ]
+}
+
+TIMEFRAME_ALIASES = {
+    '15m': '15m', '1h': '1h', 'hourly': '1h', '4h': '4h',
+    '1d': '1D', 'daily': '1D', '1w': '1W', '7d': '1W', 'weekly': '1W',
+    '1mo': '1M', 'monthly': '1M',
+}
+
+
+def resolve_timeframe(value):
+    """Maps user input such as 'weekly' or '1w' to a registry label, or None."""
+    if value in TIMEFRAMES:
+        return value
+    return TIMEFRAME_ALIASES.get(value.lower())
+
+
+def get_final_signal(buy, sell, neutral):
+    """Helper function to determine the final signal from counts."""
+    if buy > sell * 2: return TechnicalAnalysis.Signal.STRONG_BUY
+    if sell > buy * 2: return TechnicalAnalysis.Signal.STRONG_SELL
+    if buy > sell: return TechnicalAnalysis.Signal.BUY
+    if sell > buy: return TechnicalAnalysis.Signal.SELL
+    return TechnicalAnalysis.Signal.NEUTRAL
+
+
+def _is_nan(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def indicator_series(price_df):
+    """The pandas reference implementation: every indicator as a series over the candle history."""
+    close = price_df['close']
+    series = {'sma': {}, 'ema': {}}
+    for period in MA_PERIODS:
+        series['sma'][period] = close.rolling(window=period).mean()
+        series['ema'][period] = close.ewm(span=period, adjust=False).mean()
+
+    delta = close.diff(); gain = (delta.where(delta > 0, 0)).rolling(window=RSI_PERIOD).mean(); loss = (-delta.where(delta < 0, 0)).rolling(window=RSI_PERIOD).mean(); rsi = 100 - (100 / (1 + (gain/loss)))
+    low14 = price_df['low'].rolling(STOCH_PERIOD).min(); high14 = price_df['high'].rolling(STOCH_PERIOD).max(); k_percent = 100 * ((close - low14) / (high14 - low14))
+    series['rsi'] = rsi
+    series['k'] = k_percent
+    return series
+
+
+def reference_values(price_df):
+    """Keeps only the last value of each indicator from `indicator_series`."""
+    series = indicator_series(price_df)
+    values = {'close': float(price_df['close'].iloc[-1]), 'count': len(price_df), 'sma': {}, 'ema': {}}
+    for period in MA_PERIODS:
+        if len(price_df) < period: continue
+        values['sma'][period] = float(series['sma'][period].iloc[-1])
+        values['ema'][period] = float(series['ema'][period].iloc[-1])
+    values['rsi'] = float(series['rsi'].iloc[-1])
+    values['k'] = float(series['k'].iloc[-1])
+    return values
+
+
+def signal_history(price_df):
+    """
+    The summary signal `evaluate` would give after every candle of the history,
+    computed with array operations instead of one evaluation per candle.
+    """
+    series = indicator_series(price_df)
+    close = price_df['close'].to_numpy()
+    count = np.arange(1, len(close) + 1)
+    buy = np.zeros(len(close), dtype=int)
+    sell = np.zeros(len(close), dtype=int)
+    for period in MA_PERIODS:
+        for average in (series['sma'][period], series['ema'][period]):
+            above = close > average.to_numpy()
+            buy += (count >= period) & above
+            sell += (count >= period) & ~above
+
+    rsi, k_percent = series['rsi'].to_numpy(), series['k'].to_numpy()
+    buy += (rsi < 30).astype(int) + (k_percent < 20)
+    sell += (rsi > 70).astype(int) + (k_percent > 80)
+
+    Signal = TechnicalAnalysis.Signal
+    signals = np.select(
+        [buy > sell * 2, sell > buy * 2, buy > sell, sell > buy],
+        [Signal.STRONG_BUY, Signal.STRONG_SELL, Signal.BUY, Signal.SELL],
+        Signal.NEUTRAL,
+    )
+    return pd.Series(signals, index=price_df.index)
+
+
+def _right_aligned(columns, width):
+    """Stacks 1-D arrays into a (rows, width) matrix, right-aligned and NaN-padded."""
+    matrix = np.full((len(columns), width), np.nan)
+    for row, column in enumerate(columns):
+        tail = np.asarray(column, dtype=float)[-width:]
+        if len(tail):
+            matrix[row, width - len(tail):] = tail
+    return matrix
+
+
+def batch_values(candle_frames):
+    """
+    Computes the last value of every indicator for many candle histories at once
+    (one per timeframe), as a handful of vectorized operations over 2-D arrays of
+    shape (timeframes, candles). Returns {label: values} like `reference_values`.
+    """
+    labels = list(candle_frames)
+    counts = np.array([len(candle_frames[label]) for label in labels])
+    width = max(1, min(int(counts.max(initial=0)), EMA_HORIZON))
+    close = _right_aligned([candle_frames[label]['close'].to_numpy() for label in labels], width)
+    high = _right_aligned([candle_frames[label]['high'].to_numpy() for label in labels], width)
+    low = _right_aligned([candle_frames[label]['low'].to_numpy() for label in labels], width)
+    filled = np.nan_to_num(close)
+    periods = np.array(MA_PERIODS)
+    columns = np.arange(width)
+
+    # SMA: differences of a cumulative sum, for every period in one indexing step.
+    cumulative = np.concatenate([np.zeros((len(labels), 1)), np.cumsum(filled, axis=1)], axis=1)
+    usable = np.minimum(periods, width)
+    sma = (cumulative[:, [width]] - cumulative[:, width - usable]) / periods
+
+    # EMA (adjust=False): a weighted sum of the closes; the first close of a short
+    # history carries the seed weight (1 - alpha) ** age instead of alpha * (1 - alpha) ** age.
+    alpha = (2 / (periods + 1))[:, None, None]
+    age = (width - 1 - columns)[None, None, :]
+    first = (width - np.minimum(counts, width))[None, :, None]
+    seeded = (counts <= width)[None, :, None]
+    decay = (1 - alpha) ** age
+    weights = np.where(columns > first, alpha * decay, np.where((columns == first) & seeded, decay, np.where(columns == first, alpha * decay, 0.0)))
+    ema = (weights * filled[None, :, :]).sum(axis=2).T
+
+    # RSI: the first delta of every history counts as zero, like the reference.
+    delta = np.nan_to_num(np.diff(close, axis=1, prepend=np.nan))[:, -RSI_PERIOD:]
+    gain, loss = np.clip(delta, 0, None).sum(axis=1), np.clip(-delta, 0, None).sum(axis=1)
+    window_low = np.fmin.reduce(low[:, -STOCH_PERIOD:], axis=1)
+    window_high = np.fmax.reduce(high[:, -STOCH_PERIOD:], axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rsi = np.where(loss == 0, np.where(gain > 0, 100.0, np.nan), 100 - 100 / (1 + gain / loss))
+        k_percent = np.where(window_high == window_low, np.nan, 100 * (close[:, -1] - window_low) / (window_high - window_low))
+
+    results = {}
+    for row, label in enumerate(labels):
+        count = int(counts[row])
+        if not count:
+            continue
+        results[label] = {
+            'close': float(close[row, -1]), 'count': count,
+            'sma': {int(period): float(sma[row, i]) for i, period in enumerate(periods) if count >= period},
+            'ema': {int(period): float(ema[row, i]) for i, period in enumerate(periods) if count >= period},
+            'rsi': float(rsi[row]) if count >= RSI_PERIOD else math.nan,
+            'k': float(k_percent[row]) if count >= STOCH_PERIOD else math.nan,
+        }
+    return results
+
+
+def evaluate(values):
+    """Turns indicator values into the MA/oscillator/summary vote counts and signals."""
+    last_price = values['close']
+
+    ma_signals = {'buy': 0, 'sell': 0, 'neutral': 0}
+    for period in MA_PERIODS:
+        if period not in values['sma']: continue
+        ma_signals['buy' if last_price > values['sma'][period] else 'sell'] += 1
+        ma_signals['buy' if last_price > values['ema'][period] else 'sell'] += 1
+
+    osc_signals = {'buy': 0, 'sell': 0, 'neutral': 0}
+    rsi, k_percent = values['rsi'], values['k']
+    if not _is_nan(rsi) and rsi > 70: osc_signals['sell'] += 1
+    elif not _is_nan(rsi) and rsi < 30: osc_signals['buy'] += 1
+    else: osc_signals['neutral'] += 1
+    if not _is_nan(k_percent) and k_percent > 80: osc_signals['sell'] += 1
+    elif not _is_nan(k_percent) and k_percent < 20: osc_signals['buy'] += 1
+    else: osc_signals['neutral'] += 1
+
+    summary = {key: ma_signals[key] + osc_signals[key] for key in ('buy', 'sell', 'neutral')}
+    return {
+        'ma': ma_signals, 'osc': osc_signals, 'summary': summary,
+        'ma_signal': get_final_signal(ma_signals['buy'], ma_signals['sell'], ma_signals['neutral']),
+        'osc_signal': get_final_signal(osc_signals['buy'], osc_signals['sell'], osc_signals['neutral']),
+        'summary_signal': get_final_signal(summary['buy'], summary['sell'], summary['neutral']),
+    }
+
+
+def save_analysis(timeframe, signals):
+    TechnicalAnalysis.objects.update_or_create(
+        timeframe=timeframe,
+        defaults={
+            'ma_signal': signals['ma_signal'], 'osc_signal': signals['osc_signal'], 'summary_signal': signals['summary_signal'],
+            'ma_buy_count': signals['ma']['buy'], 'ma_sell_count': signals['ma']['sell'], 'ma_neutral_count': signals['ma']['neutral'],
+            'osc_buy_count': signals['osc']['buy'], 'osc_sell_count': signals['osc']['sell'], 'osc_neutral_count': signals['osc']['neutral'],
+            'summary_buy_count': signals['summary']['buy'], 'summary_sell_count': signals['summary']['sell'], 'summary_neutral_count': signals['summary']['neutral'],
+        }
+    )
+
+
+class IndicatorEngine:
+    """
+    Maintains SMA/EMA (10..200), RSI(14) and stochastic %K(14) over a stream of
+    closed candles in O(1) per candle, matching `reference_values` on the same
+    candle history. The state is a plain dict so it can be persisted as JSON.
+    """
+    def __init__(self, state=None):
+        state = state or {}
+        self.count = state.get('count', 0)
+        self.last_bucket = state.get('last_bucket')
+        self.first_tick = state.get('first_tick')
+        self.closes = deque(state.get('closes', []), maxlen=max(MA_PERIODS))
+        self.sums = {period: 0.0 for period in MA_PERIODS}
+        self.sums.update({int(period): value for period, value in state.get('sums', {}).items()})
+        self.emas = {int(period): value for period, value in state.get('emas', {}).items()}
+        self.prev_close = state.get('prev_close')
+        self.gains = deque(state.get('gains', []), maxlen=RSI_PERIOD)
+        self.losses = deque(state.get('losses', []), maxlen=RSI_PERIOD)
+        self.max_window = deque(tuple(item) for item in state.get('max_window', []))
+        self.min_window = deque(tuple(item) for item in state.get('min_window', []))
+
+    def to_state(self):
+        return {
+            'count': self.count, 'last_bucket': self.last_bucket, 'first_tick': self.first_tick,
+            'closes': list(self.closes), 'sums': self.sums, 'emas': self.emas,
+            'prev_close': self.prev_close, 'gains': list(self.gains), 'losses': list(self.losses),
+            'max_window': [list(item) for item in self.max_window],
+            'min_window': [list(item) for item in self.min_window],
+        }
+
+    def update(self, close, high, low, bucket=None):
+        """Commits one closed candle."""
+        close, high, low = float(close), float(high), float(low)
+        for period in MA_PERIODS:
+            self.sums[period] += close
+            if len(self.closes) >= period:
+                self.sums[period] -= self.closes[-period]
+        self.closes.append(close)
+
+        for period in MA_PERIODS:
+            previous = self.emas.get(period)
+            alpha = 2 / (period + 1)
+            self.emas[period] = close if previous is None else alpha * close + (1 - alpha) * previous
+
+        delta = 0.0 if self.prev_close is None else close - self.prev_close
+        self.gains.append(max(delta, 0.0))
+        self.losses.append(max(-delta, 0.0))
+        self.prev_close = close
+
+        index = self.count
+        while self.max_window and self.max_window[-1][1] <= high: self.max_window.pop()
+        self.max_window.append((index, high))
+        while self.max_window[0][0] <= index - STOCH_PERIOD: self.max_window.popleft()
+        while self.min_window and self.min_window[-1][1] >= low: self.min_window.pop()
+        self.min_window.append((index, low))
+        while self.min_window[0][0] <= index - STOCH_PERIOD: self.min_window.popleft()
+
+        self.count += 1
+        if bucket is not None:
+            self.last_bucket = bucket
+
+    def values(self, close=None, high=None, low=None):
+        """
+        Indicator values after the committed candles, or, when a candle is given,
+        as if that still-open candle were appended (without committing it).
+        """
+        if close is None:
+            return self._committed_values()
+        close, high, low = float(close), float(high), float(low)
+        count = self.count + 1
+        values = {'close': close, 'count': count, 'sma': {}, 'ema': {}}
+        for period in MA_PERIODS:
+            if count < period: continue
+            dropped = self.closes[-period] if len(self.closes) >= period else 0.0
+            values['sma'][period] = (self.sums[period] + close - dropped) / period
+            alpha = 2 / (period + 1)
+            values['ema'][period] = alpha * close + (1 - alpha) * self.emas[period]
+
+        delta = 0.0 if self.prev_close is None else close - self.prev_close
+        gains = list(self.gains)[-(RSI_PERIOD - 1):] + [max(delta, 0.0)]
+        losses = list(self.losses)[-(RSI_PERIOD - 1):] + [max(-delta, 0.0)]
+        values['rsi'] = self._rsi(gains, losses) if count >= RSI_PERIOD else math.nan
+
+        first = count - STOCH_PERIOD
+        window_high = max([value for index, value in self.max_window if index >= first] + [high])
+        window_low = min([value for index, value in self.min_window if index >= first] + [low])
+        values['k'] = self._k_percent(close, window_low, window_high) if count >= STOCH_PERIOD else math.nan
+        return values
+
+    def _committed_values(self):
+        close = self.closes[-1]
+        values = {'close': close, 'count': self.count, 'sma': {}, 'ema': {}}
+        for period in MA_PERIODS:
+            if self.count < period: continue
+            values['sma'][period] = self.sums[period] / period
+            values['ema'][period] = self.emas[period]
+        values['rsi'] = self._rsi(self.gains, self.losses) if self.count >= RSI_PERIOD else math.nan
+        values['k'] = self._k_percent(close, self.min_window[0][1], self.max_window[0][1]) if self.count >= STOCH_PERIOD else math.nan
+        return values
+
+    @staticmethod
+    def _rsi(gains, losses):
+        gain, loss = sum(gains), sum(losses)
+        if loss == 0:
+            return 100.0 if gain > 0 else math.nan
+        return 100 - (100 / (1 + gain / loss))
+
+    @staticmethod
+    def _k_percent(close, low, high):
+        if high == low:
+            return math.nan
+        return 100 * ((close - low) / (high - low))
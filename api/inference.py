@@ -0,0 +1,183 @@
+import threading
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from django.conf import settings
+from django.utils import timezone
+from .candles import RESOLUTION_SECONDS
+from .metrics import counters
+from .models import PriceCandle, PricePrediction
+from .price_cache import price_snapshot
+from .training import FEATURE_RULE, SIGNAL_MAP, WARMUP_BARS, compute_features, load_features
+
+
+def _load_bundle(prediction):
+    """Loads a model bundle memory-mapped when the storage has local paths."""
+    try:
+        path = prediction.model_file.path
+    except NotImplementedError:
+        with prediction.model_file.open('rb') as handle:
+            bundle = joblib.load(handle)
+    else:
+        bundle = joblib.load(path, mmap_mode='r')
+    return bundle if isinstance(bundle, dict) and 'model' in bundle else None
+
+
+def _forest_proba(model, features):
+    """
+    RandomForestClassifier.predict_proba for a handful of rows without its
+    per-call thread pool, which dominates the latency of single-row scoring.
+    """
+    X = np.asarray(features, dtype=np.float32)
+    return sum(tree.predict_proba(X, check_input=False) for tree in model.estimators_) / len(model.estimators_)
+
+
+def _hourly_resolution(when):
+    """The coarsest candle resolution whose buckets start on UTC hour boundaries around `when`."""
+    offset = int(timezone.localtime(when).utcoffset().total_seconds())
+    return max(
+        (resolution for resolution, seconds in RESOLUTION_SECONDS.items() if 3600 % seconds == 0 and offset % seconds == 0),
+        key=RESOLUTION_SECONDS.get,
+    )
+
+
+class ModelRegistry:
+    """
+    Per-worker cache of trained models and of their latest predictions.
+
+    Each horizon's bundle is loaded once and reloaded only when its
+    PricePrediction.trained_at changes, which is checked at most every
+    ML_MODEL_CHECK_INTERVAL seconds. Predictions are cached per latest price, so
+    only the first request after a new price computes features and scores.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._models = {}
+        self._checked_at = {}
+        self._history = None
+        self._predictions = {}
+
+    @property
+    def check_interval(self):
+        return getattr(settings, 'ML_MODEL_CHECK_INTERVAL', 30)
+
+    def get_model(self, horizon):
+        """Returns (prediction row, bundle) for a horizon, or (None, None) if it was never trained."""
+        now = time.monotonic()
+        with self._lock:
+            loaded = self._models.get(horizon)
+            if loaded is not None and now - self._checked_at.get(horizon, 0) < self.check_interval:
+                return loaded
+
+        prediction = PricePrediction.objects.filter(horizon=horizon).first()
+        if prediction is None:
+            return None, None
+        if loaded is not None and loaded[0].trained_at == prediction.trained_at:
+            with self._lock:
+                self._checked_at[horizon] = now
+            return loaded
+
+        counters.incr('inference.model_load')
+        try:
+            bundle = _load_bundle(prediction) if prediction.model_file else None
+        except Exception:
+            bundle = None
+        with self._lock:
+            self._models[horizon] = (prediction, bundle)
+            self._checked_at[horizon] = now
+        return prediction, bundle
+
+    def _closed_closes(self, bar_start):
+        """
+        Closes of the closed bars before `bar_start`, fetched once per bar from
+        the coarsest candle rollup whose buckets nest in UTC hours: the 1h
+        candles when the local time zone is a whole number of hours from UTC,
+        otherwise finer ones (5m for Asia/Tehran), resampled to hourly bars.
+        """
+        with self._lock:
+            if self._history is not None and self._history[0] == bar_start:
+                return self._history[1]
+        counters.incr('inference.history_load')
+        since = bar_start - to_offset(FEATURE_RULE) * WARMUP_BARS
+        rows = PriceCandle.objects.filter(
+            resolution=_hourly_resolution(bar_start), bucket_start__gte=since, bucket_start__lt=bar_start,
+        ).order_by('bucket_start').values_list('bucket_start', 'close')
+        starts, values = zip(*rows) if rows else ((), ())
+        closes = pd.Series(values, index=pd.DatetimeIndex(pd.to_datetime(starts, utc=True), name='timestamp'), dtype=float)
+        closes = closes.resample(FEATURE_RULE).last().dropna().rename('close')
+        with self._lock:
+            self._history = (bar_start, closes)
+        return closes
+
+    def latest_features(self, price):
+        """Features for the still-open bar, with the latest price as its close."""
+        bar_start = pd.Timestamp(price.timestamp).tz_convert('UTC').floor(FEATURE_RULE)
+        closes = self._closed_closes(bar_start)
+        close = pd.concat([closes, pd.Series([float(price.price)], index=pd.DatetimeIndex([bar_start], name='timestamp'))])
+        return compute_features(close).iloc[[-1]]
+
+    def predict(self, horizon):
+        """
+        Returns a dict with a fresh signal and confidence for the latest price,
+        or None when no usable model or price is available.
+        """
+        prediction, bundle = self.get_model(horizon)
+        price = price_snapshot.get()
+        if bundle is None or price is None:
+            return None
+
+        key = (horizon, prediction.trained_at, price.pk, price.timestamp)
+        with self._lock:
+            cached = self._predictions.get(horizon)
+            if cached is not None and cached[0] == key:
+                counters.incr('inference.hit')
+                return cached[1]
+
+        counters.incr('inference.miss')
+        features = self.latest_features(price)[bundle['features']]
+        if features.isna().any(axis=None):
+            return None
+        model = bundle['model']
+        proba = _forest_proba(model, features)[0]
+        result = {
+            'signal': SIGNAL_MAP[int(model.classes_[proba.argmax()])],
+            'confidence': float(proba.max() * 100),
+            'price': price.price,
+            'as_of': price.timestamp,
+        }
+        with self._lock:
+            self._predictions[horizon] = (key, result)
+        return result
+
+
+def score_window(horizon, start=None, end=None):
+    """
+    Batch mode: scores every hourly bar between `start` and `end` with the
+    horizon's current model in one call. Returns a DataFrame indexed by bar start
+    with close, signal and confidence columns.
+    """
+    prediction, bundle = model_registry.get_model(horizon)
+    if bundle is None:
+        return None
+    close, features = load_features()
+    features = features[bundle['features']].dropna()
+    if start is not None:
+        features = features[features.index >= start]
+    if end is not None:
+        features = features[features.index <= end]
+    if features.empty:
+        return pd.DataFrame(columns=['close', 'signal', 'confidence'])
+
+    model = bundle['model']
+    proba = model.predict_proba(features)
+    classes = model.classes_[proba.argmax(axis=1)]
+    return pd.DataFrame({
+        'close': close.loc[features.index],
+        'signal': [SIGNAL_MAP[int(value)] for value in classes],
+        'confidence': proba.max(axis=1) * 100,
+    }, index=features.index)
+
+
+model_registry = ModelRegistry()
@@ -1,12 +1,18 @@
-import random
 from datetime import timedelta
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from api.models import Price
+from api.price_cache import price_snapshot
+from api import candles
+from api.price_frame import random_walk
 
 class Command(BaseCommand):
     help = 'Backfills historical price data, leading up to the earliest existing record.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=200, help='Days of history to generate before the earliest record.')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed, for reproducible benchmark data.')
+
     def handle(self, *args, **kwargs):
         oldest_record = Price.objects.order_by('timestamp').first()
 
@@ -16,23 +22,16 @@ class Command(BaseCommand):
 
         self.stdout.write("Starting to backfill historical price data...")
 
-        price_history = []
         end_timestamp = oldest_record.timestamp
-        current_price = float(oldest_record.price)
-
-        num_days_to_generate = 200
-        start_timestamp = end_timestamp - timedelta(days=num_days_to_generate)
-        
-        current_timestamp = start_timestamp
-        while current_timestamp < end_timestamp:
-            price_history.append(
-                Price(timestamp=current_timestamp, price=int(current_price))
-            )
-            change = random.uniform(-0.0001, 0.0001)
-            current_price = current_price * (1 + change)
-            current_timestamp += timedelta(minutes=2)
+        start_timestamp = end_timestamp - timedelta(days=kwargs['days'])
+        price_history = [
+            Price(timestamp=timestamp, price=price)
+            for timestamp, price in random_walk(start_timestamp, end_timestamp, float(oldest_record.price), seed=kwargs['seed'])
+        ]
 
         Price.objects.bulk_create(price_history)
+        price_snapshot.invalidate()
+        candles.rebuild(start=start_timestamp, end=end_timestamp)
 
         self.stdout.write(self.style.SUCCESS(
             f"Successfully created {len(price_history)} historical price records."
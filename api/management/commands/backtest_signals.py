@@ -0,0 +1,38 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api import backtest
+from api.indicators import TIMEFRAMES
+from api.models import PricePrediction
+
+
+class Command(BaseCommand):
+    help = 'Backtests the technical analysis and model signals over the stored price history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--timeframes', nargs='*', default=list(TIMEFRAMES), help='Technical analysis timeframes to test.')
+        parser.add_argument('--horizons', nargs='*', default=[horizon.lower() for horizon in PricePrediction.Horizon.values],
+                            help='Prediction model horizons to test.')
+        parser.add_argument('--days', type=int, default=200, help='Length of the replayed window ending now.')
+        parser.add_argument('--resolution', default='1min', help='Pandas offset alias of the simulated price steps.')
+        parser.add_argument('--fee-rate', type=float, default=None, help='Fee per trade as a fraction (default: BACKTEST_FEE_RATE).')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        sources = [(f"TA {label}", lambda label=label: backtest.technical_signals(label)) for label in options['timeframes'] if label in TIMEFRAMES]
+        sources += [(f"ML {horizon.upper()}", lambda horizon=horizon: backtest.prediction_signals(horizon.upper())) for horizon in options['horizons']]
+
+        self.stdout.write(f"{'source':<12} | {'bars':>8} | {'trades':>6} | {'PnL %':>8} | {'hold %':>8} | {'hit %':>6} | {'max DD %':>8} | {'secs':>5}")
+        for name, load_signals in sources:
+            started = time.perf_counter()
+            signals = load_signals()
+            result = backtest.backtest(signals, since=since, resolution=options['resolution'], fee=options['fee_rate']) if signals is not None else None
+            if result is None:
+                self.stdout.write(self.style.WARNING(f"{name:<12} | no signals or prices available"))
+                continue
+            hit_rate = '-' if result['hit_rate_pct'] is None else f"{result['hit_rate_pct']:.1f}"
+            self.stdout.write(
+                f"{name:<12} | {result['bars']:>8} | {result['trades']:>6} | {result['pnl_pct']:>8.2f} | {result['buy_and_hold_pct']:>8.2f} | "
+                f"{hit_rate:>6} | {result['max_drawdown_pct']:>8.2f} | {time.perf_counter() - started:>5.2f}"
+            )
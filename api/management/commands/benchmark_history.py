@@ -0,0 +1,87 @@
+import time
+from urllib.parse import parse_qs, urlsplit
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.test import APIRequestFactory, force_authenticate
+from api.models import GoldTransaction, User
+from api.views import GoldTransactionHistoryViewSet
+from .benchmark_prices import percentile
+
+USERNAME = 'bench-history'
+
+
+class OffsetHistoryViewSet(GoldTransactionHistoryViewSet):
+    pagination_class = LimitOffsetPagination
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks gold history page latency by page depth for a user with many transactions, cursor versus offset pagination.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=100_000)
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--depths', type=int, nargs='+', default=[1, 10, 100, 1000], help='Page numbers to time.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per page.')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark user and its transactions.')
+
+    def handle(self, *args, **options):
+        user = self._create_history(options['transactions'])
+        try:
+            size = options['page_size']
+            self.stdout.write(f"{'page':>6} | {'cursor p50/p95 ms':>18} | {'offset p50/p95 ms':>18}")
+            cursors = self._cursors(user, size, max(options['depths']))
+            for depth in options['depths']:
+                if depth > len(cursors):
+                    break
+                cursor = self._time(GoldTransactionHistoryViewSet, user, {'page_size': size, 'cursor': cursors[depth - 1]}, options['repeat'])
+                offset = self._time(OffsetHistoryViewSet, user, {'limit': size, 'offset': (depth - 1) * size}, options['repeat'])
+                self.stdout.write(f"{depth:>6} | " + " | ".join(
+                    f"{percentile(samples, 0.5):8.2f}/{percentile(samples, 0.95):<8.2f}".rjust(18) for samples in (cursor, offset)
+                ))
+        finally:
+            if not options['keep']:
+                User.objects.filter(username=USERNAME).delete()
+
+    def _create_history(self, count):
+        user = User.objects.filter(username=USERNAME).first()
+        if user is None:
+            user = User.objects.create(username=USERNAME, national_id='BENCH-HISTORY', phone_number='00000000000')
+        missing = count - GoldTransaction.objects.filter(user=user).count()
+        if missing > 0:
+            self.stdout.write(f"Creating {missing} transactions for {USERNAME}...")
+            GoldTransaction.objects.bulk_create((
+                GoldTransaction(user=user, transaction_type='BUY', quantity=100, price_per_unit=65_000_000, total_price=6_500_000, net_amount=6_500_000, status='COMPLETED')
+                for _ in range(missing)
+            ), batch_size=5000)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'ANALYZE "{GoldTransaction._meta.db_table}"')
+        return user
+
+    def _request(self, viewset, user, params):
+        request = APIRequestFactory().get('/', params, HTTP_HOST='localhost')
+        force_authenticate(request, user=user)
+        response = viewset.as_view({'get': 'list'})(request)
+        response.render()
+        return response
+
+    def _cursors(self, user, size, pages):
+        """The cursor of each page up to `pages`, found by following the next links."""
+        cursors, cursor = [None], None
+        while len(cursors) < pages:
+            data = self._request(GoldTransactionHistoryViewSet, user, {'page_size': size, **({'cursor': cursor} if cursor else {})}).data
+            if not data['next']:
+                break
+            cursor = parse_qs(urlsplit(data['next']).query)['cursor'][0]
+            cursors.append(cursor)
+        return cursors
+
+    def _time(self, viewset, user, params, repeat):
+        params = {key: value for key, value in params.items() if value is not None}
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            self._request(viewset, user, params)
+            samples.append((time.perf_counter() - started) * 1000)
+        return samples
@@ -0,0 +1,97 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from api import price_storage
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks latest-price and chart query latency on synthetic price tables of 1M, 10M and 100M rows.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000, 100_000_000])
+        parser.add_argument('--interval-seconds', type=int, default=1, help='Spacing between synthetic ticks.')
+        parser.add_argument('--repeat', type=int, default=50, help='Timed runs per query.')
+        parser.add_argument('--partitioned', action='store_true', help='Use monthly partitions with the B-tree/BRIN index policy.')
+        parser.add_argument('--keep', action='store_true', help='Keep the scratch tables after the run.')
+
+    def handle(self, *args, **options):
+        if not price_storage.is_postgres():
+            raise CommandError('The price storage benchmark requires PostgreSQL.')
+
+        self.stdout.write(f"{'rows':>12} | {'latest p50/p95 ms':>18} | {'chart raw p50/p95 ms':>21} | {'chart candles p50/p95 ms':>25}")
+        for rows in options['rows']:
+            table, candle_table = f"bench_price_{rows}", f"bench_candle_{rows}"
+            try:
+                self.stdout.write(f"Generating {rows} rows into {table}...")
+                self._create_tables(table, candle_table, rows, options['interval_seconds'], options['partitioned'])
+                results = [self._time(query, options['repeat']) for query in self._queries(table, candle_table)]
+                self.stdout.write(f"{rows:>12} | " + " | ".join(
+                    f"{percentile(samples, 0.5):8.2f}/{percentile(samples, 0.95):<8.2f}".rjust(width)
+                    for samples, width in zip(results, (18, 21, 25))
+                ))
+            finally:
+                if not options['keep']:
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'DROP TABLE IF EXISTS "{table}", "{candle_table}"')
+
+    def _create_tables(self, table, candle_table, rows, interval_seconds, partitioned):
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS "{table}", "{candle_table}"')
+            if partitioned:
+                cursor.execute(f'CREATE TABLE "{table}" ("id" bigint NOT NULL, "price" bigint NOT NULL, "timestamp" timestamptz NOT NULL, PRIMARY KEY ("id", "timestamp")) PARTITION BY RANGE ("timestamp")')
+                month = price_storage.month_start(now - timedelta(seconds=rows * interval_seconds))
+                while month <= now:
+                    price_storage.create_partition(cursor, month, table=table)
+                    month = price_storage.add_months(month, 1)
+            else:
+                cursor.execute(f'CREATE TABLE "{table}" ("id" bigint PRIMARY KEY, "price" bigint NOT NULL, "timestamp" timestamptz NOT NULL)')
+
+            cursor.execute(
+                f'INSERT INTO "{table}" SELECT g, 100000000 + (random() * 1000000)::bigint, %s - make_interval(secs => g * %s) '
+                f'FROM generate_series(1, %s) AS g', [now, interval_seconds, rows]
+            )
+
+            if partitioned:
+                price_storage.apply_index_policy(table=table)
+            else:
+                cursor.execute(f'CREATE INDEX ON "{table}" ("timestamp")')
+
+            cursor.execute(
+                f'CREATE TABLE "{candle_table}" AS '
+                f"SELECT '1m'::varchar(3) AS resolution, date_trunc('minute', \"timestamp\") AS bucket_start, "
+                f'MIN(price) AS low, MAX(price) AS high, MAX(price) AS close, COUNT(*) AS count FROM "{table}" GROUP BY 2 '
+                f"UNION ALL SELECT '1h', date_trunc('hour', \"timestamp\"), MIN(price), MAX(price), MAX(price), COUNT(*) FROM \"{table}\" GROUP BY 2"
+            )
+            cursor.execute(f'CREATE UNIQUE INDEX ON "{candle_table}" ("resolution", "bucket_start")')
+            cursor.execute(f'ANALYZE "{table}"')
+            cursor.execute(f'ANALYZE "{candle_table}"')
+
+    def _queries(self, table, candle_table):
+        window_start = timezone.now() - timedelta(days=30)
+        return [
+            [(f'SELECT "price", "timestamp" FROM "{table}" ORDER BY "timestamp" DESC LIMIT 1', [])],
+            [
+                (f'SELECT COUNT(*) FROM "{table}" WHERE "timestamp" >= %s', [window_start]),
+                (f'SELECT "id" FROM "{table}" WHERE "timestamp" >= %s ORDER BY "timestamp"', [window_start]),
+            ],
+            [(f'SELECT "bucket_start", "close" FROM "{candle_table}" WHERE "resolution" = %s AND "bucket_start" >= %s ORDER BY "bucket_start"', ['1h', window_start])],
+        ]
+
+    def _time(self, statements, repeat):
+        samples = []
+        with connection.cursor() as cursor:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                for sql, params in statements:
+                    cursor.execute(sql, params)
+                    cursor.fetchall()
+                samples.append((time.perf_counter() - started) * 1000)
+        return samples
@@ -0,0 +1,121 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, transaction
+from django.db.models import Sum
+from api import wallets
+from api.models import GoldTransaction, GoldWallet, Price, RialWallet, User
+from api.price_cache import price_snapshot
+from api.trade_engine import BUY, SELL, TradeRejected, execute_trade, trade_engine
+from .benchmark_prices import percentile
+
+PREFIX = 'bench-trader-'
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks gold trade throughput and latency with per-request execution versus the batching trade engine.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--traders', type=int, nargs='+', default=[100, 1000, 10000])
+        parser.add_argument('--trades-per-trader', type=int, default=1)
+        parser.add_argument('--connections', type=int, default=32, help='Database connections (request workers) for per-request execution.')
+        parser.add_argument('--quantity', type=int, default=100, help='Milligrams per trade.')
+        parser.add_argument('--mode', choices=['direct', 'batched', 'both'], default='both')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        price = price_snapshot.get() or Price.objects.create(price=65_000_000)
+        modes = ['direct', 'batched'] if options['mode'] == 'both' else [options['mode']]
+        rng = random.Random(options['seed'])
+
+        self.stdout.write(f"{'traders':>8} | {'mode':>8} | {'trades/s':>9} | {'p50 ms':>8} | {'p99 ms':>8} | {'rejected':>8}")
+        for traders in options['traders']:
+            try:
+                users = self._create_traders(traders)
+                for mode in modes:
+                    self._fund(users, options['quantity'] * options['trades_per_trader'], price)
+                    orders = [(user, rng.choice([BUY, SELL])) for user in users for _ in range(options['trades_per_trader'])]
+                    rng.shuffle(orders)
+                    gold_before, rial_before = self._totals(users)
+                    elapsed, latencies, rejected = getattr(self, f'_run_{mode}')(orders, options['quantity'], price, options['connections'])
+                    self._check(users, gold_before, rial_before)
+                    self.stdout.write(
+                        f"{traders:>8} | {mode:>8} | {len(orders) / elapsed:>9.0f} | "
+                        f"{percentile(latencies, 0.5):>8.1f} | {percentile(latencies, 0.99):>8.1f} | {rejected:>8}"
+                    )
+            finally:
+                User.objects.filter(username__startswith=PREFIX).delete()
+
+    def _create_traders(self, count):
+        User.objects.filter(username__startswith=PREFIX).delete()
+        users = User.objects.bulk_create([
+            User(username=f'{PREFIX}{i}', national_id=f'B{i:010d}', phone_number=f'B{i:010d}')
+            for i in range(count)
+        ])
+        GoldWallet.objects.bulk_create([GoldWallet(user=user) for user in users])
+        RialWallet.objects.bulk_create([RialWallet(user=user) for user in users])
+        return users
+
+    def _fund(self, users, gold_balance, price):
+        """Gives every trader enough gold and rials for all of its trades, so no mode inherits another's balances."""
+        rial_balance = gold_balance * price.price  # 1000x the gold's value
+        ids = [user.pk for user in users]
+        gold = dict(GoldWallet.objects.filter(user_id__in=ids).values_list('user_id', 'balance'))
+        rial = dict(RialWallet.objects.filter(user_id__in=ids).values_list('user_id', 'balance'))
+        with transaction.atomic():
+            for user_id in ids:
+                wallets.adjust(user_id, gold=gold_balance - gold[user_id], rial=rial_balance - rial[user_id])
+
+    def _totals(self, users):
+        ids = [user.pk for user in users]
+        gold = GoldWallet.objects.filter(user_id__in=ids).aggregate(total=Sum('balance'))['total']
+        rial = RialWallet.objects.filter(user_id__in=ids).aggregate(total=Sum('balance'))['total']
+        return gold, rial
+
+    def _check(self, users, gold_before, rial_before):
+        """The wallets must move by exactly the amounts recorded on the new transactions."""
+        gold_after, rial_after = self._totals(users)
+        transactions = GoldTransaction.objects.filter(user__in=users)
+        bought = transactions.filter(transaction_type=BUY).aggregate(gold=Sum('quantity'), rial=Sum('net_amount'))
+        sold = transactions.filter(transaction_type=SELL).aggregate(gold=Sum('quantity'), rial=Sum('net_amount'))
+        gold_moved = (bought['gold'] or 0) - (sold['gold'] or 0)
+        rial_moved = (sold['rial'] or 0) - (bought['rial'] or 0)
+        if gold_after - gold_before != gold_moved or rial_after - rial_before != rial_moved:
+            raise AssertionError('Wallet balances do not match the recorded transactions.')
+        transactions.delete()
+
+    def _run_direct(self, orders, quantity, price, connections):
+        def trade(user, trade_type, submitted):
+            try:
+                execute_trade(user, trade_type, quantity, price)
+                return time.perf_counter() - submitted, False
+            except TradeRejected:
+                return time.perf_counter() - submitted, True
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            started = time.perf_counter()  # every trader submits at once
+            futures = [executor.submit(trade, user, trade_type, started) for user, trade_type in orders]
+            wait(futures)
+            elapsed = time.perf_counter() - started
+        results = [future.result() for future in futures]
+        return elapsed, [latency * 1000 for latency, _ in results], sum(rejected for _, rejected in results)
+
+    def _run_batched(self, orders, quantity, price, connections):
+        latencies, rejected = [], 0
+        started = time.perf_counter()
+        futures = []
+        for user, trade_type in orders:
+            future = trade_engine.submit(user.pk, trade_type, quantity)
+            future.add_done_callback(lambda _: latencies.append((time.perf_counter() - started) * 1000))
+            futures.append(future)
+        wait(futures)
+        elapsed = time.perf_counter() - started
+        for future in futures:
+            if isinstance(future.exception(), TradeRejected):
+                rejected += 1
+            elif future.exception() is not None:
+                raise future.exception()
+        return elapsed, latencies, rejected
@@ -0,0 +1,114 @@
+import hashlib
+import hmac
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.db.models import Sum
+from django.test import Client
+from django.urls import reverse
+from api import wallets
+from api.models import RialTransaction, RialWallet, User, WebhookEvent
+from .benchmark_prices import percentile
+
+PREFIX = 'bench-payer-'
+
+
+class FakeGateway:
+    """Delivers signed callbacks to the webhook in-process, the way a gateway retrying and batching aggressively would."""
+
+    def __init__(self, secret):
+        self.secret = secret.encode()
+        self.url = reverse('api:payment-webhook')
+
+    def post(self, payload):
+        body = json.dumps(payload).encode()
+        signature = hmac.new(self.secret, body, hashlib.sha256).hexdigest()
+        response = Client(HTTP_HOST='localhost').post(self.url, body, content_type='application/json', HTTP_X_PAYMENT_SIGNATURE=signature)
+        if response.status_code != 200:
+            raise CommandError(f"The webhook answered {response.status_code}: {response.content[:200]}")
+        return response.json()
+
+
+class Command(BaseCommand):
+    help = 'Load-tests the payment webhook with a fake gateway: one callback per request versus batches, each delivered several times concurrently.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Few users with many deposits make the wallets contended.')
+        parser.add_argument('--deposits-per-user', type=int, default=100)
+        parser.add_argument('--batch', type=int, nargs='+', default=[1, 50, 500], help='Callbacks per request; 1 is the single-callback mode.')
+        parser.add_argument('--deliveries', type=int, default=3, help='Times the gateway sends every callback.')
+        parser.add_argument('--connections', type=int, default=16)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        secret = getattr(settings, 'PAYMENT_WEBHOOK_SECRET', None)
+        if not secret:
+            raise CommandError('PAYMENT_WEBHOOK_SECRET is not configured.')
+        gateway, rng = FakeGateway(secret), random.Random(options['seed'])
+
+        self.stdout.write(f"{'batch':>6} | {'callbacks':>9} | {'requests':>8} | {'events/s':>9} | {'p50 ms':>8} | {'p99 ms':>8} | {'duplicates':>10}")
+        try:
+            users = self._create_payers(options['users'])
+            for size in options['batch']:
+                deposits = RialTransaction.objects.bulk_create([
+                    RialTransaction(user=user, transaction_type='DEPOSIT', amount=rng.randint(1, 1000) * 1000)
+                    for user in users for _ in range(options['deposits_per_user'])
+                ])
+                events = [{'transaction_id': tx.pk, 'status': 'completed', 'event_id': f'bench-{tx.pk}'} for tx in deposits]
+                requests = [events[start:start + size] for start in range(0, len(events), size)] * options['deliveries']
+                rng.shuffle(requests)
+                before = self._balance(users)
+                elapsed, latencies, results = self._deliver(gateway, requests, options['connections'])
+                self._check(users, deposits, before, results)
+                self.stdout.write(
+                    f"{size:>6} | {len(events) * options['deliveries']:>9} | {len(requests):>8} | {len(events) * options['deliveries'] / elapsed:>9.0f} | "
+                    f"{percentile(latencies, 0.5):>8.1f} | {percentile(latencies, 0.99):>8.1f} | {results.count('duplicate'):>10}"
+                )
+        finally:
+            WebhookEvent.objects.filter(key__startswith='bench-').delete()
+            User.objects.filter(username__startswith=PREFIX).delete()
+
+    def _create_payers(self, count):
+        User.objects.filter(username__startswith=PREFIX).delete()
+        users = User.objects.bulk_create([
+            User(username=f'{PREFIX}{i}', national_id=f'P{i:010d}', phone_number=f'P{i:010d}')
+            for i in range(count)
+        ])
+        RialWallet.objects.bulk_create([RialWallet(user=user) for user in users])
+        return users
+
+    def _balance(self, users):
+        return RialWallet.objects.filter(user__in=users).aggregate(total=Sum('balance'))['total']
+
+    def _deliver(self, gateway, requests, connections):
+        def send(events):
+            started = time.perf_counter()
+            try:
+                payload = events[0] if len(events) == 1 else {'events': events}
+                response = gateway.post(payload)
+                results = [row['result'] for row in response['results']] if 'results' in response else [
+                    'duplicate' if response['status'] == 'duplicate' else 'COMPLETED'
+                ]
+                return (time.perf_counter() - started) * 1000, results
+            finally:
+                close_old_connections()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=connections) as executor:
+            responses = list(executor.map(send, requests))
+        elapsed = time.perf_counter() - started
+        return elapsed, [latency for latency, _ in responses], [result for _, results in responses for result in results]
+
+    def _check(self, users, deposits, before, results):
+        """Every deposit must be credited exactly once, and the ledger must account for every wallet."""
+        credited = sum(tx.amount for tx in deposits)
+        if results.count('COMPLETED') != len(deposits) or self._balance(users) - before != credited:
+            raise AssertionError('A callback was applied more or fewer times than once.')
+        if RialTransaction.objects.filter(pk__in=[tx.pk for tx in deposits]).exclude(status='COMPLETED').exists():
+            raise AssertionError('A deposit was left pending.')
+        if wallets.reconcile(users[0].pk, users[-1].pk):
+            raise AssertionError('The wallets do not match the ledger.')
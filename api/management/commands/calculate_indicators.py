@@ -1,74 +1,106 @@
 import pandas as pd
+from datetime import timedelta
 from django.core.management.base import BaseCommand
-from api.models import Price, TechnicalAnalysis
+from django.utils import timezone
+from pandas.tseries.frequencies import to_offset
+from api.models import Price, IndicatorState
+from api.indicators import (
+    TIMEFRAMES, IndicatorEngine, batch_values, evaluate,
+    save_analysis,
+)
+from api.price_frame import load_price_frame, to_micros
 
-def get_final_signal(buy, sell, neutral):
-    """Helper function to determine the final signal from counts."""
-    if buy > sell * 2: return TechnicalAnalysis.Signal.STRONG_BUY
-    if sell > buy * 2: return TechnicalAnalysis.Signal.STRONG_SELL
-    if buy > sell: return TechnicalAnalysis.Signal.BUY
-    if sell > buy: return TechnicalAnalysis.Signal.SELL
-    return TechnicalAnalysis.Signal.NEUTRAL
+def _not_enough(timeframe, available):
+    return f"Not enough resampled data for {timeframe.label} analysis (need {timeframe.min_candles} points, have {available})."
 
-def calculate_and_save_analysis(timeframe, price_df):
-    """Calculates all indicators for a given DataFrame and saves the result."""
-    if len(price_df) < 50:
-        return None, f"Not enough resampled data for {timeframe} analysis (need 50 points, have {len(price_df)})."
+def calculate_all():
+    """
+    Recomputes every registered timeframe from the full history in one
+    vectorized pass over all of their candle series.
+    """
+    frames = {}
+    for timeframe in TIMEFRAMES.values():
+        candles = load_price_frame(resample=timeframe.rule)
+        candles['high'] = candles['close']; candles['low'] = candles['close']
+        frames[timeframe.label] = candles
 
-    last_price = price_df['close'].iloc[-1]
+    results = {}
+    values = batch_values({label: candles for label, candles in frames.items() if len(candles) >= TIMEFRAMES[label].min_candles})
+    for timeframe in TIMEFRAMES.values():
+        if timeframe.label not in values:
+            results[timeframe.label] = (None, _not_enough(timeframe, len(frames[timeframe.label])))
+            continue
+        signals = evaluate(values[timeframe.label])
+        save_analysis(timeframe.label, signals)
+        results[timeframe.label] = (signals['summary_signal'], None)
+    return results
 
-    ma_signals = {'buy': 0, 'sell': 0, 'neutral': 0}
-    for period in [10, 20, 30, 50, 100, 200]:
-        if len(price_df) < period: continue
-        ma_signals['buy' if last_price > price_df['close'].rolling(window=period).mean().iloc[-1] else 'sell'] += 1
-        ma_signals['buy' if last_price > price_df['close'].ewm(span=period, adjust=False).mean().iloc[-1] else 'sell'] += 1
+def update_and_save_analysis(timeframe, oldest_tick, now, rebuild=False):
+    """
+    Feeds only the candles closed since the last run into the persisted engine
+    state, evaluates the still-open candle on top of it and saves the result.
+    """
+    state_row, _ = IndicatorState.objects.get_or_create(timeframe=timeframe.label)
+    engine = IndicatorEngine(None if rebuild else state_row.state)
+    if engine.first_tick is not None and to_micros(oldest_tick) < engine.first_tick:
+        engine = IndicatorEngine() # Older history was backfilled; replay from the start.
 
-    osc_signals = {'buy': 0, 'sell': 0, 'neutral': 0}
-    delta = price_df['close'].diff(); gain = (delta.where(delta > 0, 0)).rolling(window=14).mean(); loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean(); rsi = 100 - (100 / (1 + (gain/loss)));
-    if rsi.iloc[-1] > 70: osc_signals['sell'] += 1
-    elif rsi.iloc[-1] < 30: osc_signals['buy'] += 1
-    else: osc_signals['neutral'] += 1
-    low14 = price_df['low'].rolling(14).min(); high14 = price_df['high'].rolling(14).max(); k_percent = 100 * ((price_df['close'] - low14) / (high14 - low14));
-    if k_percent.iloc[-1] > 80: osc_signals['sell'] += 1
-    elif k_percent.iloc[-1] < 20: osc_signals['buy'] += 1
-    else: osc_signals['neutral'] += 1
-    
-    ma_final_signal = get_final_signal(ma_signals['buy'], ma_signals['sell'], ma_signals['neutral'])
-    osc_final_signal = get_final_signal(osc_signals['buy'], osc_signals['sell'], osc_signals['neutral'])
-    summary_buy = ma_signals['buy'] + osc_signals['buy']; summary_sell = ma_signals['sell'] + osc_signals['sell']; summary_neutral = ma_signals['neutral'] + osc_signals['neutral']
-    summary_final_signal = get_final_signal(summary_buy, summary_sell, summary_neutral)
+    since = None
+    if engine.last_bucket is not None:
+        last_bucket = pd.Timestamp(engine.last_bucket)
+        since = last_bucket.to_pydatetime() - timedelta(microseconds=1)
 
-    TechnicalAnalysis.objects.update_or_create(
-        timeframe=timeframe,
-        defaults={
-            'ma_signal': ma_final_signal, 'osc_signal': osc_final_signal, 'summary_signal': summary_final_signal,
-            'ma_buy_count': ma_signals['buy'], 'ma_sell_count': ma_signals['sell'], 'ma_neutral_count': ma_signals['neutral'],
-            'osc_buy_count': osc_signals['buy'], 'osc_sell_count': osc_signals['sell'], 'osc_neutral_count': osc_signals['neutral'],
-            'summary_buy_count': summary_buy, 'summary_sell_count': summary_sell, 'summary_neutral_count': summary_neutral,
-        }
-    )
-    return summary_final_signal, None
+    candles = load_price_frame(since=since, resample=timeframe.rule)
+    if engine.last_bucket is not None:
+        candles = candles[candles.index > last_bucket]
+
+    offset = to_offset(timeframe.rule)
+    open_candle = None
+    for candle in candles.itertuples():
+        if candle.Index + offset <= now:
+            engine.update(candle.close, candle.close, candle.close, bucket=candle.Index.isoformat())
+        else:
+            open_candle = candle
+
+    engine.first_tick = to_micros(oldest_tick)
+    state_row.state = engine.to_state()
+    state_row.save()
+
+    available = engine.count + (open_candle is not None)
+    if available < timeframe.min_candles:
+        return None, _not_enough(timeframe, available)
+
+    if open_candle is not None:
+        values = engine.values(open_candle.close, open_candle.close, open_candle.close)
+    else:
+        values = engine.values()
+    signals = evaluate(values)
+    save_analysis(timeframe.label, signals)
+    return signals['summary_signal'], None
 
 class Command(BaseCommand):
     help = 'Calculates and saves technical analysis for multiple timeframes.'
 
-    def handle(self, *args, **kwargs):
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Discard the persisted indicator state and replay the full history.')
+        parser.add_argument('--full', action='store_true', help='Recompute every timeframe from the full history in one vectorized pass.')
+
+    def handle(self, *args, **options):
         self.stdout.write("Fetching price data...")
-        prices = Price.objects.all().order_by('timestamp').values('timestamp', 'price')
-        
-        if len(prices) < 200:
+        oldest_tick = Price.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+        if oldest_tick is None:
             self.stdout.write(self.style.WARNING("Not enough price data to run a full analysis."))
             return
 
-        df = pd.DataFrame(list(prices)); df['price'] = pd.to_numeric(df['price']); df['timestamp'] = pd.to_datetime(df['timestamp']); df.set_index('timestamp', inplace=True)
-        df['close'] = df['price']; df['high'] = df['price']; df['low'] = df['price']
-
-        daily_df = df.resample('H').last().dropna()
-        signal, error = calculate_and_save_analysis('1D', daily_df)
-        if error: self.stdout.write(self.style.WARNING(error))
-        else: self.stdout.write(self.style.SUCCESS(f"Daily analysis saved with signal: {signal}"))
+        now = timezone.now()
+        if options['full']:
+            results = calculate_all()
+        else:
+            results = {
+                timeframe.label: update_and_save_analysis(timeframe, oldest_tick, now, rebuild=options['rebuild'])
+                for timeframe in TIMEFRAMES.values()
+            }
 
-        weekly_df = df.resample('D').last().dropna()
-        signal, error = calculate_and_save_analysis('1W', weekly_df)
-        if error: self.stdout.write(self.style.WARNING(error))
-        else: self.stdout.write(self.style.SUCCESS(f"Weekly analysis saved with signal: {signal}"))
\ No newline at end of file
+        for timeframe, (signal, error) in results.items():
+            if error: self.stdout.write(self.style.WARNING(error))
+            else: self.stdout.write(self.style.SUCCESS(f"{timeframe} analysis saved with signal: {signal}"))
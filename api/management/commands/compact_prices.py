@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from api import price_storage
+
+
+class Command(BaseCommand):
+    help = 'Folds raw price ticks older than the retention window into candles and deletes them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, default=90, help='Days of raw ticks to keep.')
+
+    def handle(self, *args, **options):
+        if options['keep_days'] < 1:
+            raise CommandError('--keep-days must be at least 1.')
+
+        cutoff, dropped, deleted = price_storage.compact(options['keep_days'])
+        if dropped:
+            self.stdout.write(f"Dropped partitions: {', '.join(dropped)}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Compacted raw ticks older than {cutoff:%Y-%m-%d}: {deleted} rows deleted, {len(dropped)} partitions dropped."
+        ))
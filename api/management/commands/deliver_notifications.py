@@ -0,0 +1,41 @@
+import threading
+import time
+from django.core.management.base import BaseCommand
+from django.db import connection
+from api.notifications import deliver
+
+
+class Command(BaseCommand):
+    help = 'Sends queued notifications with a pool of worker threads, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Threads, each claiming its own batches.')
+        parser.add_argument('--batch', type=int, help='Notifications per claim (default NOTIFICATION_BATCH_SIZE).')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to wait when nothing is due.')
+        parser.add_argument('--once', action='store_true', help='Exit once nothing is due instead of polling.')
+
+    def handle(self, *args, **options):
+        totals, lock = [0], threading.Lock()
+
+        def work():
+            try:
+                while True:
+                    claimed = deliver(options['batch'])
+                    with lock:
+                        totals[0] += claimed
+                    if not claimed:
+                        if options['once']:
+                            return
+                        time.sleep(options['interval'])
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=work, daemon=True) for _ in range(options['workers'])]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Processed {totals[0]} notifications."))
@@ -0,0 +1,40 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from api import exports
+from api.models import GoldTransaction, RialTransaction, User
+
+MODELS = {'gold': GoldTransaction, 'rial': RialTransaction}
+
+
+class Command(BaseCommand):
+    help = 'Streams gold or rial transactions as CSV or NDJSON to a file or stdout in constant memory.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=MODELS)
+        parser.add_argument('--output', choices=exports.FORMATS, default='csv')
+        parser.add_argument('--user', help='Only this username\'s transactions (default: every user).')
+        parser.add_argument('--start', help='ISO date or datetime; only transactions at or after it.')
+        parser.add_argument('--end', help='ISO date or datetime; only transactions before it (a date includes that day).')
+        parser.add_argument('--file', help='Write here instead of stdout.')
+
+    def handle(self, *args, **options):
+        try:
+            start = exports.parse_bound(options['start'])
+            end = exports.parse_bound(options['end'], end=True)
+        except exports.ExportError as e:
+            raise CommandError(str(e))
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user named {options['user']}.")
+
+        model = MODELS[options['kind']]
+        chunks = exports.stream(model, exports.export_rows(model, user=user, start=start, end=end), options['output'])
+        if options['file']:
+            with open(options['file'], 'wb') as out:
+                out.writelines(chunks)
+        else:
+            out = sys.stdout.buffer
+            out.writelines(chunks)
+            out.flush()
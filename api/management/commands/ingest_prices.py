@@ -0,0 +1,51 @@
+import signal
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections
+from api.price_feed import Ingestor, ProviderError, get_provider
+
+
+class Command(BaseCommand):
+    help = 'Long-running daemon that polls the price provider and stores every changed quote.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=getattr(settings, 'PRICE_POLL_INTERVAL', 60), help='Seconds between polls.')
+        parser.add_argument('--provider', choices=['brsapi', 'fake'], default=None, help='Defaults to the PRICE_PROVIDER setting.')
+        parser.add_argument('--max-backoff', type=float, default=600, help='Longest wait after consecutive failures.')
+        parser.add_argument('--once', action='store_true', help='Poll a single time and exit.')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        ingestor = Ingestor(get_provider(options['provider']))
+        interval, failures = options['interval'], 0
+        try:
+            while self.running:
+                started = time.monotonic()
+                close_old_connections()
+                try:
+                    quotes, price = ingestor.ingest_once()
+                except (ProviderError, DatabaseError) as e:
+                    failures += 1
+                    self.stderr.write(self.style.ERROR(f"Poll failed ({failures} in a row): {e}"))
+                else:
+                    failures = 0
+                    gold = f", 18K gold {price.price} Rials" if price else ""
+                    self.stdout.write(f"Stored {len(quotes)} changed quotes{gold}.")
+                if options['once']:
+                    break
+                delay = min(interval * 2 ** failures, max(interval, options['max_backoff'])) if failures else interval
+                self._sleep(delay - (time.monotonic() - started))
+        finally:
+            ingestor.provider.close()
+
+    def _stop(self, signum, frame):
+        self.running = False
+
+    def _sleep(self, seconds):
+        deadline = time.monotonic() + max(0, seconds)
+        while self.running and time.monotonic() < deadline:
+            time.sleep(min(1, deadline - time.monotonic()))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+from api import price_storage
+
+
+class Command(BaseCommand):
+    help = 'Converts the Price table to monthly partitions and maintains partitions and their indexes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--convert', action='store_true', help='Convert the unpartitioned Price table first (takes an exclusive lock).')
+        parser.add_argument('--months-ahead', type=int, default=3, help='Future monthly partitions to keep ready.')
+        parser.add_argument('--btree-months', type=int, default=2, help='Partitions younger than this many months keep a B-tree index; older ones get BRIN.')
+
+    def handle(self, *args, **options):
+        if not price_storage.is_postgres():
+            raise CommandError('Partitioned price storage requires PostgreSQL.')
+
+        if not price_storage.is_partitioned():
+            if not options['convert']:
+                raise CommandError('The Price table is not partitioned yet. Re-run with --convert.')
+            self.stdout.write("Converting the Price table to monthly partitions...")
+            price_storage.convert_to_partitioned(months_ahead=options['months_ahead'])
+
+        created = price_storage.ensure_partitions(months_ahead=options['months_ahead'])
+        price_storage.apply_index_policy(btree_months=options['btree_months'])
+
+        partitions = price_storage.list_partitions()
+        self.stdout.write(self.style.SUCCESS(
+            f"Price table has {len(partitions)} monthly partitions ({len(created)} created in this run)."
+        ))
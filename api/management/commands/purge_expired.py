@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api import authentication, quotes
+
+
+class Command(BaseCommand):
+    help = 'Deletes single-use records that can no longer matter: the nonces of expired trade quotes and the revocations of expired tokens.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Deleted {quotes.purge()} redeemed quote nonces.")
+        self.stdout.write(f"Deleted {authentication.purge_revocations()} expired token revocations.")
@@ -0,0 +1,22 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api import candles
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the 1m/5m/1h/1d OHLC candle rollups from the raw Price table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Only rebuild the last N days (default: full history).')
+
+    def handle(self, *args, **options):
+        start = None
+        if options['days']:
+            start = timezone.now() - timedelta(days=options['days'])
+            self.stdout.write(f"Rebuilding candles since {start:%Y-%m-%d}...")
+        else:
+            self.stdout.write("Rebuilding candles for the full price history...")
+
+        written = candles.rebuild(start=start)
+        self.stdout.write(self.style.SUCCESS(f"Successfully rebuilt {written} candles."))
@@ -0,0 +1,41 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+from api.models import GoldWallet
+from api.wallets import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Verifies every wallet balance against the ledger from its latest checkpoint, in parallel chunks of users.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Users per chunk.')
+        parser.add_argument('--jobs', type=int, default=4, help='Chunks verified concurrently, each on its own connection.')
+        parser.add_argument('--checkpoint', action='store_true', help='Record a checkpoint for every wallet that matches.')
+
+    def handle(self, *args, **options):
+        bounds = GoldWallet.objects.aggregate(first=Min('user_id'), last=Max('user_id'))
+        if bounds['first'] is None:
+            self.stdout.write("No wallets to reconcile.")
+            return
+        size = options['chunk_size']
+        chunks = [(start, start + size - 1) for start in range(bounds['first'], bounds['last'] + 1, size)]
+
+        def run(chunk):
+            try:
+                return reconcile(*chunk, checkpoint=options['checkpoint'])
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['jobs']) as executor:
+            mismatches = [mismatch for result in executor.map(run, chunks) for mismatch in result]
+        elapsed = time.perf_counter() - started
+
+        for user_id, currency, balance, ledger_balance in mismatches:
+            self.stderr.write(f"User {user_id} {currency}: wallet {balance}, ledger {ledger_balance}")
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} wallet(s) do not match the ledger.")
+        self.stdout.write(self.style.SUCCESS(f"All wallets match the ledger ({len(chunks)} chunks in {elapsed:.1f}s)."))
@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand
+from api import reports
+
+
+class Command(BaseCommand):
+    help = 'Folds new trades and ledger entries into the reporting summaries; run it every minute or so.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Drop the summaries and fold everything again, e.g. after trades were edited.')
+        parser.add_argument('--settle', type=int, help='Seconds of the most recent rows to hold back (default REPORT_SETTLE_SECONDS).')
+        parser.add_argument('--batch', type=int, help='Ids folded per transaction (default REPORT_FOLD_BATCH).')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        refresh = reports.rebuild if options['rebuild'] else reports.refresh
+        folded = refresh(settle=options['settle'], batch=options['batch'])
+        self.stdout.write(self.style.SUCCESS(f"Folded {folded} trades in {time.perf_counter() - started:.1f}s."))
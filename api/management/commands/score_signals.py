@@ -0,0 +1,33 @@
+import sys
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from api.inference import score_window
+from api.models import PricePrediction
+
+
+class Command(BaseCommand):
+    help = 'Scores every hourly candle of a historical window with the trained model (batch inference for backtesting).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horizon', choices=[choice.lower() for choice in PricePrediction.Horizon.values], default='daily')
+        parser.add_argument('--days', type=int, default=30, help='Length of the window ending now.')
+        parser.add_argument('--output', help='Write the scored candles to this CSV file ("-" for stdout).')
+
+    def handle(self, *args, **options):
+        horizon = options['horizon'].upper()
+        scores = score_window(horizon, start=timezone.now() - timedelta(days=options['days']))
+        if scores is None:
+            raise CommandError(f"No trained model is available for {horizon}.")
+
+        if options['output'] == '-':
+            scores.to_csv(sys.stdout)
+            return
+        if options['output']:
+            scores.to_csv(options['output'])
+
+        counts = scores['signal'].value_counts()
+        self.stdout.write(self.style.SUCCESS(
+            f"Scored {len(scores)} candles for {horizon}: "
+            + ", ".join(f"{signal} {counts.get(signal, 0)}" for signal in PricePrediction.Signal.values)
+        ))
@@ -1,77 +1,51 @@
 # api/management/commands/train_prediction_model.py
-import pandas as pd
-import pandas_ta as ta
-import joblib
-import numpy as np
+import time
 from django.core.management.base import BaseCommand
-from django.core.files.base import ContentFile
-from sklearn.ensemble import RandomForestClassifier
-from api.models import Price, PricePrediction
-
-def train_and_save_model(horizon_name, X, y):
-    """
-    Helper function to train, predict, and save a model for a specific horizon.
-    """
-    model = RandomForestClassifier(n_estimators=100, random_state=42, class_weight='balanced')
-    model.fit(X, y)
-    
-    last_features = X.iloc[[-1]]
-    prediction_class = model.predict(last_features)[0]
-    prediction_proba = model.predict_proba(last_features)[0]
-
-    signal_map = {1: 'BUY', -1: 'SELL', 0: 'HOLD'}
-    final_signal = signal_map[prediction_class]
-    confidence = prediction_proba.max() * 100
-
-    model_file = ContentFile(joblib.dump(model, f'{horizon_name}_model.joblib')[0])
-    pred_obj, _ = PricePrediction.objects.update_or_create(
-        horizon=horizon_name,
-        defaults={
-            'signal': final_signal,
-            'confidence': confidence,
-            'model_accuracy': model.score(X, y)
-        }
-    )
-    pred_obj.model_file.save(f'{horizon_name}_model.joblib', model_file, save=True)
-    return f"{horizon_name} model saved. Signal: {final_signal} ({confidence:.2f}%)"
+from api.models import PricePrediction
+from api.price_frame import synthetic_price_frame
+from api.training import FEATURE_RULE, load_bundle, load_features, save_model, train_horizons
 
 class Command(BaseCommand):
     help = 'Trains classification models for daily and weekly signals.'
 
-    def handle(self, *args, **kwargs):
-        prices = Price.objects.all().order_by('timestamp').values('timestamp', 'price')
-        if len(prices) < 200:
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Ignore the feature cache and saved models and refit from scratch.')
+        parser.add_argument('--jobs', type=int, default=None, help='CPU cores to use (default: all).')
+        parser.add_argument('--splits', type=int, default=3, help='Walk-forward validation folds (0 disables validation).')
+        parser.add_argument('--validate', action='store_true', help='Also run walk-forward validation on incremental refits.')
+        parser.add_argument('--synthetic', type=int, metavar='DAYS', help='Benchmark on a synthetic random-walk history of DAYS days; nothing is saved.')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for --synthetic.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        synthetic = options['synthetic']
+        if synthetic:
+            candles = synthetic_price_frame(synthetic, seed=options['seed'], resample=FEATURE_RULE)
+            close, features = load_features(candles, use_cache=False)
+        else:
+            close, features = load_features(use_cache=not options['full'])
+        self.stdout.write(f"Features for {len(features)} candles ready in {time.perf_counter() - started:.2f}s.")
+
+        previous = {}
+        if not synthetic and not options['full']:
+            previous = {prediction.horizon: load_bundle(prediction) for prediction in PricePrediction.objects.all()}
+
+        results = train_horizons(
+            close, features, previous=previous, jobs=options['jobs'], splits=options['splits'],
+            validate=options['validate'],
+        )
+        if not results:
             self.stdout.write(self.style.WARNING("Not enough data."))
             return
 
-        df = pd.DataFrame(list(prices))
-        df.set_index(pd.to_datetime(df['timestamp']), inplace=True)
-        df.rename(columns={'price': 'close'}, inplace=True)
-
-        df.ta.sma(length=20, append=True)
-        df.ta.ema(length=50, append=True)
-        df.ta.rsi(length=14, append=True)
-        df.ta.macd(append=True)
-        
-        def get_target(change, threshold=0.01):
-            if change > threshold: return 1 # Buy
-            elif change < -threshold: return -1 # Sell
-            else: return 0 # Hold
-
-        df['price_change_1d'] = (df['close'].shift(-1) - df['close']) / df['close']
-        df['target_daily'] = df['price_change_1d'].apply(get_target)
-        
-        df['price_change_7d'] = (df['close'].shift(-7) - df['close']) / df['close']
-        df['target_weekly'] = df['price_change_7d'].apply(get_target)
-        
-        df.dropna(inplace=True)
-        features = [col for col in df.columns if col.startswith(('SMA', 'EMA', 'RSI', 'MACD'))]
-        X = df[features]
-
-        y_daily = df['target_daily']
-        daily_result = train_and_save_model(PricePrediction.Horizon.DAILY, X, y_daily)
-        self.stdout.write(self.style.SUCCESS(daily_result))
-
-        y_weekly = df['target_weekly']
-        weekly_result = train_and_save_model(PricePrediction.Horizon.WEEKLY, X, y_weekly)
-        self.stdout.write(self.style.SUCCESS(weekly_result))
\ No newline at end of file
+        for horizon, bundle, metrics in results:
+            accuracy = 'n/a' if metrics['accuracy'] is None else f"{metrics['accuracy']:.3f}"
+            summary = (
+                f"{horizon}: {metrics['mode']} fit of {metrics['trees']} trees on {metrics['rows']} rows "
+                f"in {metrics['fit_seconds']:.2f}s, walk-forward accuracy {accuracy}"
+            )
+            if not synthetic:
+                final_signal, confidence = save_model(horizon, bundle, features.iloc[[-1]], metrics['accuracy'])
+                summary += f". Signal: {final_signal} ({confidence:.2f}%)"
+            self.stdout.write(self.style.SUCCESS(summary))
+        self.stdout.write(f"Total time: {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,29 @@
+import threading
+from collections import defaultdict
+
+
+class Counters:
+    """
+    Thread-safe, per-process counters used to prove that the hot-path caches work.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = defaultdict(int)
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._values[name] += amount
+
+    def snapshot(self, prefix=None):
+        with self._lock:
+            return {
+                name: value for name, value in sorted(self._values.items())
+                if prefix is None or name.startswith(prefix)
+            }
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+counters = Counters()
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_priceprediction_confidence_priceprediction_signal'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PriceCandle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('1m', '1 Minute'), ('5m', '5 Minutes'), ('1h', '1 Hour'), ('1d', '1 Day')], max_length=3)),
+                ('bucket_start', models.DateTimeField()),
+                ('open', models.BigIntegerField()),
+                ('high', models.BigIntegerField()),
+                ('low', models.BigIntegerField()),
+                ('close', models.BigIntegerField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('opened_at', models.DateTimeField()),
+                ('closed_at', models.DateTimeField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('resolution', 'bucket_start'), name='unique_price_candle_bucket')],
+            },
+        ),
+    ]
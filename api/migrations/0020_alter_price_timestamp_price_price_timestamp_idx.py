@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 02:59
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0019_pricecandle'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='price',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='price',
+            index=models.Index(fields=['timestamp'], name='price_timestamp_idx'),
+        ),
+    ]
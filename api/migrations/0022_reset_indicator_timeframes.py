@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+def reset_indicator_timeframes(apps, schema_editor):
+    # '1D' and '1W' used to hold hourly and daily analyses; drop them and the
+    # engine state so the next run recomputes every timeframe from the registry.
+    apps.get_model('api', 'TechnicalAnalysis').objects.filter(timeframe__in=['1D', '1W']).delete()
+    apps.get_model('api', 'IndicatorState').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0021_indicatorstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(reset_indicator_timeframes, migrations.RunPython.noop),
+    ]
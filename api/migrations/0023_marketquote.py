@@ -0,0 +1,29 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:17
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0022_reset_indicator_timeframes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketQuote',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('symbol', models.CharField(max_length=32)),
+                ('category', models.CharField(choices=[('gold', 'Gold & Coins'), ('currency', 'Currency'), ('cryptocurrency', 'Cryptocurrency')], max_length=20)),
+                ('name', models.CharField(blank=True, max_length=100)),
+                ('price', models.DecimalField(decimal_places=8, max_digits=30)),
+                ('unit', models.CharField(default='IRR', max_length=10)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['symbol', '-timestamp'], name='market_quote_symbol_ts_idx')],
+            },
+        ),
+    ]
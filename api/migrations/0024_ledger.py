@@ -0,0 +1,59 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:29
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def open_ledger(apps, schema_editor):
+    # Every existing balance becomes the opening entry of its wallet's ledger.
+    LedgerEntry = apps.get_model('api', 'LedgerEntry')
+    for currency, model in (('GOLD', 'GoldWallet'), ('RIAL', 'RialWallet')):
+        wallets = apps.get_model('api', model).objects.exclude(balance=0).values_list('user_id', 'balance')
+        LedgerEntry.objects.bulk_create(
+            (LedgerEntry(user_id=user_id, currency=currency, amount=balance, balance_after=balance, entry_type='OPENING') for user_id, balance in wallets.iterator()),
+            batch_size=5000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_marketquote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('GOLD', 'Gold (mg)'), ('RIAL', 'Rial')], max_length=4)),
+                ('last_entry_id', models.BigIntegerField()),
+                ('balance', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_checkpoints', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'currency', 'last_entry_id'), name='unique_ledger_checkpoint')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('GOLD', 'Gold (mg)'), ('RIAL', 'Rial')], max_length=4)),
+                ('amount', models.BigIntegerField()),
+                ('balance_after', models.BigIntegerField()),
+                ('entry_type', models.CharField(choices=[('OPENING', 'Opening balance'), ('TRADE', 'Trade'), ('DEPOSIT', 'Deposit'), ('WITHDRAWAL', 'Withdrawal'), ('REFUND', 'Refund'), ('ADJUSTMENT', 'Adjustment')], max_length=10)),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('gold_transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='api.goldtransaction')),
+                ('rial_transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='api.rialtransaction')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'currency', 'timestamp'], name='ledger_user_currency_ts_idx')],
+            },
+        ),
+        migrations.RunPython(open_ledger, migrations.RunPython.noop),
+    ]
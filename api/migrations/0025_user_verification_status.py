@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:36
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_latest_status(apps, schema_editor):
+    User = apps.get_model('api', 'User')
+    UserVerification = apps.get_model('api', 'UserVerification')
+    latest = UserVerification.objects.filter(user=OuterRef('pk')).order_by('-id').values('status')[:1]
+    User.objects.filter(pk__in=UserVerification.objects.values('user_id')).update(verification_status=Subquery(latest))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0024_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='verification_status',
+            field=models.CharField(default='NOT_SUBMITTED', editable=False, max_length=20),
+        ),
+        migrations.RunPython(copy_latest_status, migrations.RunPython.noop),
+    ]
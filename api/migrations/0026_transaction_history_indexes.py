@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_user_verification_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='goldtransaction',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='gold_tx_user_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rialtransaction',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='rial_tx_user_ts_idx'),
+        ),
+    ]
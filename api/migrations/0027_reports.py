@@ -0,0 +1,61 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_transaction_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_transaction_id', models.BigIntegerField(default=0)),
+                ('last_ledger_entry_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReportSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('DAY', 'Day'), ('MONTH', 'Month'), ('YEAR', 'Year')], max_length=5)),
+                ('start', models.DateField()),
+                ('trades', models.BigIntegerField(default=0)),
+                ('gold_bought', models.BigIntegerField(default=0)),
+                ('gold_sold', models.BigIntegerField(default=0)),
+                ('buy_volume', models.BigIntegerField(default=0)),
+                ('sell_volume', models.BigIntegerField(default=0)),
+                ('fees', models.BigIntegerField(default=0)),
+                ('gold_net_flow', models.BigIntegerField(default=0)),
+                ('rial_net_flow', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('period', 'start'), name='unique_report_summary')],
+            },
+        ),
+        migrations.CreateModel(
+            name='UserTradeSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('DAY', 'Day'), ('MONTH', 'Month'), ('YEAR', 'Year')], max_length=5)),
+                ('start', models.DateField()),
+                ('trades', models.BigIntegerField(default=0)),
+                ('gold_bought', models.BigIntegerField(default=0)),
+                ('gold_sold', models.BigIntegerField(default=0)),
+                ('buy_volume', models.BigIntegerField(default=0)),
+                ('sell_volume', models.BigIntegerField(default=0)),
+                ('fees', models.BigIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trade_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('period', 'start', 'user'), name='unique_user_trade_summary')],
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 03:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0027_reports'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='goldtransaction',
+            index=models.Index(fields=['timestamp'], name='gold_tx_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='rialtransaction',
+            index=models.Index(fields=['timestamp'], name='rial_tx_ts_idx'),
+        ),
+    ]
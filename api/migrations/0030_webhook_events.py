@@ -0,0 +1,25 @@
+# Generated by Django 5.2.5 on 2026-10-18 04:08
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0029_notification_outbox'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=100, unique=True)),
+                ('transaction_id', models.BigIntegerField(blank=True, null=True)),
+                ('status', models.CharField(blank=True, default='', max_length=20)),
+                ('result', models.CharField(blank=True, default='', max_length=20)),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.utils import timezone
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.core.validators import RegexValidator
 from django.conf import settings
@@ -15,6 +16,7 @@ class User(AbstractUser):
     national_id = models.CharField(max_length=20, unique=True)
     ref_code = models.CharField(max_length=10, blank=True, null=True)
     phone_number = models.CharField(max_length=11, unique=True)
+    verification_status = models.CharField(max_length=20, default='NOT_SUBMITTED', editable=False) # Status of the latest UserVerification, see api/verification.py
     
     def __str__(self): return self.username
 
@@ -39,15 +41,101 @@ def create_user_wallets(sender, instance, created, **kwargs):
         GoldWallet.objects.create(user=instance)
         RialWallet.objects.create(user=instance)
 
+@receiver(pre_save, sender=User)
+def note_changed_token_claims(sender, instance, update_fields=None, **kwargs):
+    from .authentication import CLAIM_FIELDS
+    fields = [field for field in CLAIM_FIELDS if update_fields is None or field in update_fields]
+    stored = User.objects.filter(pk=instance.pk).values(*fields).first() if instance.pk is not None and fields else None
+    instance._claims_changed = stored is not None and any(stored[field] != getattr(instance, field) for field in fields)
+
+@receiver(post_save, sender=User)
+def revoke_inactive_user_tokens(sender, instance, created, **kwargs):
+    # Tokens carry CLAIM_FIELDS (e.g. is_staff), so a change must not be outlived by tokens issued before it.
+    if not created and (not instance.is_active or getattr(instance, '_claims_changed', False)):
+        from .authentication import revoke_user
+        revoke_user(instance.pk)
+
 class GoldTransaction(models.Model):
     class TransactionType(models.TextChoices): BUY = 'BUY', 'Buy'; SELL = 'SELL', 'Sell'
     class Status(models.TextChoices): COMPLETED = 'COMPLETED', 'Completed'; PENDING = 'PENDING', 'Pending'; FAILED = 'FAILED', 'Failed'
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='gold_transactions'); transaction_type = models.CharField(max_length=4, choices=TransactionType.choices); quantity = models.BigIntegerField(); price_per_unit = models.BigIntegerField(); total_price = models.BigIntegerField(); fees = models.BigIntegerField(default=0); net_amount = models.BigIntegerField(); timestamp = models.DateTimeField(auto_now_add=True); status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING); notes = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-timestamp', '-id'], name='gold_tx_user_ts_idx'),
+            models.Index(fields=['timestamp'], name='gold_tx_ts_idx'),
+        ]
+
 
 class Price(models.Model):
     price = models.BigIntegerField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['timestamp'], name='price_timestamp_idx'),
+        ]
+
+class PriceCandle(models.Model):
+    class Resolution(models.TextChoices):
+        MINUTE = '1m', '1 Minute'
+        FIVE_MINUTES = '5m', '5 Minutes'
+        HOUR = '1h', '1 Hour'
+        DAY = '1d', '1 Day'
+
+    resolution = models.CharField(max_length=3, choices=Resolution.choices)
+    bucket_start = models.DateTimeField()
+    open = models.BigIntegerField()
+    high = models.BigIntegerField()
+    low = models.BigIntegerField()
+    close = models.BigIntegerField()
+    count = models.PositiveIntegerField(default=0)
+    opened_at = models.DateTimeField() # Timestamp of the tick that set `open`
+    closed_at = models.DateTimeField() # Timestamp of the tick that set `close`
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['resolution', 'bucket_start'], name='unique_price_candle_bucket'),
+        ]
+
+    def __str__(self):
+        return f"{self.resolution} candle at {self.bucket_start}"
+
+@receiver(post_save, sender=Price)
+def update_price_candles(sender, instance, created, **kwargs):
+    if created:
+        from .candles import ingest
+        ingest(instance)
+
+# Registered after the candle update so a published version implies up-to-date candles.
+# Published on commit, so a price whose transaction rolls back is never served.
+@receiver(post_save, sender=Price)
+def publish_latest_price(sender, instance, created, **kwargs):
+    if created:
+        from .price_cache import price_snapshot
+        transaction.on_commit(lambda: price_snapshot.publish(instance))
+
+class MarketQuote(models.Model):
+    """One observed quote for any symbol the price feed provides (gold karats, coins, currencies, crypto)."""
+    class Category(models.TextChoices):
+        GOLD = 'gold', 'Gold & Coins'
+        CURRENCY = 'currency', 'Currency'
+        CRYPTO = 'cryptocurrency', 'Cryptocurrency'
+
+    symbol = models.CharField(max_length=32)
+    category = models.CharField(max_length=20, choices=Category.choices)
+    name = models.CharField(max_length=100, blank=True)
+    price = models.DecimalField(max_digits=30, decimal_places=8)
+    unit = models.CharField(max_length=10, default='IRR') # IRR for toman/rial quotes, otherwise as quoted (e.g. USD)
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['symbol', '-timestamp'], name='market_quote_symbol_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.symbol}: {self.price} {self.unit}"
 
 class FAQ(models.Model):
     question = models.TextField()
@@ -140,6 +228,164 @@ class RialTransaction(models.Model):
     bank_transaction_id = models.CharField(max_length=100, blank=True, null=True, unique=True)
     notes = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-timestamp', '-id'], name='rial_tx_user_ts_idx'),
+            models.Index(fields=['timestamp'], name='rial_tx_ts_idx'),
+        ]
+
+@receiver([post_save, post_delete], sender=GoldTransaction)
+@receiver([post_save, post_delete], sender=RialTransaction)
+def invalidate_analytics_buckets(sender, instance, created=False, **kwargs):
+    if not created:
+        from .analytics import invalidate
+        transaction.on_commit(lambda: invalidate([instance.timestamp]))
+
+class LedgerEntry(models.Model):
+    """
+    Append-only record of every change to a wallet balance, with the balance
+    it left behind. Rows are never updated or deleted by the application.
+
+    This is a single-sided (per-wallet) ledger, not double-entry: only the
+    user's side of a movement is recorded. No contra entries for the platform
+    (house inventory, bank clearing) are written; the counterparty of a trade,
+    deposit or withdrawal follows from the linked gold or rial transaction.
+    """
+    class Currency(models.TextChoices): GOLD = 'GOLD', 'Gold (mg)'; RIAL = 'RIAL', 'Rial'
+    class EntryType(models.TextChoices):
+        OPENING = 'OPENING', 'Opening balance'
+        TRADE = 'TRADE', 'Trade'
+        DEPOSIT = 'DEPOSIT', 'Deposit'
+        WITHDRAWAL = 'WITHDRAWAL', 'Withdrawal'
+        REFUND = 'REFUND', 'Refund'
+        ADJUSTMENT = 'ADJUSTMENT', 'Adjustment'
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ledger_entries')
+    currency = models.CharField(max_length=4, choices=Currency.choices)
+    amount = models.BigIntegerField() # Signed: credits are positive, debits negative
+    balance_after = models.BigIntegerField()
+    entry_type = models.CharField(max_length=10, choices=EntryType.choices)
+    gold_transaction = models.ForeignKey(GoldTransaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries')
+    rial_transaction = models.ForeignKey(RialTransaction, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries')
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'currency', 'timestamp'], name='ledger_user_currency_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.currency} {self.amount:+} -> {self.balance_after}"
+
+class LedgerCheckpoint(models.Model):
+    """A verified wallet balance including every ledger entry up to `last_entry_id`."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='ledger_checkpoints')
+    currency = models.CharField(max_length=4, choices=LedgerEntry.Currency.choices)
+    last_entry_id = models.BigIntegerField()
+    balance = models.BigIntegerField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'currency', 'last_entry_id'], name='unique_ledger_checkpoint'),
+        ]
+
+class ReportPeriod(models.TextChoices):
+    DAY = 'DAY', 'Day'; MONTH = 'MONTH', 'Month'; YEAR = 'YEAR', 'Year'
+
+class TradeTotals(models.Model):
+    """Trade totals for the UTC day, month or year beginning on `start`."""
+    period = models.CharField(max_length=5, choices=ReportPeriod.choices)
+    start = models.DateField()
+    trades = models.BigIntegerField(default=0)
+    gold_bought = models.BigIntegerField(default=0) # milligrams
+    gold_sold = models.BigIntegerField(default=0) # milligrams
+    buy_volume = models.BigIntegerField(default=0) # Rials paid for gold bought
+    sell_volume = models.BigIntegerField(default=0) # Rials paid out for gold sold
+    fees = models.BigIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+class ReportSummary(TradeTotals):
+    """Platform totals per period, folded in from trades and ledger entries by api.reports."""
+    gold_net_flow = models.BigIntegerField(default=0) # Net change of all gold wallets
+    rial_net_flow = models.BigIntegerField(default=0) # Net change of all rial wallets
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'start'], name='unique_report_summary'),
+        ]
+
+class UserTradeSummary(TradeTotals):
+    """One user's trade totals per period, folded in from trades by api.reports."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='trade_summaries')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['period', 'start', 'user'], name='unique_user_trade_summary'),
+        ]
+
+class Notification(models.Model):
+    """
+    An outbound email, written in the same database transaction as the change
+    it reports and sent after commit by the deliver_notifications workers.
+    """
+    class Status(models.TextChoices): PENDING = 'PENDING', 'Pending'; SENT = 'SENT', 'Sent'; FAILED = 'FAILED', 'Failed'
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
+    kind = models.CharField(max_length=30)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['next_attempt_at'], condition=models.Q(status='PENDING'), name='notification_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} for {self.user_id} ({self.status})"
+
+class WebhookEvent(models.Model):
+    """
+    A payment gateway callback already applied, keyed by its idempotency key;
+    a redelivery finds its key here and changes nothing.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    transaction_id = models.BigIntegerField(null=True, blank=True)
+    status = models.CharField(max_length=20, blank=True, default='')
+    result = models.CharField(max_length=20, blank=True, default='')
+    received_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.key} ({self.result})"
+
+class RedeemedQuote(models.Model):
+    """The nonce of a trade quote that has been used; the unique key makes each quote single-use across workers."""
+    nonce = models.CharField(max_length=32, unique=True)
+    redeemed_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+class TokenRevocation(models.Model):
+    """
+    A revoked JWT ('jwt-revoked:<jti>') or a user whose tokens issued up to
+    revoked_at are all revoked ('jwt-revoked-user:<id>'); kept until every
+    token it covers has expired.
+    """
+    key = models.CharField(max_length=100, unique=True)
+    revoked_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+class ReportWatermark(models.Model):
+    """The last trade and ledger entry folded into the summaries; a single row."""
+    last_transaction_id = models.BigIntegerField(default=0)
+    last_ledger_entry_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
 class Ticket(models.Model):
     class Priority(models.TextChoices):
         LOW = 'LOW', 'Low'
@@ -199,6 +445,11 @@ class UserVerification(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.status}"
+
+@receiver([post_save, post_delete], sender=UserVerification)
+def sync_verification_status(sender, instance, **kwargs):
+    from .verification import refresh_status
+    refresh_status(instance.user_id)
     
 
 class TechnicalAnalysis(models.Model):
@@ -230,6 +481,16 @@ class TechnicalAnalysis(models.Model):
 
     def __str__(self):
         return f"Analysis at {self.calculated_at}"
+
+
+class IndicatorState(models.Model):
+    """Persisted rolling state of the incremental indicator engine, one row per timeframe."""
+    timeframe = models.CharField(max_length=10, unique=True)
+    state = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Indicator state for {self.timeframe}"
     
 
 class PricePrediction(models.Model):
@@ -0,0 +1,98 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .metrics import counters
+from .models import Notification
+
+MESSAGES = {
+    'deposit_completed': ('Deposit Successful!', 'Your deposit of {amount} has been processed.'),
+    'deposit_approved': ('Deposit approved', 'Your deposit of {amount} Rials has been approved.'),
+    'withdrawal_rejected': ('Withdrawal rejected', 'Your withdrawal of {amount} Rials was rejected and the amount returned to your wallet.'),
+    'ticket_answered': ('Your ticket has been answered', 'Your ticket "{title}" has a new answer.'),
+    'verification_verified': ('Verification approved', 'Your identity verification has been approved.'),
+    'verification_rejected': ('Verification rejected', 'Your identity verification was rejected: {notes}'),
+}
+
+
+def build(user_id, kind, **context):
+    subject, body = MESSAGES[kind]
+    return Notification(user_id=user_id, kind=kind, subject=subject, body=body.format(**context))
+
+
+def notify(user_id, kind, **context):
+    """Queues a MESSAGES[kind] email to the user; call it inside the transaction making the change."""
+    notification = build(user_id, kind, **context)
+    notification.save()
+    return notification
+
+
+def notify_many(notifications):
+    """Queues many build() results with one INSERT."""
+    Notification.objects.bulk_create(notifications)
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(getattr(settings, 'NOTIFICATION_RETRY_DELAY', 30) * 2 ** (attempts - 1), 3600))
+
+
+def claim(batch):
+    """
+    Leases up to `batch` due notifications for NOTIFICATION_LEASE seconds.
+    Concurrent workers skip each other's locked rows, and a worker that dies
+    mid-batch only delays its notifications until the lease runs out.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(Notification.objects.select_for_update(skip_locked=True).filter(
+            status=Notification.Status.PENDING, next_attempt_at__lte=now,
+        ).order_by('next_attempt_at', 'pk').values_list('pk', flat=True)[:batch])
+        Notification.objects.filter(pk__in=ids).update(
+            attempts=F('attempts') + 1, next_attempt_at=now + timedelta(seconds=getattr(settings, 'NOTIFICATION_LEASE', 300)),
+        )
+    return list(Notification.objects.filter(pk__in=ids).select_related('user').order_by('pk'))
+
+
+def deliver(batch=None):
+    """
+    Sends one claimed batch over a single mail connection. Failures are
+    retried with exponential backoff up to NOTIFICATION_MAX_ATTEMPTS times.
+    Returns the number of notifications claimed.
+    """
+    notifications = claim(batch or getattr(settings, 'NOTIFICATION_BATCH_SIZE', 100))
+    if not notifications:
+        return 0
+    sent, failed = [], []
+    try:
+        with get_connection() as connection:
+            for notification in notifications:
+                if not notification.user.email:
+                    notification.last_error = 'The user has no email address.'
+                    notification.attempts = getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 8)
+                    failed.append(notification)
+                    continue
+                try:
+                    EmailMessage(notification.subject, notification.body, settings.DEFAULT_FROM_EMAIL, [notification.user.email], connection=connection).send()
+                    sent.append(notification.pk)
+                except Exception as e:
+                    notification.last_error = str(e)
+                    failed.append(notification)
+    except Exception as e:
+        # The connection itself failed; nothing unsent got through.
+        failed = [notification for notification in notifications if notification.pk not in sent]
+        for notification in failed:
+            notification.last_error = str(e)
+
+    now = timezone.now()
+    Notification.objects.filter(pk__in=sent).update(status=Notification.Status.SENT, sent_at=now, last_error='')
+    for notification in failed:
+        if notification.attempts >= getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 8):
+            notification.status = Notification.Status.FAILED
+        else:
+            notification.next_attempt_at = now + retry_delay(notification.attempts)
+    Notification.objects.bulk_update(failed, ['status', 'attempts', 'next_attempt_at', 'last_error'])
+    counters.incr('notifications.sent', len(sent))
+    counters.incr('notifications.failed', len(failed))
+    return len(notifications)
@@ -0,0 +1,61 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, _reverse_ordering
+
+
+class TransactionCursorPagination(CursorPagination):
+    """
+    Keyset pagination over (timestamp, id), newest first. The cursor holds the
+    (timestamp, id) of the row a page continues from, so rows sharing a
+    timestamp need no offset, and each page is one index range scan on
+    (user, timestamp, id): deep pages cost the same as the first one.
+    """
+    ordering = ('-timestamp', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse, position = (self.cursor.reverse, self.cursor.position) if self.cursor else (False, None)
+
+        queryset = queryset.order_by(*(_reverse_ordering(self.ordering) if reverse else self.ordering))
+        if position is not None:
+            timestamp, pk = self._parse_position(position)
+            # timestamp <= t bounds the index scan; the rest is (timestamp, id) < (t, pk), or > going backwards.
+            if reverse:
+                queryset = queryset.filter(Q(timestamp__gte=timestamp), Q(timestamp__gt=timestamp) | Q(id__gt=pk))
+            else:
+                queryset = queryset.filter(Q(timestamp__lte=timestamp), Q(timestamp__lt=timestamp) | Q(id__lt=pk))
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following = self._get_position_from_instance(results[-1], self.ordering) if len(results) > self.page_size else None
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = position is not None, following is not None
+            self.next_position, self.previous_position = position, following
+        else:
+            self.has_next, self.has_previous = following is not None, position is not None
+            self.next_position, self.previous_position = following, position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def _get_position_from_instance(self, instance, ordering):
+        return f"{instance.timestamp.isoformat()}|{instance.pk}"
+
+    def _parse_position(self, position):
+        timestamp, _, pk = position.rpartition('|')
+        try:
+            timestamp = parse_datetime(timestamp)
+            pk = int(pk)
+        except ValueError:
+            timestamp = None
+        if timestamp is None:
+            raise NotFound(self.invalid_cursor_message)
+        return timestamp, pk
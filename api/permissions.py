@@ -1,5 +1,6 @@
 from rest_framework import permissions
 from .models import UserVerification
+from .verification import verification_status
 
 class IsVerifiedUser(permissions.BasePermission):
     """
@@ -10,10 +11,5 @@ class IsVerifiedUser(permissions.BasePermission):
     def has_permission(self, request, view):
         if not request.user.is_authenticated:
             return False
-        
-        latest_verification = request.user.verifications.last()
-        
-        if not latest_verification:
-            return False
-            
-        return latest_verification.status == UserVerification.Status.VERIFIED
\ No newline at end of file
+
+        return verification_status(request.user.pk) == UserVerification.Status.VERIFIED
\ No newline at end of file
@@ -0,0 +1,97 @@
+import threading
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .metrics import counters
+from .models import Price
+
+SNAPSHOT_KEY = 'price-snapshot:latest'
+VERSION_KEY = 'price-snapshot:version'
+
+
+class PriceSnapshot:
+    """
+    Keeps the most recent Price row in memory for the current worker.
+
+    Writers publish every new row to the shared cache under an increasing version.
+    Readers serve their local copy until it is older than PRICE_SNAPSHOT_MAX_STALENESS
+    seconds, then revalidate against the shared cache and only fall back to the
+    database when nothing has been published (cold start or after an invalidation).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._price = None
+        self._version = None
+        self._loaded_at = 0.0
+
+    @property
+    def max_staleness(self):
+        return getattr(settings, 'PRICE_SNAPSHOT_MAX_STALENESS', 5)
+
+    @property
+    def version(self):
+        return self._version
+
+    def get(self):
+        """Returns the latest Price, or None if there is no price data at all."""
+        now = time.monotonic()
+        with self._lock:
+            if self._price is not None:
+                if now - self._loaded_at < self.max_staleness:
+                    counters.incr('price_snapshot.hit')
+                    return self._price
+                counters.incr('price_snapshot.stale')
+
+        published = cache.get(SNAPSHOT_KEY)
+        if published is not None:
+            counters.incr('price_snapshot.refresh')
+            price = Price(pk=published['pk'], price=published['price'], timestamp=published['timestamp'])
+            version = published['version']
+        else:
+            counters.incr('price_snapshot.miss')
+            try:
+                price = Price.objects.latest('timestamp')
+            except Price.DoesNotExist:
+                return None
+            version = None
+
+        with self._lock:
+            self._price, self._version, self._loaded_at = price, version, now
+        return price
+
+    def publish(self, price):
+        """Makes a newly written Price the current snapshot for every worker."""
+        published = cache.get(SNAPSHOT_KEY)
+        if published is not None and published['timestamp'] > price.timestamp:
+            return
+        version = self._next_version()
+        cache.set(SNAPSHOT_KEY, {
+            'pk': price.pk, 'price': price.price, 'timestamp': price.timestamp, 'version': version,
+        }, timeout=None)
+        with self._lock:
+            self._price, self._version, self._loaded_at = price, version, time.monotonic()
+        counters.incr('price_snapshot.publish')
+
+    def invalidate(self):
+        """Drops every cached copy so the next read reloads from the database."""
+        cache.delete(SNAPSHOT_KEY)
+        self._next_version()
+        with self._lock:
+            self._price, self._version, self._loaded_at = None, None, 0.0
+        counters.incr('price_snapshot.invalidate')
+
+    def stats(self):
+        data = counters.snapshot(prefix='price_snapshot.')
+        data['version'] = self._version
+        data['age_seconds'] = round(time.monotonic() - self._loaded_at, 3) if self._price is not None else None
+        return data
+
+    def _next_version(self):
+        try:
+            return cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.add(VERSION_KEY, 0, timeout=None)
+            return cache.incr(VERSION_KEY)
+
+
+price_snapshot = PriceSnapshot()
@@ -0,0 +1,162 @@
+import random
+from collections import namedtuple
+from decimal import Decimal, InvalidOperation
+import requests
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from .models import MarketQuote, Price
+from .price_cache import price_snapshot
+
+GOLD_SYMBOL = 'IR_GOLD_18K'
+BRSAPI_URL = 'https://BrsApi.ir/Api/Market/Gold_Currency.php'
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36'
+UNITS = {'تومان': ('IRR', 10), 'ریال': ('IRR', 1), 'دلار': ('USD', 1)}
+
+Quote = namedtuple('Quote', ['symbol', 'category', 'name', 'price', 'unit'])
+
+
+class ProviderError(Exception):
+    pass
+
+
+class BrsApiProvider:
+    """
+    Fetches every gold, coin, currency and crypto quote from BrsApi.ir in one
+    request over a pooled session that retries transient failures with
+    exponential backoff.
+    """
+    def __init__(self, api_key, timeout=10, retries=3, backoff=0.5):
+        if not api_key:
+            raise ProviderError('Please set BRS_API_KEY in your settings.py file.')
+        self.api_key = api_key
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=['GET'])
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=retry))
+
+    def fetch(self):
+        try:
+            response = self.session.get(BRSAPI_URL, params={'key': self.api_key}, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.json()
+        except requests.exceptions.RequestException as e:
+            raise ProviderError(f'Network error: {e}')
+        except ValueError:
+            raise ProviderError('Error processing the server response. It might not be valid JSON.')
+        return parse_brsapi(data)
+
+    def close(self):
+        self.session.close()
+
+
+def parse_brsapi(data):
+    """Turns a BrsApi response into Quotes, converting toman prices to rials."""
+    if isinstance(data, list): # Older responses only carried the gold list.
+        data = {MarketQuote.Category.GOLD: data}
+    if not isinstance(data, dict):
+        raise ProviderError('API response is in an unexpected format.')
+
+    quotes = []
+    for category in MarketQuote.Category.values:
+        for item in data.get(category) or []:
+            if not isinstance(item, dict) or not item.get('symbol'):
+                continue
+            label = item.get('unit')
+            if label in UNITS:
+                unit, factor = UNITS[label]
+            elif label:
+                unit, factor = label, 1
+            else: # BrsApi quotes crypto in dollars and everything else in tomans.
+                unit, factor = ('USD', 1) if category == MarketQuote.Category.CRYPTO else UNITS['تومان']
+            try:
+                price = Decimal(str(item.get('price')).replace(',', '')) * factor
+            except InvalidOperation:
+                continue
+            quotes.append(Quote(item['symbol'], category, item.get('name_en') or item.get('name') or '', price, unit[:10]))
+    return quotes
+
+
+class FakeProvider:
+    """A local, deterministic stand-in for BrsApi: every symbol random-walks on each fetch."""
+    SYMBOLS = [
+        (GOLD_SYMBOL, MarketQuote.Category.GOLD, '18K Gold', 6_500_000, 'تومان'),
+        ('IR_GOLD_24K', MarketQuote.Category.GOLD, '24K Gold', 8_650_000, 'تومان'),
+        ('IR_COIN_EMAMI', MarketQuote.Category.GOLD, 'Emami Coin', 68_000_000, 'تومان'),
+        ('USD', MarketQuote.Category.CURRENCY, 'US Dollar', 92_000, 'تومان'),
+        ('EUR', MarketQuote.Category.CURRENCY, 'Euro', 100_000, 'تومان'),
+        ('BTC', MarketQuote.Category.CRYPTO, 'Bitcoin', 65_000, 'دلار'),
+    ]
+
+    def __init__(self, seed=None, change_probability=0.5, volatility=0.001):
+        self.rng = random.Random(seed)
+        self.change_probability = change_probability
+        self.volatility = volatility
+        self.prices = {symbol: price for symbol, _, _, price, _ in self.SYMBOLS}
+
+    def fetch(self):
+        items = {}
+        for symbol, category, name, _, unit in self.SYMBOLS:
+            if self.rng.random() < self.change_probability:
+                self.prices[symbol] = max(1, round(self.prices[symbol] * (1 + self.rng.uniform(-self.volatility, self.volatility))))
+            items.setdefault(category, []).append({'symbol': symbol, 'name_en': name, 'price': self.prices[symbol], 'unit': unit})
+        return parse_brsapi(items)
+
+    def close(self):
+        pass
+
+
+def get_provider(name=None, **kwargs):
+    name = name or getattr(settings, 'PRICE_PROVIDER', 'brsapi')
+    if name == 'fake':
+        return FakeProvider(**kwargs)
+    if name == 'brsapi':
+        return BrsApiProvider(getattr(settings, 'BRS_API_KEY', None), **kwargs)
+    raise ProviderError(f"Unknown price provider '{name}'.")
+
+
+class Ingestor:
+    """
+    Polls a provider and stores only the quotes that changed since the last one
+    seen for their symbol, in one bulk insert. A changed 18K gold quote is also
+    written as the platform Price, which drives the snapshot and candles.
+    """
+    def __init__(self, provider):
+        self.provider = provider
+        self.last_prices = None
+        self.last_gold = None  # The 18K gold quote of the latest fetch, None if it had none
+
+    def _load_last_prices(self):
+        latest = MarketQuote.objects.annotate(
+            rank=Window(RowNumber(), partition_by=F('symbol'), order_by=F('timestamp').desc())
+        ).filter(rank=1).values_list('symbol', 'price')
+        return dict(latest)
+
+    def ingest_once(self):
+        """
+        Fetches once and returns (new MarketQuotes, new Price or None). The
+        quotes and the price are written in one transaction, so a failure
+        leaves neither behind and the next poll stores them again.
+        """
+        quotes = self.provider.fetch()
+        if self.last_prices is None:
+            self.last_prices = self._load_last_prices()
+
+        changed = [quote for quote in quotes if self.last_prices.get(quote.symbol) != quote.price]
+        gold = self.last_gold = next((quote for quote in quotes if quote.symbol == GOLD_SYMBOL), None)
+        latest = price_snapshot.get() if gold is not None else None
+        price = None
+        with transaction.atomic():
+            created = MarketQuote.objects.bulk_create([
+                MarketQuote(symbol=quote.symbol, category=quote.category, name=quote.name[:100], price=quote.price, unit=quote.unit)
+                for quote in changed
+            ])
+            if gold is not None and (latest is None or latest.price != int(gold.price)):
+                price = Price.objects.create(price=int(gold.price))
+        for quote in changed:
+            self.last_prices[quote.symbol] = quote.price
+        return created, price
@@ -0,0 +1,137 @@
+import os
+import random
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from .models import Price
+
+CHUNK_SIZE = 10000
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+
+
+def to_micros(timestamp):
+    return (timestamp - EPOCH) // ONE_MICROSECOND
+
+
+def cache_dir():
+    return Path(getattr(settings, 'PRICE_FRAME_CACHE_DIR', settings.BASE_DIR / 'cache'))
+
+
+def cache_path():
+    return cache_dir() / 'price_frame.npz'
+
+
+def fetch_arrays(since=None, until=None):
+    """
+    Streams (timestamp, price) rows in chunks through a server-side cursor into
+    int64 arrays (timestamps as UTC microseconds), without building per-row dicts.
+    `since` is exclusive and `until` inclusive.
+    """
+    queryset = Price.objects.order_by('timestamp', 'id')
+    if since is not None:
+        queryset = queryset.filter(timestamp__gt=since)
+    if until is not None:
+        queryset = queryset.filter(timestamp__lte=until)
+
+    rows = queryset.values_list('timestamp', 'price').iterator(chunk_size=CHUNK_SIZE)
+    timestamps, prices = [], []
+    while True:
+        chunk = list(islice(rows, CHUNK_SIZE))
+        if not chunk:
+            break
+        timestamps.append(np.fromiter((to_micros(ts) for ts, _ in chunk), dtype=np.int64, count=len(chunk)))
+        prices.append(np.fromiter((price for _, price in chunk), dtype=np.int64, count=len(chunk)))
+
+    if not timestamps:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate(timestamps), np.concatenate(prices)
+
+
+def _read_cache(path):
+    try:
+        with np.load(path) as data:
+            return data['timestamps'], data['prices']
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _write_cache(path, timestamps, prices):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as handle:
+        np.savez(handle, timestamps=timestamps, prices=prices)
+    os.replace(tmp_name, path)
+
+
+def load_cached_arrays():
+    """
+    Returns the full price history, reading the on-disk cache and fetching only
+    the rows newer than its watermark. A backfill older than the cached history
+    invalidates the cache and triggers a full reload.
+    """
+    path = cache_path()
+    cached = _read_cache(path)
+    oldest = Price.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+    if oldest is None:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    if cached is None or not len(cached[0]) or to_micros(oldest) < cached[0][0]:
+        timestamps, prices = fetch_arrays()
+    else:
+        watermark = EPOCH + timedelta(microseconds=int(cached[0][-1]))
+        new_timestamps, new_prices = fetch_arrays(since=watermark)
+        if not len(new_timestamps):
+            return cached
+        timestamps = np.concatenate([cached[0], new_timestamps])
+        prices = np.concatenate([cached[1], new_prices])
+
+    _write_cache(path, timestamps, prices)
+    return timestamps, prices
+
+
+def load_price_frame(since=None, until=None, resample=None, use_cache=True):
+    """
+    Loads price history as a DataFrame indexed by UTC timestamp with a `price`
+    column. With `resample` (a pandas offset alias such as 'h' or 'D') it returns
+    open/high/low/close columns per non-empty bucket instead, labelled by the
+    bucket's start.
+    """
+    if use_cache:
+        timestamps, prices = load_cached_arrays()
+        lo = 0 if since is None else np.searchsorted(timestamps, to_micros(since), side='right')
+        hi = len(timestamps) if until is None else np.searchsorted(timestamps, to_micros(until), side='right')
+        timestamps, prices = timestamps[lo:hi], prices[lo:hi]
+    else:
+        timestamps, prices = fetch_arrays(since=since, until=until)
+
+    index = pd.to_datetime(timestamps, unit='us', utc=True)
+    frame = pd.DataFrame({'price': prices}, index=pd.DatetimeIndex(index, name='timestamp'))
+    if resample:
+        frame = frame['price'].resample(resample, label='left', closed='left').ohlc().dropna()
+    return frame
+
+
+def random_walk(start, end, price, step=timedelta(minutes=2), volatility=0.0001, seed=None):
+    """Yields synthetic (timestamp, price) ticks from `start` up to `end`, one every `step`."""
+    rng = random.Random(seed)
+    current = start
+    while current < end:
+        yield current, int(price)
+        price *= 1 + rng.uniform(-volatility, volatility)
+        current += step
+
+
+def synthetic_price_frame(days, price=100_000_000, seed=None, resample=None):
+    """A random-walk price history of `days` days ending now, shaped like `load_price_frame`."""
+    end = datetime.now(dt_timezone.utc)
+    ticks = list(random_walk(end - timedelta(days=days), end, price, seed=seed))
+    index = pd.DatetimeIndex([timestamp for timestamp, _ in ticks], name='timestamp')
+    frame = pd.DataFrame({'price': [value for _, value in ticks]}, index=index)
+    if resample:
+        frame = frame['price'].resample(resample, label='left', closed='left').ohlc().dropna()
+    return frame
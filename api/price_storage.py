@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta
+from django.db import connection, transaction
+from django.utils import timezone
+from . import candles
+from .models import Price
+
+PRICE_TABLE = Price._meta.db_table
+
+
+def is_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def month_start(timestamp):
+    """First instant of the local (TIME_ZONE) month containing `timestamp`."""
+    local = timezone.localtime(timestamp)
+    return local.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return timezone.make_aware(month.replace(tzinfo=None, year=index // 12, month=index % 12 + 1))
+
+
+def partition_name(month, table=PRICE_TABLE):
+    return f"{table}_p{month:%Y%m}"
+
+
+def is_partitioned(table=PRICE_TABLE):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+        row = cursor.fetchone()
+    return bool(row) and row[0] == 'p'
+
+
+def list_partitions(table=PRICE_TABLE):
+    """Returns (name, month) for every monthly partition of `table`, oldest first."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = %s ORDER BY child.relname", [table]
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    prefix = f"{table}_p"
+    partitions = []
+    for name in names:
+        if name.startswith(prefix) and name[len(prefix):].isdigit():
+            suffix = name[len(prefix):]
+            month = timezone.make_aware(datetime(int(suffix[:4]), int(suffix[4:]), 1))
+            partitions.append((name, month))
+    return partitions
+
+
+def create_partition(cursor, month, table=PRICE_TABLE):
+    cursor.execute(
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(month, table)}" PARTITION OF "{table}" '
+        f'FOR VALUES FROM (%s) TO (%s)', [month, add_months(month, 1)]
+    )
+
+
+def convert_to_partitioned(months_ahead=3):
+    """
+    Rebuilds api_price as a table range-partitioned by local month. The primary key
+    becomes (id, timestamp) as Postgres requires, ids keep coming from a sequence,
+    and existing rows are copied over. Indexes are then managed per partition by
+    `apply_index_policy`, replacing the model's single timestamp index.
+    """
+    legacy = f"{PRICE_TABLE}_unpartitioned"
+    sequence = f"{PRICE_TABLE}_partitioned_id_seq"
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'LOCK TABLE "{PRICE_TABLE}" IN ACCESS EXCLUSIVE MODE')
+        cursor.execute(f'ALTER TABLE "{PRICE_TABLE}" RENAME TO "{legacy}"')
+        cursor.execute(f'CREATE SEQUENCE "{sequence}"')
+        cursor.execute(
+            f'CREATE TABLE "{PRICE_TABLE}" ('
+            f'"id" bigint NOT NULL DEFAULT nextval(\'"{sequence}"\'), '
+            f'"price" bigint NOT NULL, '
+            f'"timestamp" timestamp with time zone NOT NULL, '
+            f'PRIMARY KEY ("id", "timestamp")'
+            f') PARTITION BY RANGE ("timestamp")'
+        )
+        cursor.execute(f'ALTER SEQUENCE "{sequence}" OWNED BY "{PRICE_TABLE}"."id"')
+        cursor.execute(f'CREATE TABLE "{PRICE_TABLE}_default" PARTITION OF "{PRICE_TABLE}" DEFAULT')
+
+        cursor.execute(f'SELECT MIN("timestamp"), MAX("id") FROM "{legacy}"')
+        oldest, max_id = cursor.fetchone()
+        month = month_start(oldest or timezone.now())
+        last = add_months(month_start(timezone.now()), months_ahead)
+        while month <= last:
+            create_partition(cursor, month)
+            month = add_months(month, 1)
+
+        cursor.execute(f'INSERT INTO "{PRICE_TABLE}" ("id", "price", "timestamp") SELECT "id", "price", "timestamp" FROM "{legacy}"')
+        cursor.execute(f'SELECT setval(\'"{sequence}"\', %s, false)', [(max_id or 0) + 1])
+        cursor.execute(f'DROP TABLE "{legacy}"')
+
+
+def ensure_partitions(months_ahead=3):
+    """Creates the partitions for the current month and the next `months_ahead` months."""
+    created = []
+    existing = {name for name, _ in list_partitions()}
+    month = month_start(timezone.now())
+    with connection.cursor() as cursor:
+        for _ in range(months_ahead + 1):
+            if partition_name(month) not in existing:
+                create_partition(cursor, month)
+                created.append(partition_name(month))
+            month = add_months(month, 1)
+    return created
+
+
+def apply_index_policy(btree_months=2, table=PRICE_TABLE):
+    """
+    Recent partitions get a B-tree on timestamp for point lookups and ordered
+    scans; older, append-only partitions get a tiny BRIN index instead.
+    """
+    cutoff = add_months(month_start(timezone.now()), -btree_months)
+    with connection.cursor() as cursor:
+        for name, month in list_partitions(table):
+            if month >= cutoff:
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS "{name}_ts_btree" ON "{name}" ("timestamp")')
+                cursor.execute(f'DROP INDEX IF EXISTS "{name}_ts_brin"')
+            else:
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS "{name}_ts_brin" ON "{name}" USING brin ("timestamp") WITH (autosummarize = on)')
+                cursor.execute(f'DROP INDEX IF EXISTS "{name}_ts_btree"')
+
+
+def compact(keep_days):
+    """
+    Folds raw ticks older than `keep_days` into candles and deletes them. Whole
+    expired partitions are dropped; the remainder is removed with one DELETE.
+    Returns (cutoff, dropped_partitions, deleted_rows).
+    """
+    cutoff = candles.bucket_start(timezone.now() - timedelta(days=keep_days), candles.DAY_SECONDS)
+    oldest = Price.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+    if oldest is None or oldest >= cutoff:
+        return cutoff, [], 0
+
+    candles.rebuild(start=oldest, end=cutoff - timedelta(microseconds=1))
+
+    dropped = []
+    with transaction.atomic():
+        if is_postgres() and is_partitioned():
+            with connection.cursor() as cursor:
+                for name, month in list_partitions():
+                    if add_months(month, 1) <= cutoff:
+                        cursor.execute(f'DROP TABLE "{name}"')
+                        dropped.append(name)
+        deleted, _ = Price.objects.filter(timestamp__lt=cutoff).delete()
+    return cutoff, dropped, deleted
@@ -0,0 +1,69 @@
+import secrets
+from datetime import timedelta
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .metrics import counters
+from .models import Price, RedeemedQuote
+
+SALT = 'api.trade-quote'
+
+
+class QuoteError(Exception):
+    pass
+
+
+def quote_ttl():
+    return getattr(settings, 'TRADE_QUOTE_TTL', 10)
+
+
+def issue(user, trade_type, quantity, price):
+    """
+    A signed token fixing `price` for one trade of `quantity` milligrams by
+    `user` for TRADE_QUOTE_TTL seconds. Returns (token, expires_at).
+    """
+    token = signing.dumps({
+        'user': user.pk, 'type': trade_type, 'quantity': quantity, 'nonce': secrets.token_urlsafe(9),
+        'price_id': price.pk, 'price': price.price, 'price_at': price.timestamp.isoformat(),
+    }, salt=SALT, compress=True)
+    counters.incr('quote.issued')
+    return token, timezone.now() + timedelta(seconds=quote_ttl())
+
+
+def redeem(token, user, trade_type):
+    """
+    Validates a quote for `user` and `trade_type` and marks it used by
+    inserting its nonce into RedeemedQuote, whose unique key lets only one
+    worker win. Returns (quantity, Price) without reading the database;
+    raises QuoteError.
+    """
+    try:
+        quote = signing.loads(token, salt=SALT, max_age=quote_ttl())
+    except signing.SignatureExpired:
+        counters.incr('quote.expired')
+        raise QuoteError('Quote has expired.')
+    except signing.BadSignature:
+        raise QuoteError('Invalid quote.')
+    if quote['user'] != user.pk or quote['type'] != trade_type:
+        raise QuoteError('Invalid quote.')
+    try:
+        with transaction.atomic():
+            RedeemedQuote.objects.create(nonce=quote['nonce'])
+    except IntegrityError:
+        raise QuoteError('Quote has already been used.')
+    counters.incr('quote.redeemed')
+    return quote['quantity'], Price(pk=quote['price_id'], price=quote['price'], timestamp=parse_datetime(quote['price_at']))
+
+
+def release(token):
+    """Makes a redeemed quote usable again, e.g. after the trade was rejected."""
+    quote = signing.loads(token, salt=SALT)
+    RedeemedQuote.objects.filter(nonce=quote['nonce']).delete()
+
+
+def purge():
+    """Forgets the nonces of quotes that have expired anyway. Returns how many were deleted."""
+    cutoff = timezone.now() - timedelta(seconds=quote_ttl() + 60)
+    return RedeemedQuote.objects.filter(redeemed_at__lt=cutoff).delete()[0]
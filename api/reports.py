@@ -0,0 +1,217 @@
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, DateField, F, Max, Min, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+from .models import GoldTransaction, LedgerEntry, ReportPeriod, ReportSummary, ReportWatermark, User, UserTradeSummary
+
+PERIODS = {'daily': ReportPeriod.DAY, 'monthly': ReportPeriod.MONTH, 'yearly': ReportPeriod.YEAR}
+PERIOD_STARTS = {
+    ReportPeriod.DAY: lambda day: day,
+    ReportPeriod.MONTH: lambda day: day.replace(day=1),
+    ReportPeriod.YEAR: lambda day: day.replace(month=1, day=1),
+}
+TOTALS = ['trades', 'gold_bought', 'gold_sold', 'buy_volume', 'sell_volume', 'fees']
+FLOWS = {LedgerEntry.Currency.GOLD: 'gold_net_flow', LedgerEntry.Currency.RIAL: 'rial_net_flow'}
+
+
+def _trade_totals():
+    buy, sell = Q(transaction_type='BUY'), Q(transaction_type='SELL')
+    return {
+        'trades': Count('id'),
+        'gold_bought': Sum('quantity', filter=buy, default=0),
+        'gold_sold': Sum('quantity', filter=sell, default=0),
+        'buy_volume': Sum('total_price', filter=buy, default=0),
+        'sell_volume': Sum('total_price', filter=sell, default=0),
+        'fees': Sum('fees', default=0),
+    }
+
+
+def _day():
+    return Trunc('timestamp', 'day', output_field=DateField(), tzinfo=dt_timezone.utc)
+
+
+def _watermark(lock=False):
+    queryset = ReportWatermark.objects.select_for_update() if lock else ReportWatermark.objects
+    return queryset.get_or_create(pk=1)[0]
+
+
+def _settled_upto(model, after, cutoff):
+    """
+    The highest id up to which every row of `model` is older than `cutoff`.
+    Ids are handed out before commit, so a row can become visible after a
+    higher id already was; holding back the recent rows keeps them from
+    being skipped.
+    """
+    rows = model.objects.filter(id__gt=after)
+    young = rows.filter(timestamp__gte=cutoff).aggregate(first=Min('id'))['first']
+    if young is not None:
+        return young - 1
+    return rows.aggregate(last=Max('id'))['last'] or after
+
+
+def _roll_up(days, period):
+    """Sums per-day totals keyed (day, ...) into totals keyed (start of `period`, ...)."""
+    start_of = PERIOD_STARTS[period]
+    totals = defaultdict(Counter)
+    for (day, *rest), values in days.items():
+        totals[(start_of(day), *rest)].update(values)
+    return totals
+
+
+def _merge(model, period, deltas, key_fields):
+    """Adds `deltas` ({key: {field: amount}}) to the summary rows of `model` for `period`, creating missing rows."""
+    if not deltas:
+        return
+    lookups = {f'{field}__in': {key[i] for key in deltas} for i, field in enumerate(key_fields)}
+    existing = {tuple(getattr(row, field) for field in key_fields): row for row in model.objects.filter(period=period, **lookups)}
+    created, updated = [], []
+    for key, values in deltas.items():
+        row = existing.get(key)
+        if row is None:
+            created.append(model(period=period, **dict(zip(key_fields, key)), **values))
+            continue
+        for field, amount in values.items():
+            setattr(row, field, getattr(row, field) + amount)
+        updated.append(row)
+    model.objects.bulk_create(created, batch_size=1000)
+    if updated:
+        model.objects.bulk_update(updated, sorted({field for values in deltas.values() for field in values}), batch_size=1000)
+
+
+def _fold(trades, entries):
+    """Adds the `trades` and ledger `entries` querysets to the day, month and year summaries."""
+    platform = defaultdict(Counter)
+    for row in trades.annotate(day=_day()).values('day').annotate(**_trade_totals()).order_by():
+        platform[(row.pop('day'),)].update(row)
+    for row in entries.annotate(day=_day()).values('day', 'currency').annotate(amount=Sum('amount')).order_by():
+        platform[(row['day'],)][FLOWS[row['currency']]] += row['amount']
+    users = {
+        (row.pop('day'), row.pop('user_id')): row
+        for row in trades.annotate(day=_day()).values('day', 'user_id').annotate(**_trade_totals()).order_by()
+    }
+    for period in ReportPeriod.values:
+        _merge(ReportSummary, period, _roll_up(platform, period), ('start',))
+        _merge(UserTradeSummary, period, _roll_up(users, period), ('start', 'user_id'))
+
+
+def refresh(settle=None, batch=None):
+    """
+    Folds the trades and ledger entries added since the watermark into the
+    summaries, `batch` ids at a time (REPORT_FOLD_BATCH), holding back the
+    last `settle` seconds (REPORT_SETTLE_SECONDS). Trades edited or deleted
+    after being folded are not picked up; rebuild() for that. Returns the
+    number of trades folded.
+    """
+    settle = getattr(settings, 'REPORT_SETTLE_SECONDS', 60) if settle is None else settle
+    batch = batch or getattr(settings, 'REPORT_FOLD_BATCH', 50_000)
+    cutoff = timezone.now() - timedelta(seconds=settle)
+    watermark = _watermark()
+    last_transaction_id = _settled_upto(GoldTransaction, watermark.last_transaction_id, cutoff)
+    last_entry_id = _settled_upto(LedgerEntry, watermark.last_ledger_entry_id, cutoff)
+
+    folded = 0
+    while True:
+        with transaction.atomic():
+            watermark = _watermark(lock=True)
+            transaction_id = min(last_transaction_id, watermark.last_transaction_id + batch)
+            entry_id = min(last_entry_id, watermark.last_ledger_entry_id + batch)
+            if transaction_id <= watermark.last_transaction_id and entry_id <= watermark.last_ledger_entry_id:
+                return folded
+            trades = GoldTransaction.objects.filter(id__gt=watermark.last_transaction_id, id__lte=transaction_id)
+            _fold(trades, LedgerEntry.objects.filter(id__gt=watermark.last_ledger_entry_id, id__lte=entry_id))
+            folded += trades.count()
+            watermark.last_transaction_id = max(transaction_id, watermark.last_transaction_id)
+            watermark.last_ledger_entry_id = max(entry_id, watermark.last_ledger_entry_id)
+            watermark.save()
+
+
+def rebuild(**kwargs):
+    """Drops every summary and folds all trades and ledger entries again."""
+    with transaction.atomic():
+        watermark = _watermark(lock=True)
+        ReportSummary.objects.all().delete()
+        UserTradeSummary.objects.all().delete()
+        watermark.last_transaction_id = watermark.last_ledger_entry_id = 0
+        watermark.save()
+    return refresh(**kwargs)
+
+
+def _top_users(summaries, trades, top):
+    """
+    The `top` users by volume: the leaders among the summary rows, plus any
+    user with trades after the watermark, whose totals are combined.
+    """
+    fields = {field: Sum(field) for field in TOTALS}
+    volume = lambda row: row['buy_volume'] + row['sell_volume']
+    leaders = summaries.values('user_id').annotate(**fields).annotate(volume=F('buy_volume') + F('sell_volume')).order_by('-volume', 'user_id')[:top]
+    totals = {row.pop('user_id'): Counter({field: row[field] for field in TOTALS}) for row in leaders}
+    recent = {row.pop('user_id'): row for row in trades.values('user_id').annotate(**_trade_totals()).order_by()}
+    missing = recent.keys() - totals.keys()
+    for row in summaries.filter(user_id__in=missing).values('user_id').annotate(**fields).order_by():
+        totals[row.pop('user_id')] = Counter(row)
+    for user_id, row in recent.items():
+        totals.setdefault(user_id, Counter()).update(row)
+
+    leaders = sorted(totals.items(), key=lambda item: volume(item[1]), reverse=True)[:top]
+    names = dict(User.objects.filter(pk__in=[user_id for user_id, _ in leaders]).values_list('pk', 'username'))
+    return [{
+        'user_id': user_id,
+        'username': names.get(user_id),
+        'trades': row['trades'],
+        'gold_bought_mg': row['gold_bought'],
+        'gold_sold_mg': row['gold_sold'],
+        'volume_rials': volume(row),
+        'fees_rials': row['fees'],
+    } for user_id, row in leaders]
+
+
+def dashboard(period=None, top=10):
+    """
+    The reporting dashboard for the current UTC day, month or year
+    (`period` one of PERIODS) or, with None, all time: the summary rows plus
+    whatever was added after the watermark, read from one snapshot.
+    """
+    bucket = PERIODS.get(period)
+    since = PERIOD_STARTS[bucket](timezone.now().date()) if bucket else None
+    snapshot = connection.vendor == 'postgresql' and not connection.in_atomic_block
+    with transaction.atomic():
+        if snapshot:
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+        watermark = _watermark()
+        summaries = ReportSummary.objects.filter(period=bucket or ReportPeriod.YEAR)
+        user_summaries = UserTradeSummary.objects.filter(period=bucket or ReportPeriod.YEAR)
+        trades = GoldTransaction.objects.filter(id__gt=watermark.last_transaction_id)
+        entries = LedgerEntry.objects.filter(id__gt=watermark.last_ledger_entry_id)
+        if since:
+            summaries, user_summaries = summaries.filter(start=since), user_summaries.filter(start=since)
+            trades = trades.filter(timestamp__gte=datetime.combine(since, time.min, tzinfo=dt_timezone.utc))
+
+        totals = Counter(summaries.aggregate(**{field: Sum(field, default=0) for field in TOTALS + list(FLOWS.values())}))
+        totals.update(trades.aggregate(**_trade_totals()))
+        balances = Counter(ReportSummary.objects.filter(period=ReportPeriod.YEAR).aggregate(
+            **{field: Sum(field, default=0) for field in FLOWS.values()}
+        ))
+        recent = Q(timestamp__gte=datetime.combine(since, time.min, tzinfo=dt_timezone.utc)) if since else Q()
+        for currency, field in FLOWS.items():
+            tail = entries.filter(currency=currency).aggregate(all=Sum('amount', default=0), period=Sum('amount', filter=recent, default=0))
+            balances[field] += tail['all']
+            totals[field] += tail['period']
+
+        return {
+            'report_period': period or 'all_time',
+            'total_gold_bought_mg': totals['gold_bought'],
+            'total_gold_sold_mg': totals['gold_sold'],
+            'total_fees_earned_rials': totals['fees'],
+            'current_total_rial_in_wallets': balances['rial_net_flow'],
+            'current_total_gold_in_wallets_mg': balances['gold_net_flow'],
+            'trade_count': totals['trades'],
+            'total_buy_volume_rials': totals['buy_volume'],
+            'total_sell_volume_rials': totals['sell_volume'],
+            'gold_net_flow_mg': totals['gold_net_flow'],
+            'rial_net_flow_rials': totals['rial_net_flow'],
+            'top_users': _top_users(user_summaries, trades, top),
+        }
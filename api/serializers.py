@@ -1,10 +1,13 @@
 from django.contrib.staticfiles.storage import staticfiles_storage
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import is_revoked
 from rest_framework_simplejwt.views import TokenObtainPairView
 from .models import (
     User, GoldWallet, RialWallet, GoldTransaction, RialTransaction,
-    Price, FAQ, License, BankAccount, Ticket, TicketAttachment,
+    Price, PriceCandle, FAQ, License, BankAccount, Ticket, TicketAttachment,
     UserVerification, TechnicalAnalysis, PricePrediction,
 )
 
@@ -59,6 +62,14 @@ class PriceSerializer(serializers.ModelSerializer):
         model = Price
         fields = ['price', 'timestamp']
 
+class PriceCandleSerializer(serializers.ModelSerializer):
+    price = serializers.IntegerField(source='close', read_only=True)
+    timestamp = serializers.DateTimeField(source='bucket_start', read_only=True)
+
+    class Meta:
+        model = PriceCandle
+        fields = ['price', 'timestamp', 'resolution', 'open', 'high', 'low', 'close', 'count']
+
 class GoldTransactionSerializer(serializers.ModelSerializer):
     user = serializers.StringRelatedField()
     class Meta:
@@ -84,6 +95,22 @@ class AdminLicenseSerializer(serializers.ModelSerializer):
         fields = ['api_url', 'id', 'name', 'description', 'url', 'image', 'issue_date', 'expire_date', 'status', 'is_active']
 
 class GoldTradeSerializer(serializers.Serializer):
+    quantity = serializers.IntegerField(
+        min_value=1, required=False,
+        help_text="The amount of gold to trade in milligrams."
+    )
+    quote = serializers.CharField(
+        required=False,
+        help_text="A token from the quote endpoint; the trade executes at its price and quantity."
+    )
+
+    def validate(self, attrs):
+        if 'quote' not in attrs and 'quantity' not in attrs:
+            raise serializers.ValidationError("Provide either a quantity or a quote.")
+        return attrs
+
+class GoldQuoteSerializer(serializers.Serializer):
+    side = serializers.ChoiceField(choices=GoldTransaction.TransactionType.choices)
     quantity = serializers.IntegerField(
         min_value=1, 
         help_text="The amount of gold to trade in milligrams."
@@ -101,6 +128,12 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
         token['phone_number'] = user.phone_number
         token['is_staff'] = user.is_staff
         return token
+
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+    def validate(self, attrs):
+        if is_revoked(RefreshToken(attrs['refresh'])):
+            raise InvalidToken('Token has been revoked.')
+        return super().validate(attrs)
     
 
 class AdminBankAccountSerializer(serializers.ModelSerializer):
@@ -201,6 +234,21 @@ class UserVerificationSerializer(serializers.ModelSerializer):
 class AdminRejectionSerializer(serializers.Serializer):
     admin_notes = serializers.CharField(style={'base_template': 'textarea.html'})
 
+class BulkActionSerializer(serializers.Serializer):
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    filter = serializers.DictField(
+        required=False,
+        help_text="Filter parameters as accepted by the list endpoint; the action applies to every match."
+    )
+
+    def validate(self, attrs):
+        if ('ids' in attrs) == ('filter' in attrs):
+            raise serializers.ValidationError("Provide either ids or a filter.")
+        return attrs
+
+class BulkRejectionSerializer(BulkActionSerializer):
+    admin_notes = serializers.CharField(style={'base_template': 'textarea.html'})
+
 class AdminVerificationSerializer(serializers.ModelSerializer):
     user_email = serializers.EmailField(source='user.email', read_only=True)
     user_username = serializers.CharField(source='user.username', read_only=True)
@@ -217,6 +265,7 @@ class TechnicalAnalysisSerializer(serializers.ModelSerializer):
     class Meta:
         model = TechnicalAnalysis
         fields = [
+            'timeframe',
             'ma_signal',
             'osc_signal',
             'ma_buy_count',
@@ -0,0 +1,263 @@
+import asyncio
+import json
+import logging
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from . import candles
+from .models import Price, PriceCandle
+from .price_cache import VERSION_KEY
+from .price_frame import EPOCH, to_micros
+from .serializers import PriceCandleSerializer, PriceSerializer
+
+logger = logging.getLogger(__name__)
+
+SSE_PATH = '/api/prices/stream/'
+WEBSOCKET_PATH = '/ws/prices/'
+QUEUE_SIZE = 256
+
+
+def event_id(price):
+    """'<UTC microseconds>-<id>': ticks sharing a timestamp still get distinct, ordered ids."""
+    return f"{to_micros(price.timestamp)}-{price.pk}"
+
+
+def parse_since(value):
+    """
+    A resume point (timestamp, id): from an event id, or from bare UTC
+    microseconds or an ISO 8601 timestamp, which resume after every tick at
+    that timestamp (id None).
+    """
+    if not value:
+        return None
+    micros, _, pk = value.partition('-')
+    if micros.isdigit() and (pk.isdigit() or value.isdigit()):
+        return EPOCH + timedelta(microseconds=int(micros)), int(pk) if pk else None
+    parsed = parse_datetime(value)
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return (parsed, None) if parsed is not None else None
+
+
+def current_candles(timestamp):
+    """The candle containing `timestamp` at every rollup resolution, in one query."""
+    return list(PriceCandle.objects.filter(reduce(or_, (
+        Q(resolution=resolution, bucket_start=candles.bucket_start(timestamp, seconds))
+        for resolution, seconds in candles.RESOLUTION_SECONDS.items()
+    ))))
+
+
+def build_events(prices):
+    """A `price` event per tick followed by one `candle` event with the current candles."""
+    events = [
+        {'event': 'price', 'id': event_id(price), 'position': (price.timestamp, price.pk), 'data': PriceSerializer(price).data}
+        for price in prices
+    ]
+    if prices:
+        events.append({
+            'event': 'candle', 'id': events[-1]['id'], 'position': events[-1]['position'],
+            'data': PriceCandleSerializer(current_candles(prices[-1].timestamp), many=True).data,
+        })
+    return events
+
+
+def ticks_since(since, limit, latest=False):
+    """
+    Up to `limit` ticks after the (timestamp, id) position `since`, oldest
+    first; with `latest` the most recent ones. An id of None skips every tick
+    at the timestamp.
+    """
+    timestamp, pk = since
+    if pk is None:
+        queryset = Price.objects.filter(timestamp__gt=timestamp)
+    else:
+        queryset = Price.objects.filter(Q(timestamp__gte=timestamp), Q(timestamp__gt=timestamp) | Q(id__gt=pk))
+    if latest:
+        return list(queryset.order_by('-timestamp', '-id')[:limit])[::-1]
+    return list(queryset.order_by('timestamp', 'id')[:limit])
+
+
+def latest_position():
+    return Price.objects.order_by('-timestamp', '-id').values_list('timestamp', 'id').first()
+
+
+class Subscription:
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self.overflowed = False
+
+
+class Broadcaster:
+    """
+    Fans new ticks out to every streaming connection of this process.
+
+    A single task checks the shared price-snapshot version every
+    PRICE_STREAM_POLL_INTERVAL seconds and only queries the database when it
+    moved (or on every check without a shared version), so the database load
+    does not grow with the number of connections. A subscriber that falls
+    QUEUE_SIZE events behind is dropped; its client resumes from its last event id.
+    """
+    def __init__(self):
+        self.subscribers = set()
+        self._task = None
+        self._last_position = None
+        self._version = None
+
+    @property
+    def poll_interval(self):
+        return getattr(settings, 'PRICE_STREAM_POLL_INTERVAL', 1)
+
+    def subscribe(self):
+        subscription = Subscription()
+        self.subscribers.add(subscription)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+
+    def publish(self, events):
+        for subscription in list(self.subscribers):
+            for event in events:
+                try:
+                    subscription.queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    subscription.overflowed = True
+                    self.subscribers.discard(subscription)
+                    break
+
+    async def _run(self):
+        if self._last_position is None:
+            self._last_position = await sync_to_async(latest_position)() or (EPOCH, 0)
+        while self.subscribers:
+            try:
+                await self._poll()
+            except Exception:
+                logger.exception("Price stream poll failed")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _poll(self):
+        version = await sync_to_async(cache.get)(VERSION_KEY)
+        if version is not None and version == self._version:
+            return
+        prices = await sync_to_async(ticks_since)(self._last_position, QUEUE_SIZE // 2)
+        if prices:
+            self._last_position = (prices[-1].timestamp, prices[-1].pk)
+            self.publish(await sync_to_async(build_events)(prices))
+        if len(prices) < QUEUE_SIZE // 2: # Otherwise keep draining on the next check.
+            self._version = version
+
+
+broadcaster = Broadcaster()
+
+
+async def _stream(since, write, disconnected):
+    """
+    Replays the ticks after `since` (at most the PRICE_STREAM_REPLAY_LIMIT most
+    recent; older history is available from the chart endpoint) and then relays
+    live events until the client disconnects, writing a heartbeat when idle.
+    """
+    subscription = broadcaster.subscribe()
+    heartbeat = getattr(settings, 'PRICE_STREAM_HEARTBEAT', 15)
+    try:
+        last_position = None
+        if since is not None:
+            replay = await sync_to_async(ticks_since)(since, getattr(settings, 'PRICE_STREAM_REPLAY_LIMIT', 1000), latest=True)
+            for event in await sync_to_async(build_events)(replay):
+                await write(event)
+                last_position = event['position']
+
+        while not (subscription.overflowed and subscription.queue.empty()):
+            getter = asyncio.ensure_future(subscription.queue.get())
+            done, _ = await asyncio.wait({getter, disconnected}, timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected in done:
+                getter.cancel()
+                break
+            if getter not in done:
+                getter.cancel()
+                await write(None)
+                continue
+            event = getter.result()
+            if event['event'] == 'price' and last_position is not None and event['position'] <= last_position:
+                continue # Already sent by the replay.
+            await write(event)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+async def _wait_for(receive, message_type):
+    while (await receive())['type'] != message_type:
+        pass
+
+
+async def serve_sse(scope, receive, send):
+    headers = dict(scope.get('headers') or [])
+    query = parse_qs(scope.get('query_string', b'').decode())
+    since = parse_since(headers.get(b'last-event-id', b'').decode() or query.get('since', [None])[0])
+
+    response_headers = [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'), (b'x-accel-buffering', b'no')]
+    if getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False):
+        response_headers.append((b'access-control-allow-origin', b'*'))
+    await send({'type': 'http.response.start', 'status': 200, 'headers': response_headers})
+
+    async def write(event):
+        if event is None:
+            body = b': keep-alive\n\n'
+        else:
+            body = f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n".encode()
+        await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+    disconnected = asyncio.ensure_future(_wait_for(receive, 'http.disconnect'))
+    try:
+        await _stream(since, write, disconnected)
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        disconnected.cancel()
+
+
+async def serve_websocket(scope, receive, send):
+    if (await receive())['type'] != 'websocket.connect':
+        return
+    await send({'type': 'websocket.accept'})
+    query = parse_qs(scope.get('query_string', b'').decode())
+    since = parse_since(query.get('since', [None])[0])
+
+    async def write(event):
+        message = {'type': 'heartbeat'} if event is None else {'type': event['event'], 'id': event['id'], 'data': event['data']}
+        await send({'type': 'websocket.send', 'text': json.dumps(message)})
+
+    disconnected = asyncio.ensure_future(_wait_for(receive, 'websocket.disconnect'))
+    try:
+        await _stream(since, write, disconnected)
+        if not disconnected.done():
+            await send({'type': 'websocket.close', 'code': 1000})
+    finally:
+        disconnected.cancel()
+
+
+class PriceStreamRouter:
+    """
+    ASGI entry point: serves the price stream as Server-Sent Events at SSE_PATH
+    and over a WebSocket at WEBSOCKET_PATH, and hands everything else to Django.
+    """
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == SSE_PATH and scope['method'] == 'GET':
+            return await serve_sse(scope, receive, send)
+        if scope['type'] == 'websocket':
+            if scope['path'] == WEBSOCKET_PATH:
+                return await serve_websocket(scope, receive, send)
+            await send({'type': 'websocket.close', 'code': 1000})
+            return
+        return await self.application(scope, receive, send)
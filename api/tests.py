@@ -1,3 +1,1178 @@
-from django.test import TestCase
+import asyncio
+import csv
+import hashlib
+import hmac
+import io
+import json
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+from asgiref.sync import sync_to_async
+from rest_framework.test import APIClient
+from django.core import mail
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings, skipUnlessDBFeature
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from .indicators import EMA_HORIZON, IndicatorEngine, MA_PERIODS, batch_values, evaluate, reference_values, signal_history
+from .authentication import active_users, is_revoked
+from .models import (
+    FAQ, BankAccount, GoldTransaction, GoldWallet, LedgerCheckpoint, LedgerEntry, License, MarketQuote, Notification, Price,
+    PriceCandle, RedeemedQuote, ReportWatermark, RialTransaction, RialWallet, Ticket, TicketAttachment, TokenRevocation, User, UserVerification,
+    WebhookEvent,
+)
+from .serializers import MyTokenObtainPairSerializer
+from .price_feed import FakeProvider, Ingestor, parse_brsapi
+from . import candles, notifications, reports, streaming, wallets, webhooks
+from .inference import ModelRegistry
+from .price_cache import SNAPSHOT_KEY, price_snapshot
+from .price_frame import load_price_frame
+from .training import WARMUP_BARS
+from .verification import LOCAL_CACHE_TTL, STATUS_KEY, _generation, cache_ttl, verification_status
+from .trade_engine import BUY, SELL, TradeRejected, TradeRequest, execute_batch, trade_engine
 
-# Create your tests here.
+
+def random_walk_candles(length, seed=0):
+    rng = np.random.default_rng(seed)
+    close = np.round(1_000_000 * np.cumprod(1 + rng.normal(0, 0.002, length)))
+    spread = np.abs(rng.normal(0, 1500, length))
+    index = pd.date_range('2025-01-01', periods=length, freq='h', tz='UTC')
+    return pd.DataFrame({'close': close, 'high': close + spread, 'low': close - spread}, index=index)
+
+
+class IndicatorEngineTests(SimpleTestCase):
+    """The incremental engine must match the pandas reference implementation."""
+
+    def assertValuesMatch(self, actual, expected):
+        self.assertEqual(actual['count'], expected['count'])
+        self.assertEqual(sorted(actual['sma']), sorted(expected['sma']))
+        for period in expected['sma']:
+            self.assertAlmostEqual(actual['sma'][period], expected['sma'][period], delta=1e-6 * expected['sma'][period])
+            self.assertAlmostEqual(actual['ema'][period], expected['ema'][period], delta=1e-6 * expected['ema'][period])
+        for key in ('rsi', 'k'):
+            if math.isnan(expected[key]):
+                self.assertTrue(math.isnan(actual[key]), key)
+            else:
+                self.assertAlmostEqual(actual[key], expected[key], places=6)
+        self.assertEqual(evaluate(actual), evaluate(expected))
+
+    def test_committed_values_match_reference(self):
+        candles = random_walk_candles(400)
+        engine = IndicatorEngine()
+        for position, candle in enumerate(candles.itertuples(), start=1):
+            engine.update(candle.close, candle.high, candle.low)
+            if position >= 14 and position % 7 == 0:
+                self.assertValuesMatch(engine.values(), reference_values(candles.iloc[:position]))
+
+    def test_open_candle_values_match_reference(self):
+        candles = random_walk_candles(260, seed=1)
+        engine = IndicatorEngine()
+        for candle in candles.iloc[:-1].itertuples():
+            engine.update(candle.close, candle.high, candle.low)
+        last = candles.iloc[-1]
+        before = engine.to_state()
+        self.assertValuesMatch(engine.values(last['close'], last['high'], last['low']), reference_values(candles))
+        self.assertEqual(engine.to_state(), before)
+
+    def test_state_round_trips_through_json(self):
+        candles = random_walk_candles(300, seed=2)
+        engine = IndicatorEngine()
+        for candle in candles.iloc[:150].itertuples():
+            engine.update(candle.close, candle.high, candle.low)
+        restored = IndicatorEngine(json.loads(json.dumps(engine.to_state())))
+        for candle in candles.iloc[150:].itertuples():
+            restored.update(candle.close, candle.high, candle.low)
+        self.assertValuesMatch(restored.values(), reference_values(candles))
+
+    def test_flat_prices_give_neutral_oscillators(self):
+        candles = random_walk_candles(60, seed=3)
+        candles[['close', 'high', 'low']] = 1_000_000.0
+        engine = IndicatorEngine()
+        for candle in candles.itertuples():
+            engine.update(candle.close, candle.high, candle.low)
+        values = engine.values()
+        self.assertTrue(math.isnan(values['rsi']))
+        self.assertTrue(math.isnan(values['k']))
+        self.assertValuesMatch(values, reference_values(candles))
+        self.assertEqual(set(values['sma']), {period for period in MA_PERIODS if period <= 60})
+
+
+class BatchIndicatorTests(SimpleTestCase):
+    """The vectorized multi-timeframe pass must match the pandas reference implementation."""
+
+    def test_batch_values_match_reference_for_every_history(self):
+        frames = {
+            'short': random_walk_candles(12, seed=4),
+            'medium': random_walk_candles(75, seed=5),
+            'long': random_walk_candles(640, seed=6),
+            'very_long': random_walk_candles(EMA_HORIZON + 500, seed=7),
+        }
+        results = batch_values(frames)
+        for label, candles in frames.items():
+            with self.subTest(timeframe=label):
+                IndicatorEngineTests.assertValuesMatch(self, results[label], reference_values(candles))
+
+    def test_empty_history_is_skipped(self):
+        frames = {'empty': random_walk_candles(0), 'some': random_walk_candles(30, seed=8)}
+        self.assertEqual(set(batch_values(frames)), {'some'})
+
+
+class SignalHistoryTests(SimpleTestCase):
+    """Backtests replay `signal_history`, which must agree with `evaluate` after every candle."""
+
+    def test_signal_history_matches_evaluate_on_every_prefix(self):
+        candles = random_walk_candles(260, seed=9)
+        history = signal_history(candles)
+        for end in range(1, len(candles) + 1):
+            expected = evaluate(reference_values(candles.iloc[:end]))['summary_signal']
+            self.assertEqual(history.iloc[end - 1], expected, f"after {end} candles")
+
+
+class PriceIngestionTests(TestCase):
+    """The ingestion daemon against the local fake provider."""
+
+    def setUp(self):
+        cache.clear()
+        price_snapshot.invalidate()
+
+    def test_only_changed_quotes_are_stored(self):
+        ingestor = Ingestor(FakeProvider(seed=1, change_probability=0))
+        quotes, price = ingestor.ingest_once()
+        self.assertEqual(len(quotes), len(FakeProvider.SYMBOLS))
+        self.assertEqual(price.price, 65_000_000)
+
+        quotes, price = ingestor.ingest_once()
+        self.assertEqual((quotes, price), ([], None))
+
+        ingestor.provider.prices['USD'] += 100
+        quotes, price = Ingestor(ingestor.provider).ingest_once()
+        self.assertEqual([quote.symbol for quote in quotes], ['USD'])
+        self.assertEqual(MarketQuote.objects.filter(symbol='USD').latest('timestamp').price, Decimal('921000'))
+        self.assertIsNone(price)
+
+    def test_failed_price_write_stores_no_quotes(self):
+        ingestor = Ingestor(FakeProvider(seed=1, change_probability=0))
+        with mock.patch('api.price_feed.Price.objects.create', side_effect=OperationalError('connection lost')):
+            with self.assertRaises(OperationalError):
+                ingestor.ingest_once()
+        self.assertFalse(MarketQuote.objects.exists())
+        quotes, price = ingestor.ingest_once()
+        self.assertEqual((len(quotes), price.price), (len(FakeProvider.SYMBOLS), 65_000_000))
+
+    def test_daemon_survives_database_errors(self):
+        stderr = io.StringIO()
+        with mock.patch('api.price_feed.Ingestor.ingest_once', side_effect=OperationalError('connection lost')), \
+                mock.patch('api.management.commands.ingest_prices.close_old_connections'):  # would close the test's connection
+            call_command('ingest_prices', provider='fake', once=True, stderr=stderr)
+        self.assertIn('Poll failed (1 in a row): connection lost', stderr.getvalue())
+
+    def test_update_gold_price_fails_when_the_response_has_no_gold(self):
+        provider = FakeProvider(seed=1, change_probability=0)
+        Ingestor(provider).ingest_once()  # gold has been stored before
+        provider.SYMBOLS = [row for row in FakeProvider.SYMBOLS if row[0] != 'IR_GOLD_18K']
+        with mock.patch('api.management.commands.update_gold_price.get_provider', return_value=provider):
+            with self.assertRaisesMessage(CommandError, 'IR_GOLD_18K'):
+                call_command('update_gold_price', stdout=io.StringIO())
+            provider.SYMBOLS = FakeProvider.SYMBOLS
+            stdout = io.StringIO()
+            call_command('update_gold_price', stdout=stdout)
+        self.assertIn('18K gold price unchanged', stdout.getvalue())
+
+    def test_parses_every_category_of_a_brsapi_response(self):
+        quotes = parse_brsapi({
+            'gold': [{'symbol': 'IR_GOLD_18K', 'name_en': '18K Gold', 'price': 6500000, 'unit': 'تومان'}],
+            'currency': [{'symbol': 'USD', 'price': '92,500', 'unit': 'تومان'}],
+            'cryptocurrency': [{'symbol': 'BTC', 'price': '65000.5', 'unit': 'دلار'}, {'price': 1}],
+        })
+        self.assertEqual(
+            [(quote.symbol, quote.price, quote.unit) for quote in quotes],
+            [('IR_GOLD_18K', 65_000_000, 'IRR'), ('USD', 925_000, 'IRR'), ('BTC', Decimal('65000.5'), 'USD')],
+        )
+
+
+class PriceSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        price_snapshot.invalidate()
+
+    def test_published_on_commit_only(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Price.objects.create(price=1_000_000)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    Price.objects.create(price=9_000_000)
+                    raise RuntimeError('ingest failed')
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(cache.get(SNAPSHOT_KEY)['price'], 1_000_000)
+        self.assertEqual(price_snapshot.get().price, 1_000_000)
+
+    def test_local_copy_revalidates_after_max_staleness(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Price.objects.create(price=1_000_000)
+        published = {'pk': first.pk + 1, 'price': 2_000_000, 'timestamp': timezone.now(), 'version': price_snapshot.version + 1}
+        cache.set(SNAPSHOT_KEY, published)  # published by another worker
+        with self.assertNumQueries(0):
+            self.assertEqual(price_snapshot.get().price, 1_000_000)
+            with mock.patch('api.price_cache.time.monotonic', return_value=time.monotonic() + price_snapshot.max_staleness):
+                self.assertEqual((price_snapshot.get().price, price_snapshot.version), (2_000_000, published['version']))
+
+    def test_older_prices_do_not_replace_newer_ones(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Price.objects.create(price=2_000_000)
+            Price.objects.create(price=1_000_000, timestamp=timezone.now() - timedelta(minutes=1))
+        self.assertEqual(price_snapshot.get().price, 2_000_000)
+
+    def test_invalidate_reloads_from_the_database(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            price = Price.objects.create(price=1_000_000)
+        Price.objects.filter(pk=price.pk).update(price=1_500_000)
+        price_snapshot.invalidate()
+        self.assertIsNone(cache.get(SNAPSHOT_KEY))
+        with self.assertNumQueries(1):
+            self.assertEqual(price_snapshot.get().price, 1_500_000)
+        self.assertIsNone(price_snapshot.version)
+
+
+class CandleTests(TestCase):
+    CANDLE_FIELDS = ['resolution', 'bucket_start', 'open', 'high', 'low', 'close', 'count', 'opened_at', 'closed_at']
+
+    def rollups(self):
+        return sorted(PriceCandle.objects.values_list(*self.CANDLE_FIELDS))
+
+    def test_ingest_matches_rebuild(self):
+        start = timezone.now().replace(second=0, microsecond=0) - timedelta(days=2)
+        offsets = list(range(0, 3 * 24 * 60 * 60, 997))
+        offsets[10], offsets[20] = offsets[20], offsets[10]  # a late tick
+        for i, offset in enumerate(offsets):
+            Price.objects.create(price=1_000_000 + (i * 7919) % 50_000, timestamp=start + timedelta(seconds=offset))
+        ingested = self.rollups()
+        self.assertEqual(candles.rebuild(), len(ingested))
+        self.assertEqual(self.rollups(), ingested)
+
+    def test_chart_merges_the_candles_it_leaves_out(self):
+        now = timezone.now()
+        for hours, price in [(20, 100), (15, 400), (10, 900), (5, 200), (1, 300)]:
+            Price.objects.create(price=price, timestamp=now - timedelta(hours=hours))
+        series = candles.chart_series('daily', 2)
+        self.assertEqual([candle.resolution for candle in series], ['1h', '1h'])
+        self.assertEqual([(candle.open, candle.high, candle.low, candle.close, candle.count) for candle in series], [
+            (100, 400, 100, 400, 2), (900, 900, 200, 300, 3),
+        ])
+
+
+class InferenceHistoryTests(TestCase):
+    def test_closed_closes_from_rollups_match_the_raw_ticks(self):
+        bar_start = pd.Timestamp(timezone.now()).tz_convert('UTC').floor('h')
+        for zone, resolution in [('Asia/Tehran', '5m'), ('UTC', '1h')]:
+            with self.subTest(zone), override_settings(TIME_ZONE=zone):
+                Price.objects.all().delete()
+                PriceCandle.objects.all().delete()
+                for minutes in range(0, 30 * 60, 7):
+                    Price.objects.create(price=1_000_000 + (minutes * 7919) % 50_000, timestamp=bar_start - timedelta(minutes=minutes + 1))
+                expected = load_price_frame(
+                    since=bar_start - pd.Timedelta(hours=WARMUP_BARS), until=bar_start - pd.Timedelta(microseconds=1), resample='h', use_cache=False,
+                )['close']
+
+                with CaptureQueriesContext(connection) as queries:
+                    closes = ModelRegistry()._closed_closes(bar_start)
+                self.assertEqual(len(queries), 1)
+                self.assertIn(f"'{resolution}'", queries[0]['sql'])
+                self.assertEqual(len(closes), 30)
+                pd.testing.assert_series_equal(closes, expected, check_dtype=False, check_freq=False, check_names=False, check_index_type=False)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class CandleConcurrencyTests(TransactionTestCase):
+    def test_ticks_opening_the_same_bucket_at_once(self):
+        start = timezone.now().replace(second=0, microsecond=0) + timedelta(days=1)
+        barrier = threading.Barrier(8)
+
+        def tick(i):
+            try:
+                barrier.wait()
+                Price.objects.create(price=1_000 + i, timestamp=start + timedelta(seconds=i))
+            finally:
+                connection.close()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(tick, range(8)))
+
+        for candle in PriceCandle.objects.filter(bucket_start__lte=start, bucket_start__gt=start - timedelta(days=1)):
+            self.assertEqual((candle.count, candle.low, candle.high), (8, 1_000, 1_007))
+
+
+class ASGIConnection:
+    """Drives an ASGI app in the test's event loop, collecting what it sends."""
+
+    def __init__(self, app, scope):
+        self.incoming, self.sent = asyncio.Queue(), []
+        self.task = asyncio.ensure_future(app(scope, self.incoming.get, self._send))
+
+    async def _send(self, message):
+        self.sent.append(message)
+
+    async def wait_for(self, predicate, timeout=5):
+        async with asyncio.timeout(timeout):
+            while not predicate():
+                await asyncio.sleep(0.01)
+
+    async def close(self, message_type):
+        await self.incoming.put({'type': message_type})
+        async with asyncio.timeout(5):
+            await self.task
+
+
+@override_settings(PRICE_STREAM_POLL_INTERVAL=0.01, PRICE_STREAM_HEARTBEAT=60)
+class PriceStreamTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('api.streaming.broadcaster', streaming.Broadcaster())
+        self.broadcaster = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.django = mock.AsyncMock()
+        self.router = streaming.PriceStreamRouter(self.django)
+        start = timezone.now() - timedelta(minutes=10)
+        self.prices = [Price.objects.create(price=1_000_000 + i, timestamp=start + timedelta(minutes=i)) for i in range(3)]
+
+    def sse_events(self, connection):
+        body = b''.join(message.get('body', b'') for message in connection.sent[1:]).decode()
+        return [dict(line.split(': ', 1) for line in block.splitlines()) for block in body.split('\n\n') if block]
+
+    async def test_sse_replays_after_last_event_id_then_relays_live_ticks(self):
+        first = streaming.to_micros(self.prices[0].timestamp)
+        connection = ASGIConnection(self.router, {
+            'type': 'http', 'method': 'GET', 'path': streaming.SSE_PATH, 'query_string': b'',
+            'headers': [(b'last-event-id', str(first).encode())],
+        })
+        await connection.wait_for(lambda: len(self.sse_events(connection)) == 3)
+        self.assertEqual(connection.sent[0]['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), connection.sent[0]['headers'])
+        replayed = self.sse_events(connection)
+        self.assertEqual([(event['event'], event['id']) for event in replayed], [
+            ('price', streaming.event_id(price)) for price in self.prices[1:]
+        ] + [('candle', streaming.event_id(self.prices[2]))])
+        self.assertEqual(json.loads(replayed[0]['data'])['price'], 1_000_001)
+        self.assertEqual({candle['resolution'] for candle in json.loads(replayed[2]['data'])}, {'1m', '5m', '1h', '1d'})
+
+        await connection.wait_for(lambda: self.broadcaster._last_position is not None)
+        live = await sync_to_async(Price.objects.create)(price=2_000_000)
+        await connection.wait_for(lambda: len(self.sse_events(connection)) == 5)
+        self.assertEqual([(event['event'], event['id']) for event in self.sse_events(connection)[3:]], [
+            ('price', streaming.event_id(live)), ('candle', streaming.event_id(live)),
+        ])
+
+        await connection.close('http.disconnect')
+        self.assertEqual(self.broadcaster.subscribers, set())
+        self.assertTrue(all(message.get('more_body', True) for message in connection.sent[1:]))
+
+    async def test_websocket_replays_since_a_timestamp_and_sends_heartbeats(self):
+        since = (self.prices[1].timestamp - timedelta(seconds=1)).isoformat()
+        connection = ASGIConnection(self.router, {
+            'type': 'websocket', 'path': streaming.WEBSOCKET_PATH, 'query_string': f'since={quote(since)}'.encode(), 'headers': [],
+        })
+        await connection.incoming.put({'type': 'websocket.connect'})
+        messages = lambda: [json.loads(message['text']) for message in connection.sent if message['type'] == 'websocket.send']
+        with override_settings(PRICE_STREAM_HEARTBEAT=0.05):
+            await connection.wait_for(lambda: any(message['type'] == 'heartbeat' for message in messages()))
+        self.assertEqual(connection.sent[0], {'type': 'websocket.accept'})
+        self.assertEqual([(message['type'], message.get('id')) for message in messages()[:3]], [
+            ('price', streaming.event_id(self.prices[1])),
+            ('price', streaming.event_id(self.prices[2])),
+            ('candle', streaming.event_id(self.prices[2])),
+        ])
+        await connection.close('websocket.disconnect')
+        self.assertEqual(self.broadcaster.subscribers, set())
+
+    async def test_ticks_sharing_a_timestamp_are_neither_skipped_nor_repeated(self):
+        tie = await sync_to_async(Price.objects.create)(price=1_000_003, timestamp=self.prices[2].timestamp)
+        connection = ASGIConnection(self.router, {
+            'type': 'http', 'method': 'GET', 'path': streaming.SSE_PATH, 'query_string': b'',
+            'headers': [(b'last-event-id', streaming.event_id(self.prices[2]).encode())],
+        })
+        await connection.wait_for(lambda: len(self.sse_events(connection)) == 2)
+        self.assertEqual([event['id'] for event in self.sse_events(connection)], [streaming.event_id(tie)] * 2)
+
+        await connection.wait_for(lambda: self.broadcaster._last_position is not None)
+        late = await sync_to_async(Price.objects.create)(price=1_000_004, timestamp=tie.timestamp)
+        await connection.wait_for(lambda: len(self.sse_events(connection)) == 4)
+        self.assertEqual([(event['event'], event['id']) for event in self.sse_events(connection)[2:]], [
+            ('price', streaming.event_id(late)), ('candle', streaming.event_id(late)),
+        ])
+        await connection.close('http.disconnect')
+
+    async def test_other_requests_go_to_django(self):
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/prices/', 'query_string': b'', 'headers': []}
+        await self.router(scope, None, None)
+        self.django.assert_awaited_once_with(scope, None, None)
+        send = mock.AsyncMock()
+        await self.router({'type': 'websocket', 'path': '/ws/other/'}, None, send)
+        send.assert_awaited_once_with({'type': 'websocket.close', 'code': 1000})
+        self.django.assert_awaited_once()
+
+
+class TradeBatchTests(TestCase):
+    """Batched trade execution nets balance changes but checks every trade in arrival order."""
+
+    def test_batch_matches_sequential_execution(self):
+        alice = User.objects.create(username='alice', national_id='1', phone_number='1')
+        bob = User.objects.create(username='bob', national_id='2', phone_number='2')
+        wallets.adjust(alice.pk, rial=1_000_000)
+        wallets.adjust(bob.pk, gold=500)
+        price = Price.objects.create(price=1_000_000)
+
+        results = execute_batch([
+            TradeRequest(alice.pk, BUY, 600, None, None),
+            TradeRequest(alice.pk, BUY, 600, None, None),  # only 400,000 rials left
+            TradeRequest(alice.pk, SELL, 100, None, None),
+            TradeRequest(bob.pk, SELL, 500, None, None),
+            TradeRequest(bob.pk, SELL, 1, None, None),
+        ], price)
+
+        self.assertEqual([type(result) for result in results], [GoldTransaction, TradeRejected, GoldTransaction, GoldTransaction, TradeRejected])
+        self.assertEqual(str(results[1]), 'Insufficient funds')
+        self.assertEqual(GoldTransaction.objects.count(), 3)
+        self.assertEqual(GoldWallet.objects.get(user=alice).balance, 500)
+        self.assertEqual(RialWallet.objects.get(user=alice).balance, 500_000)
+        self.assertEqual((GoldWallet.objects.get(user=bob).balance, RialWallet.objects.get(user=bob).balance), (0, 500_000))
+        self.assertEqual(wallets.reconcile(alice.pk, bob.pk), [])
+
+
+class WalletAdjustTests(TestCase):
+    def test_rejects_overdraft_without_partial_update(self):
+        user = User.objects.create(username='carol', national_id='3', phone_number='3')
+        self.assertEqual(wallets.adjust(user.pk, gold=200, rial=1_000), (200, 1_000))
+        with self.assertRaises(wallets.InsufficientBalance):
+            wallets.adjust(user.pk, gold=100, rial=-1_001)
+        self.assertEqual(wallets.adjust(user.pk, gold=-200, rial=-1_000), (0, 0))
+        self.assertEqual(list(LedgerEntry.objects.filter(user=user, currency='RIAL').values_list('amount', 'balance_after')), [(1_000, 1_000), (-1_000, 0)])
+
+
+class LedgerReconciliationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='erin', national_id='5', phone_number='5')
+
+    def test_reconciles_from_the_latest_checkpoint(self):
+        wallets.adjust(self.user.pk, gold=100, rial=5_000)
+        self.assertEqual(wallets.reconcile(self.user.pk, self.user.pk, checkpoint=True), [])
+        wallets.adjust(self.user.pk, gold=-40)
+        checkpoint = LedgerCheckpoint.objects.get(user=self.user, currency='GOLD')
+        LedgerEntry.objects.filter(pk__lte=checkpoint.last_entry_id).delete()  # history before a checkpoint is not replayed
+        self.assertEqual(wallets.reconcile(self.user.pk, self.user.pk), [])
+
+    def test_reports_balances_changed_outside_the_ledger(self):
+        wallets.adjust(self.user.pk, rial=5_000)
+        RialWallet.objects.filter(user=self.user).update(balance=6_000)
+        self.assertEqual(wallets.reconcile(self.user.pk, self.user.pk), [(self.user.pk, 'RIAL', 6_000, 5_000)])
+
+    def test_admin_cannot_edit_balances_or_the_ledger(self):
+        wallets.adjust(self.user.pk, rial=5_000)
+        self.client.force_login(User.objects.create(username='root', national_id='r', phone_number='r', is_staff=True, is_superuser=True))
+        wallet = RialWallet.objects.get(user=self.user)
+        self.client.post(reverse('admin:api_rialwallet_change', args=[wallet.pk]), {'user': self.user.pk, 'balance': 9_000}, HTTP_HOST='localhost')
+        self.assertEqual(self.client.get(reverse('admin:api_rialwallet_add'), HTTP_HOST='localhost').status_code, 403)
+        entry = LedgerEntry.objects.get(user=self.user)
+        self.assertEqual(self.client.post(reverse('admin:api_ledgerentry_change', args=[entry.pk]), {'amount': 1}, HTTP_HOST='localhost').status_code, 403)
+        self.assertEqual(wallets.reconcile(self.user.pk, self.user.pk), [])
+
+    def test_balance_at_a_point_in_time(self):
+        wallets.adjust(self.user.pk, rial=5_000)
+        middle = timezone.now()
+        wallets.adjust(self.user.pk, rial=-2_000)
+        self.assertEqual(wallets.balance_at(self.user.pk, 'RIAL', middle), 5_000)
+        self.assertEqual(wallets.balance_at(self.user.pk, 'RIAL', timezone.now()), 3_000)
+
+
+@skipUnlessDBFeature('has_select_for_update')
+class WalletConcurrencyTests(TransactionTestCase):
+    """Concurrent adjustments from many connections lose no updates and never overdraw."""
+
+    def _hammer(self, work, jobs, workers=16):
+        def run(job):
+            try:
+                return work(job)
+            finally:
+                connection.close()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(run, range(jobs)))
+
+    def test_no_lost_updates_or_overdrafts(self):
+        user = User.objects.create(username='dave', national_id='4', phone_number='4')
+        wallets.adjust(user.pk, gold=0, rial=1_000)
+
+        def trade(job):
+            try:
+                wallets.adjust(user.pk, gold=1, rial=-10)  # 100 of these fit in the balance
+                return True
+            except wallets.InsufficientBalance:
+                return False
+        results = self._hammer(trade, 400)
+
+        self.assertEqual(sum(results), 100)
+        self.assertEqual((GoldWallet.objects.get(user=user).balance, RialWallet.objects.get(user=user).balance), (100, 0))
+
+        self._hammer(lambda job: wallets.adjust(user.pk, gold=-1, rial=10), 100)
+        self.assertEqual((GoldWallet.objects.get(user=user).balance, RialWallet.objects.get(user=user).balance), (0, 1_000))
+        self.assertEqual(wallets.reconcile(user.pk, user.pk), [])
+
+
+class TradeQuoteTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='frank', national_id='6', phone_number='6')
+        UserVerification.objects.create(user=self.user, status=UserVerification.Status.VERIFIED)
+        wallets.adjust(self.user.pk, rial=10_000_000)
+        with self.captureOnCommitCallbacks(execute=True):
+            Price.objects.create(price=1_000_000)
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.force_authenticate(self.user)
+
+    def test_trade_executes_once_at_the_quoted_price(self):
+        quote = self.client.post(reverse('api:gold-trade-quote'), {'side': 'BUY', 'quantity': 1500}).json()
+        self.assertEqual((quote['price_per_unit'], quote['net_amount']), (1_000_000, 1_500_000))
+        Price.objects.create(price=2_000_000)
+
+        with override_settings(PRICE_SNAPSHOT_MAX_STALENESS=0), CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('api:gold-trade-buy'), {'quote': quote['quote']})
+        self.assertFalse([query for query in queries if '"api_price"' in query['sql']])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['price_per_unit'], response.json()['quantity']), (1_000_000, 1500))
+
+        cache.clear()  # e.g. another worker, or a restart: used quotes are not kept in the cache
+        response = self.client.post(reverse('api:gold-trade-buy'), {'quote': quote['quote']})
+        self.assertEqual(response.json(), {'error': 'Quote has already been used.'})
+
+    def test_rejected_trade_releases_its_quote_and_expired_nonces_are_purged(self):
+        quote = self.client.post(reverse('api:gold-trade-quote'), {'side': 'SELL', 'quantity': 100}).json()['quote']
+        self.assertEqual(self.client.post(reverse('api:gold-trade-sell'), {'quote': quote}).json(), {'error': 'Insufficient gold'})
+        self.assertFalse(RedeemedQuote.objects.exists())
+        wallets.adjust(self.user.pk, gold=100)
+        self.assertEqual(self.client.post(reverse('api:gold-trade-sell'), {'quote': quote}).status_code, 201)
+
+        RedeemedQuote.objects.update(redeemed_at=timezone.now() - timedelta(minutes=5))
+        call_command('purge_expired', stdout=io.StringIO())
+        self.assertFalse(RedeemedQuote.objects.exists())
+
+    def test_rejects_quotes_for_another_side_or_after_expiry(self):
+        quote = self.client.post(reverse('api:gold-trade-quote'), {'side': 'BUY', 'quantity': 100}).json()['quote']
+        self.assertEqual(self.client.post(reverse('api:gold-trade-sell'), {'quote': quote}).json(), {'error': 'Invalid quote.'})
+        with override_settings(TRADE_QUOTE_TTL=-1):
+            self.assertEqual(self.client.post(reverse('api:gold-trade-buy'), {'quote': quote}).json(), {'error': 'Quote has expired.'})
+
+
+@override_settings(TRADE_BATCHING=True, TRADE_BATCH_TIMEOUT=0.05)
+class TradeEngineTimeoutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='grace', national_id='g6', phone_number='g6')
+        UserVerification.objects.create(user=self.user, status=UserVerification.Status.VERIFIED)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.price = Price.objects.create(price=1_000_000)
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.force_authenticate(self.user)
+        self.batches, self.release = [], threading.Event()
+        patcher = mock.patch('api.trade_engine.execute_batch', side_effect=self.execute_batch)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def execute_batch(self, requests, price):
+        self.batches.append([request.quantity for request in requests])
+        self.release.wait(5)
+        return [TradeRejected('Insufficient funds') for _ in requests]
+
+    def test_trade_still_queued_is_withdrawn_and_its_quote_released(self):
+        quote = self.client.post(reverse('api:gold-trade-quote'), {'side': 'BUY', 'quantity': 200}).json()['quote']
+        busy = trade_engine.submit(self.user.pk, BUY, 1, self.price)  # keeps the worker busy
+        while not self.batches:
+            time.sleep(0.001)
+
+        response = self.client.post(reverse('api:gold-trade-buy'), {'quote': quote})
+        self.assertEqual((response.status_code, response.json()), (503, {'error': 'The trade timed out and was not executed.'}))
+        self.release.set()
+        with self.assertRaises(TradeRejected):
+            busy.result(timeout=5)
+
+        response = self.client.post(reverse('api:gold-trade-buy'), {'quote': quote})
+        self.assertEqual(response.json(), {'error': 'Insufficient funds'})  # the quote could be used again
+        self.assertEqual(self.batches, [[1], [200]])
+
+    def test_trade_already_executing_is_waited_for(self):
+        threading.Timer(0.2, self.release.set).start()
+        response = self.client.post(reverse('api:gold-trade-buy'), {'quantity': 300})
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Insufficient funds'}))
+        self.assertEqual(self.batches, [[300]])
+
+
+class VerificationStatusTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_status_follows_the_latest_verification(self):
+        user = User.objects.create(username='grace', national_id='7', phone_number='7')
+        self.assertEqual(verification_status(user.pk), 'NOT_SUBMITTED')
+        with self.captureOnCommitCallbacks(execute=True):
+            verification = UserVerification.objects.create(user=user, status=UserVerification.Status.PENDING)
+        self.assertEqual(verification_status(user.pk), 'PENDING')
+        with self.assertNumQueries(0):
+            self.assertEqual(verification_status(user.pk), 'PENDING')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            verification.status = UserVerification.Status.VERIFIED
+            verification.save()
+        self.assertEqual(verification_status(user.pk), 'VERIFIED')
+        self.assertEqual(User.objects.get(pk=user.pk).verification_status, 'VERIFIED')
+
+    def test_a_read_racing_a_change_cannot_cache_the_old_status(self):
+        user = User.objects.create(username='heidi', national_id='7h', phone_number='7h')
+        with self.captureOnCommitCallbacks(execute=True):
+            verification = UserVerification.objects.create(user=user, status=UserVerification.Status.VERIFIED)
+        # A request looks the status up just before an admin rejects the user, and caches it just after.
+        key = STATUS_KEY.format(user.pk, _generation(user.pk))
+        stale = User.objects.get(pk=user.pk).verification_status
+        with self.captureOnCommitCallbacks(execute=True):
+            verification.status = UserVerification.Status.REJECTED
+            verification.save()
+        cache.add(key, stale)
+        self.assertEqual(verification_status(user.pk), 'REJECTED')
+
+    def test_process_local_cache_keeps_statuses_briefly(self):
+        self.assertEqual(cache_ttl(), LOCAL_CACHE_TTL)
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}):
+            self.assertEqual(cache_ttl(), 300)
+
+
+@override_settings(JWT_CLAIMS_AUTH=True)
+class JWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        active_users.clear()
+        self.user = User.objects.create(username='heidi', national_id='8', phone_number='8', email='heidi@example.com')
+        self.refresh = MyTokenObtainPairSerializer.get_token(self.user)
+        self.client = APIClient(HTTP_HOST='localhost', HTTP_X_ACCESS_TOKEN=str(self.refresh.access_token))
+
+    def test_user_comes_from_the_claims(self):
+        self.assertEqual(self.client.get(reverse('api:verification-status')).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(reverse('api:verification-status')).status_code, 200)
+        self.assertFalse([query for query in queries if 'FROM "api_user"' in query['sql']])
+
+    def test_logout_revokes_access_and_refresh_tokens(self):
+        self.assertEqual(self.client.get(reverse('api:verification-status')).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('api:auth_logout'), {'refresh': str(self.refresh)}).status_code, 204)
+        self.assertEqual(self.client.get(reverse('api:verification-status')).status_code, 401)
+        self.assertEqual(APIClient(HTTP_HOST='localhost').post(reverse('api:token_refresh'), {'refresh': str(self.refresh)}).status_code, 401)
+
+    def test_revocations_survive_a_cleared_cache(self):
+        self.assertEqual(self.client.post(reverse('api:auth_logout'), {'refresh': str(self.refresh)}).status_code, 204)
+        cache.clear()  # e.g. another worker, a restart, or an evicted entry
+        self.assertEqual(self.client.get(reverse('api:verification-status')).status_code, 401)
+        self.assertEqual(APIClient(HTTP_HOST='localhost').post(reverse('api:token_refresh'), {'refresh': str(self.refresh)}).status_code, 401)
+
+        other = User.objects.create(username='ivan', national_id='9', phone_number='9')
+        token = MyTokenObtainPairSerializer.get_token(other).access_token
+        self.assertFalse(is_revoked(token))
+        other.delete()  # soft delete
+        cache.clear()
+        self.assertTrue(is_revoked(token))
+
+    def test_deactivation_revokes_issued_tokens(self):
+        self.assertEqual(self.client.get(reverse('api:verification-status')).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()  # soft delete
+        self.assertEqual(self.client.get(reverse('api:verification-status')).status_code, 401)
+
+    def test_demotion_revokes_issued_tokens(self):
+        admin = User.objects.create(username='judy', national_id='10', phone_number='10', is_staff=True)
+        client = APIClient(HTTP_HOST='localhost', HTTP_X_ACCESS_TOKEN=str(MyTokenObtainPairSerializer.get_token(admin).access_token))
+        self.assertEqual(client.get(reverse('api:admin-user-list')).status_code, 200)
+        admin.last_login = timezone.now()
+        admin.save(update_fields=['last_login'])
+        self.assertEqual(client.get(reverse('api:admin-user-list')).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            admin.is_staff = False
+            admin.save()
+        self.assertEqual(client.get(reverse('api:admin-user-list')).status_code, 401)
+
+    def test_expired_revocations_are_purged(self):
+        self.client.post(reverse('api:auth_logout'), {'refresh': str(self.refresh)})
+        self.assertEqual(TokenRevocation.objects.count(), 2)
+        TokenRevocation.objects.filter(key__contains=self.refresh['jti']).update(expires_at=timezone.now())
+        call_command('purge_expired', stdout=io.StringIO())
+        self.assertEqual(TokenRevocation.objects.count(), 1)
+
+
+class TransactionHistoryTests(TestCase):
+    def test_cursor_pages_cover_the_history_once(self):
+        user = User.objects.create(username='ivan', national_id='9', phone_number='9')
+        GoldTransaction.objects.bulk_create([
+            GoldTransaction(user=user, transaction_type='BUY', quantity=i, price_per_unit=1, total_price=1, net_amount=1) for i in range(1, 8)
+        ])
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(user)
+
+        quantities, url = [], reverse('api:gold-history-list') + '?page_size=3'
+        while url:
+            page = client.get(url).json()
+            quantities += [tx['quantity'] for tx in page['results']]
+            url = page['next']
+        self.assertEqual(quantities, list(range(7, 0, -1)))
+
+    def test_cursor_pages_continue_from_a_timestamp_and_id(self):
+        user = User.objects.create(username='ivan', national_id='9', phone_number='9')
+        GoldTransaction.objects.bulk_create([
+            GoldTransaction(user=user, transaction_type='BUY', quantity=i, price_per_unit=1, total_price=1, net_amount=1) for i in range(1, 8)
+        ])
+        GoldTransaction.objects.filter(quantity__gt=2).update(timestamp=timezone.now())  # ties across page boundaries
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(user)
+
+        pages, url = [], reverse('api:gold-history-list') + '?page_size=2'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                page = client.get(url).json()
+            self.assertFalse([query for query in queries if 'OFFSET' in query['sql']])
+            pages.append(page)
+            url = page['next']
+        self.assertEqual([tx['quantity'] for page in pages for tx in page['results']], list(range(7, 0, -1)))
+
+        back = client.get(pages[-1]['previous']).json()
+        self.assertEqual(back['results'], pages[-2]['results'])
+        self.assertEqual(client.get(back['previous']).json()['results'], pages[-3]['results'])
+
+
+class TransactionExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create(username='judy', national_id='10', phone_number='10')
+        GoldTransaction.objects.bulk_create([
+            GoldTransaction(user=self.user, transaction_type='BUY', quantity=i, price_per_unit=1, total_price=1, net_amount=1, notes='a, "b"') for i in range(1, 6)
+        ])
+        for day, tx in enumerate(GoldTransaction.objects.order_by('id'), start=1):
+            GoldTransaction.objects.filter(pk=tx.pk).update(timestamp=timezone.make_aware(timezone.datetime(2026, 1, day)))
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.force_authenticate(self.user)
+
+    def export(self, **params):
+        response = self.client.get(reverse('api:gold-history-export'), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_is_streamed_oldest_first_with_a_header(self):
+        rows = list(csv.DictReader(io.StringIO(self.export())))
+        self.assertEqual([int(row['quantity']) for row in rows], [1, 2, 3, 4, 5])
+        self.assertEqual(rows[0]['notes'], 'a, "b"')
+
+    def test_ndjson_honours_the_date_range(self):
+        lines = self.export(output='ndjson', start='2026-01-02', end='2026-01-04').splitlines()
+        self.assertEqual([json.loads(line)['quantity'] for line in lines], [2, 3, 4])
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.client.get(reverse('api:gold-history-export'), {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('api:gold-history-export'), {'start': '2026-13-01'}).status_code, 400)
+
+
+class QueryBudgetTests(TestCase):
+    """
+    List endpoints must run a constant number of queries, at most their budget
+    here, however many rows they return. New list endpoints belong in BUDGETS.
+    """
+    BUDGETS = {
+        'api:admin-user-list': 1,
+        'api:admin-gold-transaction-list': 1,
+        'api:admin-rial-transaction-list': 1,
+        'api:admin-ticket-list': 2,
+        'api:admin-verification-list': 1,
+        'api:admin-bank-account-list': 1,
+        'api:admin-license-list': 1,
+        'api:admin-faq-list': 1,
+        'api:ticket-list': 2,
+        'api:gold-history-list': 1,
+        'api:rial-history-list': 1,
+    }
+
+    def setUp(self):
+        self.admin = User.objects.create(username='admin', national_id='0', phone_number='0', is_staff=True)
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.force_authenticate(self.admin)
+        self.rows = 0
+
+    def add_rows(self, count):
+        for _ in range(count):
+            self.rows += 1
+            user = User.objects.create(username=f'user{self.rows}', national_id=f'n{self.rows}', phone_number=f'p{self.rows}')
+            account = BankAccount.objects.create(user=user, bank_name='mli', card_number=f'{self.rows:016d}')
+            for owner in (user, self.admin):
+                GoldTransaction.objects.create(user=owner, transaction_type='BUY', quantity=1, price_per_unit=1, total_price=1, net_amount=1)
+                RialTransaction.objects.create(user=owner, bank_account=account, transaction_type='DEPOSIT', amount=1)
+                ticket = Ticket.objects.create(user=owner, title='t', description='d', answered_by=self.admin)
+                TicketAttachment.objects.create(ticket=ticket, file='attachments/a.txt')
+            UserVerification.objects.create(user=user, status=UserVerification.Status.PENDING, image='verifications/a.png')
+            License.objects.create(name='l', image='licenses/a.png')
+            FAQ.objects.create(question='q', answer='a')
+
+    def count_queries(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200, name)
+        return queries
+
+    def test_list_endpoints_stay_within_their_budget(self):
+        for rows in (2, 10):
+            self.add_rows(rows - self.rows)
+            for name, budget in self.BUDGETS.items():
+                with self.subTest(endpoint=name, rows=rows):
+                    queries = self.count_queries(name)
+                    self.assertLessEqual(len(queries), budget, f"{name} ran {len(queries)} queries:\n" + '\n'.join(q['sql'] for q in queries))
+
+
+class ReportingTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'trader{i}', national_id=f'r{i}', phone_number=f'r{i}') for i in range(3)]
+        now = timezone.now()
+        for i, (days_ago, user, side, quantity) in enumerate([
+            (400, 0, 'SELL', 70), (40, 2, 'BUY', 900), (3, 1, 'BUY', 500), (0, 0, 'BUY', 100), (0, 1, 'SELL', 40),
+        ]):
+            tx = GoldTransaction.objects.create(
+                user=self.users[user], transaction_type=side, quantity=quantity, price_per_unit=10,
+                total_price=quantity * 10, fees=i, net_amount=quantity * 10, status='COMPLETED',
+            )
+            GoldTransaction.objects.filter(pk=tx.pk).update(timestamp=now - timedelta(days=days_ago))
+        for user in self.users:
+            wallets.adjust(user.pk, gold=1000, rial=5000)
+        wallets.adjust(self.users[0].pk, rial=-1200)
+
+    def expected(self, period):
+        transactions = GoldTransaction.objects.all()
+        now = timezone.now()
+        starts = {
+            'daily': now.replace(hour=0, minute=0, second=0, microsecond=0),
+            'monthly': now.replace(day=1, hour=0, minute=0, second=0, microsecond=0),
+            'yearly': now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0),
+        }
+        if period:
+            transactions = transactions.filter(timestamp__gte=starts[period])
+        return {
+            'total_gold_bought_mg': transactions.filter(transaction_type='BUY').aggregate(total=Sum('quantity', default=0))['total'],
+            'total_gold_sold_mg': transactions.filter(transaction_type='SELL').aggregate(total=Sum('quantity', default=0))['total'],
+            'total_fees_earned_rials': transactions.aggregate(total=Sum('fees', default=0))['total'],
+            'current_total_rial_in_wallets': RialWallet.objects.aggregate(total=Sum('balance'))['total'],
+            'current_total_gold_in_wallets_mg': GoldWallet.objects.aggregate(total=Sum('balance'))['total'],
+            'trade_count': transactions.count(),
+        }
+
+    def assertMatchesScan(self):
+        for period in (None, 'daily', 'monthly', 'yearly'):
+            with self.subTest(period=period):
+                report = reports.dashboard(period)
+                self.assertEqual({key: report[key] for key in self.expected(period)}, self.expected(period))
+
+    def test_dashboard_matches_a_full_scan_before_and_after_folding(self):
+        self.assertMatchesScan()
+        self.assertEqual(reports.refresh(settle=0, batch=2), 5)
+        self.assertMatchesScan()
+        self.assertFalse(GoldTransaction.objects.filter(id__gt=ReportWatermark.objects.get().last_transaction_id).exists())
+
+        tx = GoldTransaction.objects.create(user=self.users[2], transaction_type='SELL', quantity=5, price_per_unit=10, total_price=50, net_amount=50)
+        wallets.adjust(self.users[2].pk, gold=-5, rial=50, entry_type=LedgerEntry.EntryType.TRADE, source=tx)
+        self.assertMatchesScan()
+        self.assertEqual(reports.refresh(settle=0), 1)
+        self.assertMatchesScan()
+        self.assertEqual(reports.rebuild(settle=0), 6)
+        self.assertMatchesScan()
+
+    def test_recent_rows_are_held_back_until_settled(self):
+        self.assertEqual(reports.refresh(settle=3600), 3)
+        self.assertMatchesScan()
+
+    def test_top_users_by_volume(self):
+        reports.refresh(settle=0)
+        GoldTransaction.objects.create(user=self.users[0], transaction_type='BUY', quantity=2000, price_per_unit=10, total_price=20000, net_amount=20000)
+        top = reports.dashboard(top=2)['top_users']
+        self.assertEqual([(row['username'], row['volume_rials']) for row in top], [('trader0', 21700), ('trader2', 9000)])
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create(username='analyst', national_id='a0', phone_number='a0', is_staff=True)
+        traders = [User.objects.create(username=f'a{i}', national_id=f'a{i + 1}', phone_number=f'a{i + 1}') for i in range(2)]
+        base = timezone.datetime(2026, 1, 5, 10, tzinfo=timezone.get_fixed_timezone(0))
+        for minutes, user, side, quantity in [(5, 0, 'BUY', 100), (50, 1, 'SELL', 30), (55, 0, 'BUY', 20), (125, 1, 'BUY', 7)]:
+            tx = GoldTransaction.objects.create(user=traders[user], transaction_type=side, quantity=quantity, price_per_unit=1, total_price=quantity, fees=1, net_amount=quantity)
+            GoldTransaction.objects.filter(pk=tx.pk).update(timestamp=base + timedelta(minutes=minutes))
+        for minutes, kind, tx_status in [(10, 'DEPOSIT', 'COMPLETED'), (20, 'DEPOSIT', 'PENDING'), (70, 'WITHDRAWAL', 'COMPLETED')]:
+            tx = RialTransaction.objects.create(user=traders[0], transaction_type=kind, amount=1000, status=tx_status)
+            RialTransaction.objects.filter(pk=tx.pk).update(timestamp=base + timedelta(minutes=minutes))
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.force_authenticate(self.admin)
+
+    def get(self, **params):
+        return self.client.get(reverse('api:admin-report-analytics'), params)
+
+    def test_hourly_series(self):
+        series = self.get(interval='hour', start='2026-01-05T10:00:00Z', end='2026-01-05T13:00:00Z').json()['series']
+        self.assertEqual([(row['trades'], row['active_traders'], row['gold_bought'], row['gold_sold']) for row in series], [(3, 2, 120, 30), (0, 0, 0, 0), (1, 1, 7, 0)])
+        self.assertEqual([(row['rial_deposits'], row['rial_withdrawals']) for row in series], [(1000, 0), (0, 1000), (0, 0)])
+
+    def test_past_buckets_are_served_from_the_cache(self):
+        daily = self.get(interval='day', start='2026-01-01', end='2026-01-07').json()['series']
+        self.assertEqual([row['trades'] for row in daily], [0, 0, 0, 0, 4, 0, 0])
+        with CaptureQueriesContext(connection) as queries:
+            again = self.get(interval='day', start='2026-01-01', end='2026-01-07').json()['series']
+        self.assertEqual(again, daily)
+        self.assertFalse([q for q in queries if 'transaction' in q['sql']])
+        weekly = self.get(interval='week', start='2026-01-05', end='2026-01-11').json()['series']
+        self.assertEqual([(row['bucket'][:10], row['trades']) for row in weekly], [('2026-01-05', 4)])
+
+    @override_settings(PAYMENT_WEBHOOK_SECRET='gateway-secret')
+    def test_settling_an_old_transaction_invalidates_its_cached_buckets(self):
+        def deposits(interval, start, end):
+            return [row['rial_deposits'] for row in self.get(interval=interval, start=start, end=end).json()['series']]
+
+        self.assertEqual(deposits('hour', '2026-01-05T10:00:00Z', '2026-01-05T12:00:00Z'), [1000, 0])
+        self.assertEqual(deposits('day', '2026-01-05', '2026-01-05'), [1000])
+        pending = RialTransaction.objects.get(status='PENDING')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('api:admin-rial-transaction-approve', args=[pending.pk])).status_code, 200)
+        self.assertEqual(deposits('hour', '2026-01-05T10:00:00Z', '2026-01-05T12:00:00Z'), [2000, 0])
+        self.assertEqual(deposits('day', '2026-01-05', '2026-01-05'), [2000])
+
+        self.assertEqual(deposits('week', '2026-01-05', '2026-01-11'), [2000])
+        late = RialTransaction.objects.create(user=pending.user, transaction_type='DEPOSIT', amount=500)
+        RialTransaction.objects.filter(pk=late.pk).update(timestamp=pending.timestamp)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(post_webhook(APIClient(HTTP_HOST='localhost'), {'transaction_id': late.pk, 'status': 'completed'}).status_code, 200)
+        self.assertEqual(deposits('week', '2026-01-05', '2026-01-11'), [2500])
+
+        def bought():
+            return [row['gold_bought'] for row in self.get(interval='day', start='2026-01-05', end='2026-01-05').json()['series']]
+        self.assertEqual(bought(), [127])
+        trade = GoldTransaction.objects.get(quantity=100)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(reverse('api:admin-gold-transaction-detail', args=[trade.pk]), {'quantity': 50}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(bought(), [77])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(reverse('api:admin-gold-transaction-detail', args=[trade.pk])).status_code, 204)
+        self.assertEqual(bought(), [27])
+
+    def test_listed_in_the_api_root(self):
+        root = self.client.get(reverse('api-root')).json()
+        self.assertEqual(root['admin-report-analytics'], 'http://localhost' + reverse('api:admin-report-analytics'))
+
+    def test_rejects_bad_parameters(self):
+        self.assertEqual(self.get(interval='minute').status_code, 400)
+        self.assertEqual(self.get(start='2026-02-01', end='2026-01-01').status_code, 400)
+        self.assertEqual(self.get(interval='hour', start='2020-01-01').status_code, 400)
+
+
+@override_settings(BULK_ACTION_CHUNK_SIZE=2)
+class BulkActionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create(username='ops', national_id='o0', phone_number='o0', is_staff=True)
+        self.users = [User.objects.create(username=f'client{i}', national_id=f'o{i + 1}', phone_number=f'o{i + 1}') for i in range(2)]
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.force_authenticate(self.admin)
+
+    def post(self, name, **data):
+        response = self.client.post(reverse(name), data, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return {row.pop('id'): row for row in response.json()['results']}
+
+    def test_bulk_approve_and_reject_rial_transactions(self):
+        deposits = [RialTransaction.objects.create(user=self.users[i % 2], transaction_type='DEPOSIT', amount=100 * (i + 1)) for i in range(3)]
+        done = RialTransaction.objects.create(user=self.users[0], transaction_type='DEPOSIT', amount=5, status='COMPLETED')
+        wallets.adjust(self.users[1].pk, rial=1000)
+        withdrawal = RialTransaction.objects.create(user=self.users[1], transaction_type='WITHDRAWAL', amount=700)
+        wallets.adjust(self.users[1].pk, rial=-700, entry_type=LedgerEntry.EntryType.WITHDRAWAL, source=withdrawal)
+
+        results = self.post('api:admin-rial-transaction-bulk-approve', ids=[tx.pk for tx in deposits] + [done.pk, 999999])
+        self.assertEqual([row.get('status') for row in results.values()], ['COMPLETED'] * 3 + [None, None])
+        self.assertEqual(results[done.pk], {'error': 'This transaction is not pending.'})
+        self.assertEqual(results[999999], {'error': 'Not found.'})
+
+        results = self.post('api:admin-rial-transaction-bulk-reject', filter={'status': 'PENDING'})
+        self.assertEqual(results, {withdrawal.pk: {'status': 'FAILED'}})
+
+        self.assertEqual(RialWallet.objects.get(user=self.users[0]).balance, 400)
+        self.assertEqual(RialWallet.objects.get(user=self.users[1]).balance, 1200)
+        self.assertEqual(LedgerEntry.objects.filter(rial_transaction=withdrawal, entry_type=LedgerEntry.EntryType.REFUND).count(), 1)
+        self.assertEqual(wallets.reconcile(self.users[0].pk, self.users[1].pk), [])
+
+    def test_bulk_review_verifications(self):
+        pending = [UserVerification.objects.create(user=user, status=UserVerification.Status.PENDING, image='verifications/a.png') for user in self.users]
+        self.assertEqual(verification_status(self.users[0].pk), UserVerification.Status.PENDING)
+        with self.captureOnCommitCallbacks(execute=True):
+            results = self.post('api:admin-verification-bulk-reject', ids=[v.pk for v in pending], admin_notes='Blurry')
+        self.assertEqual(set(results), {v.pk for v in pending})
+        self.assertEqual(verification_status(self.users[0].pk), UserVerification.Status.REJECTED)
+        self.assertEqual(User.objects.get(pk=self.users[1].pk).verification_status, UserVerification.Status.REJECTED)
+        self.assertEqual(self.post('api:admin-verification-bulk-verify', ids=[pending[0].pk]), {pending[0].pk: {'error': 'This verification is not pending.'}})
+
+    def test_bulk_verify_bank_accounts_and_validation(self):
+        accounts = [BankAccount.objects.create(user=user, bank_name='mli', card_number=f'{i:016d}') for i, user in enumerate(self.users)]
+        results = self.post('api:admin-bank-account-bulk-verify', filter={'bank_name': 'mli'})
+        self.assertEqual(results, {account.pk: {'status': 'VERIFIED'} for account in accounts})
+        self.assertEqual(BankAccount.objects.filter(status='VERIFIED').count(), 2)
+        self.assertEqual(self.client.post(reverse('api:admin-bank-account-bulk-reject'), {}, format='json').status_code, 400)
+
+
+class NotificationOutboxTests(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create(username='clerk', national_id='c0', phone_number='c0', is_staff=True)
+        self.user = User.objects.create(username='mallory', national_id='c1', phone_number='c1', email='mallory@example.com')
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.force_authenticate(self.admin)
+
+    def test_queued_in_the_transaction_and_sent_by_the_worker(self):
+        deposit = RialTransaction.objects.create(user=self.user, transaction_type='DEPOSIT', amount=250)
+        self.client.post(reverse('api:admin-rial-transaction-approve', args=[deposit.pk]))
+        ticket = Ticket.objects.create(user=self.user, title='Fees?', description='d')
+        self.client.patch(reverse('api:admin-ticket-detail', args=[ticket.pk]), {'answer': 'Half a percent.'}, format='json')
+        self.assertEqual(list(Notification.objects.values_list('kind', 'status')), [('deposit_approved', 'PENDING'), ('ticket_answered', 'PENDING')])
+        self.assertEqual(Ticket.objects.get(pk=ticket.pk).answered_by, self.admin)
+        self.assertEqual(mail.outbox, [])
+
+        self.assertEqual(notifications.deliver(), 2)
+        self.assertEqual([message.to for message in mail.outbox], [['mallory@example.com']] * 2)
+        self.assertIn('250', mail.outbox[0].body)
+        self.assertFalse(Notification.objects.exclude(status=Notification.Status.SENT).exists())
+        self.assertEqual(notifications.deliver(), 0)
+
+    @override_settings(NOTIFICATION_MAX_ATTEMPTS=2)
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        notification = notifications.notify(self.user.pk, 'verification_verified')
+        with mock.patch('api.notifications.EmailMessage.send', side_effect=OSError('mail server down')):
+            self.assertEqual(notifications.deliver(), 1)
+            notification.refresh_from_db()
+            self.assertEqual((notification.status, notification.attempts, notification.last_error), ('PENDING', 1, 'mail server down'))
+            self.assertGreater(notification.next_attempt_at, timezone.now())
+            self.assertEqual(notifications.deliver(), 0)
+
+            Notification.objects.update(next_attempt_at=timezone.now())
+            notifications.deliver()
+        notification.refresh_from_db()
+        self.assertEqual((notification.status, notification.attempts), ('FAILED', 2))
+
+
+def post_webhook(client, payload, **headers):
+    body = json.dumps(payload).encode()
+    signature = hmac.new(b'gateway-secret', body, hashlib.sha256).hexdigest()
+    return client.post(reverse('api:payment-webhook'), body, content_type='application/json', HTTP_X_PAYMENT_SIGNATURE=signature, **headers)
+
+
+@override_settings(PAYMENT_WEBHOOK_SECRET='gateway-secret')
+class PaymentWebhookTests(TestCase):
+    def setUp(self):
+        self.users = [User.objects.create(username=f'payer{i}', national_id=f'w{i}', phone_number=f'w{i}') for i in range(2)]
+        self.deposits = [
+            RialTransaction.objects.create(user=user, transaction_type='DEPOSIT', amount=amount)
+            for user in self.users for amount in (100, 250)
+        ]
+        self.client = APIClient(HTTP_HOST='localhost')
+
+    def test_single_callback_and_replay(self):
+        deposit = self.deposits[0]
+        payload = {'transaction_id': deposit.pk, 'status': 'completed'}
+        self.assertEqual(post_webhook(self.client, payload).data, {'status': 'success'})
+        response = post_webhook(self.client, payload)
+        self.assertEqual((response.status_code, response.data), (200, {'status': 'duplicate'}))
+        self.assertEqual(RialWallet.objects.get(user=deposit.user).balance, 100)
+        self.assertEqual(post_webhook(self.client, {'transaction_id': deposit.pk, 'status': 'failed'}).status_code, 404)
+        self.assertEqual(post_webhook(self.client, {'status': 'completed'}).status_code, 400)
+        self.assertEqual(self.client.post(reverse('api:payment-webhook'), payload, format='json').status_code, 403)
+
+    def test_batch_credits_each_user_once(self):
+        first, second, third, fourth = self.deposits
+        events = [
+            {'transaction_id': first.pk, 'status': 'completed', 'event_id': 'e1'},
+            {'transaction_id': second.pk, 'status': 'completed', 'event_id': 'e2'},
+            {'transaction_id': second.pk, 'status': 'completed', 'event_id': 'e2'},
+            {'transaction_id': third.pk, 'status': 'completed', 'event_id': 'e3'},
+            {'transaction_id': fourth.pk, 'status': 'failed', 'event_id': 'e4'},
+            {'transaction_id': 10 ** 9, 'status': 'completed', 'event_id': 'e5'},
+        ]
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            response = post_webhook(self.client, {'events': events})
+        self.assertEqual(
+            [row['result'] for row in response.data['results']],
+            ['COMPLETED', 'COMPLETED', 'duplicate', 'COMPLETED', 'FAILED', 'not found'],
+        )
+        wallet_updates = [query for query in queries if query['sql'].startswith('UPDATE') and 'rialwallet' in query['sql']]
+        self.assertEqual(len(wallet_updates), 1 if connection.vendor == 'postgresql' else len(self.users))  # one per user elsewhere
+        self.assertEqual(dict(RialWallet.objects.filter(user__in=self.users).values_list('user_id', 'balance')), {
+            self.users[0].pk: 350, self.users[1].pk: 100,
+        })
+        self.assertEqual(LedgerEntry.objects.filter(entry_type=LedgerEntry.EntryType.DEPOSIT).count(), 3)
+        self.assertEqual(Notification.objects.filter(kind='deposit_completed').count(), 3)
+        self.assertEqual(RialTransaction.objects.get(pk=fourth.pk).status, 'FAILED')
+        self.assertEqual(dict(WebhookEvent.objects.values_list('key', 'result')), {
+            'e1': 'COMPLETED', 'e2': 'COMPLETED', 'e3': 'COMPLETED', 'e4': 'FAILED',
+        })
+
+        response = post_webhook(self.client, {'events': events[:2]})
+        self.assertEqual([row['result'] for row in response.data['results']], ['duplicate', 'duplicate'])
+
+        # A callback that arrived before its deposit was recorded is applied when the gateway retries it.
+        RialTransaction.objects.create(pk=10 ** 9, user=self.users[1], transaction_type='DEPOSIT', amount=40)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = post_webhook(self.client, {'events': events[5:]})
+        self.assertEqual([row['result'] for row in response.data['results']], ['COMPLETED'])
+        self.assertEqual(RialWallet.objects.get(user=self.users[1]).balance, 140)
+        self.assertEqual(wallets.reconcile(self.users[0].pk, self.users[-1].pk), [])
+
+
+@skipUnlessDBFeature('has_select_for_update')
+@override_settings(PAYMENT_WEBHOOK_SECRET='gateway-secret')
+class PaymentWebhookConcurrencyTests(TransactionTestCase):
+    def test_concurrent_duplicate_deliveries_credit_once(self):
+        users = [User.objects.create(username=f'rush{i}', national_id=f'r{i}', phone_number=f'r{i}') for i in range(4)]
+        deposits = [RialTransaction.objects.create(user=user, transaction_type='DEPOSIT', amount=10) for user in users for _ in range(5)]
+        events = [{'transaction_id': deposit.pk, 'status': 'completed'} for deposit in deposits]
+
+        def deliver(job):
+            try:
+                return post_webhook(APIClient(HTTP_HOST='localhost'), {'events': events[job % 2::2]}).data['results']
+            finally:
+                connection.close()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = [row['result'] for rows in executor.map(deliver, range(16)) for row in rows]
+
+        self.assertEqual(results.count('COMPLETED'), len(deposits))
+        self.assertEqual(results.count('duplicate'), 7 * len(deposits))
+        self.assertEqual(list(RialWallet.objects.filter(user__in=users).values_list('balance', flat=True)), [50] * 4)
+        self.assertEqual(wallets.reconcile(users[0].pk, users[-1].pk), [])
+
+    def test_overlapping_batches_in_reversed_order_do_not_deadlock(self):
+        users = [User.objects.create(username=f'rush{i}', national_id=f'r{i}', phone_number=f'r{i}') for i in range(4)]
+        barrier = threading.Barrier(2)
+
+        def deliver(batch):
+            try:
+                barrier.wait()  # claim the keys in opposite orders at the same time
+                return webhooks.process(batch)
+            finally:
+                connection.close()
+        for attempt in range(5):
+            deposits = RialTransaction.objects.bulk_create([RialTransaction(user=user, transaction_type='DEPOSIT', amount=1) for user in users for _ in range(100)])
+            events = [{'transaction_id': deposit.pk, 'status': 'completed', 'event_id': f'rush-{attempt}-{i:04d}'} for i, deposit in enumerate(deposits)]
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                results = [result for rows in executor.map(deliver, [events[:300], events[100:][::-1]]) for result in rows]
+            self.assertEqual((results.count('COMPLETED'), results.count('duplicate')), (400, 200))
+
+        self.assertEqual(list(RialWallet.objects.filter(user__in=users).values_list('balance', flat=True)), [500] * 4)
+        self.assertEqual(wallets.reconcile(users[0].pk, users[-1].pk), [])
@@ -0,0 +1,177 @@
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+from decimal import Decimal
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from . import wallets
+from .metrics import counters
+from .models import GoldTransaction, GoldWallet, LedgerEntry, RialWallet
+from .price_cache import price_snapshot
+
+BUY, SELL = GoldTransaction.TransactionType.BUY, GoldTransaction.TransactionType.SELL
+TRADE = LedgerEntry.EntryType.TRADE
+
+TradeRequest = namedtuple('TradeRequest', ['user_id', 'trade_type', 'quantity', 'price', 'future'])
+
+
+class TradeRejected(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def trade_value(quantity, price_per_gram):
+    """The rial value of `quantity` milligrams, which is also the amount moved: gold trades carry no fee."""
+    exact_value = (Decimal(quantity) / Decimal(1000)) * Decimal(price_per_gram)
+    return int(round(exact_value))
+
+
+def execute_trade(user, trade_type, quantity, price):
+    """Executes one trade with a single conditional update of the user's two wallets."""
+    net_amount = trade_value(quantity, price.price)
+    try:
+        with transaction.atomic():
+            tx = GoldTransaction.objects.create(user=user, transaction_type=trade_type, quantity=quantity, price_per_unit=price.price, total_price=net_amount, net_amount=net_amount, status='COMPLETED')
+            if trade_type == BUY:
+                wallets.adjust(user.pk, gold=quantity, rial=-net_amount, entry_type=TRADE, source=tx)
+            else:
+                wallets.adjust(user.pk, gold=-quantity, rial=net_amount, entry_type=TRADE, source=tx)
+    except wallets.InsufficientBalance:
+        raise TradeRejected('Insufficient funds' if trade_type == BUY else 'Insufficient gold')
+    return tx
+
+
+def execute_batch(requests, price):
+    """
+    Executes a batch of trades at `price`, or at a request's own quoted price. Every wallet involved is locked by
+    one SELECT ... FOR UPDATE per wallet table (in user order, so concurrent
+    batches cannot deadlock), the trades are checked in arrival order against
+    the running balances, and the netted balance changes, the transactions and
+    their ledger entries are written with one statement each. Returns a GoldTransaction or a
+    TradeRejected per request.
+    """
+    user_ids = sorted({request.user_id for request in requests})
+    with transaction.atomic():
+        gold = dict(GoldWallet.objects.select_for_update().filter(user_id__in=user_ids).order_by('user_id').values_list('user_id', 'balance'))
+        rial = dict(RialWallet.objects.select_for_update().filter(user_id__in=user_ids).order_by('user_id').values_list('user_id', 'balance'))
+        gold_deltas, rial_deltas = {}, {}
+        results, transactions, entries = [], [], []
+        for request in requests:
+            user_id, quantity = request.user_id, request.quantity
+            if user_id not in gold or user_id not in rial:
+                results.append(TradeRejected('Wallet not found', status=404))
+                continue
+            trade_price = request.price or price
+            net_amount = trade_value(quantity, trade_price.price)
+            if request.trade_type == BUY:
+                if rial[user_id] < net_amount:
+                    results.append(TradeRejected('Insufficient funds'))
+                    continue
+                gold_change, rial_change = quantity, -net_amount
+            else:
+                if gold[user_id] < quantity:
+                    results.append(TradeRejected('Insufficient gold'))
+                    continue
+                gold_change, rial_change = -quantity, net_amount
+
+            gold[user_id] += gold_change
+            rial[user_id] += rial_change
+            gold_deltas[user_id] = gold_deltas.get(user_id, 0) + gold_change
+            rial_deltas[user_id] = rial_deltas.get(user_id, 0) + rial_change
+            tx = GoldTransaction(user_id=user_id, transaction_type=request.trade_type, quantity=quantity, price_per_unit=trade_price.price, total_price=net_amount, net_amount=net_amount, status='COMPLETED')
+            transactions.append(tx)
+            entries.append((tx, gold_change, gold[user_id], rial_change, rial[user_id]))
+            results.append(tx)
+
+        wallets.add_balances(GoldWallet, {user_id: delta for user_id, delta in gold_deltas.items() if delta})
+        wallets.add_balances(RialWallet, {user_id: delta for user_id, delta in rial_deltas.items() if delta})
+        GoldTransaction.objects.bulk_create(transactions)
+        LedgerEntry.objects.bulk_create([
+            LedgerEntry(user_id=tx.user_id, currency=currency, amount=amount, balance_after=balance, entry_type=TRADE, gold_transaction=tx)
+            for tx, gold_change, gold_after, rial_change, rial_after in entries
+            for currency, amount, balance in ((wallets.GOLD, gold_change, gold_after), (wallets.RIAL, rial_change, rial_after))
+        ])
+    return results
+
+
+class TradeEngine:
+    """
+    Optional micro-batching executor for gold trades (TRADE_BATCHING). Request
+    threads submit trades and wait on a future; a single worker thread per
+    process collects them for up to TRADE_BATCH_WINDOW seconds (or
+    TRADE_BATCH_SIZE trades) and executes each batch at one price snapshot.
+    """
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'TRADE_BATCHING', False)
+
+    @property
+    def window(self):
+        return getattr(settings, 'TRADE_BATCH_WINDOW', 0.005)
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'TRADE_BATCH_SIZE', 500)
+
+    def submit(self, user_id, trade_type, quantity, price=None):
+        """
+        Queues a trade at a quoted `price` (a Price) or, by default, at the
+        batch's price snapshot; the returned future resolves to a
+        GoldTransaction or raises TradeRejected. Cancelling the future before
+        its batch starts withdraws the trade.
+        """
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='trade-engine', daemon=True)
+                self._worker.start()
+        future = Future()
+        self._queue.put(TradeRequest(user_id, trade_type, quantity, price, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # A request whose caller gave up waiting (and cancelled its future) is dropped unexecuted.
+            batch = [request for request in self._collect() if request.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            close_old_connections()
+            try:
+                price = None
+                if not all(request.price for request in batch):
+                    price = price_snapshot.get()
+                    if price is None:
+                        raise TradeRejected('Pricing unavailable.', status=503)
+                results = execute_batch(batch, price)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            counters.incr('trade_engine.batches')
+            counters.incr('trade_engine.trades', len(batch))
+            for request, result in zip(batch, results):
+                if isinstance(result, Exception):
+                    request.future.set_exception(result)
+                else:
+                    request.future.set_result(result)
+
+
+trade_engine = TradeEngine()
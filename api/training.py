@@ -0,0 +1,193 @@
+import time
+import warnings
+from io import BytesIO
+import joblib
+import numpy as np
+import pandas as pd
+import pandas_ta as ta  # noqa: F401 (registers the DataFrame.ta accessor)
+from django.core.files.base import ContentFile
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import TimeSeriesSplit
+from .models import PricePrediction
+from .price_frame import cache_dir, load_price_frame
+
+# Models are trained on hourly candles; horizons are counted in those bars.
+FEATURE_RULE = 'h'
+HORIZONS = {
+    PricePrediction.Horizon.DAILY: 24,
+    PricePrediction.Horizon.WEEKLY: 24 * 7,
+}
+FEATURE_VERSION = 1
+# Cached features are extended by recomputing the tail with this many earlier
+# bars, enough for the recursive EMA/RSI/MACD values to converge.
+WARMUP_BARS = 1000
+TARGET_THRESHOLD = 0.01
+MIN_ROWS = 200
+
+N_ESTIMATORS = 100
+WARM_START_TREES = 20
+MAX_TREES = 300
+MIN_NEW_ROWS = 24
+
+SIGNAL_MAP = {1: 'BUY', -1: 'SELL', 0: 'HOLD'}
+
+
+def compute_features(close):
+    df = pd.DataFrame({'close': close})
+    df.ta.sma(length=20, append=True)
+    df.ta.ema(length=50, append=True)
+    df.ta.rsi(length=14, append=True)
+    df.ta.macd(append=True)
+    return df[[col for col in df.columns if col.startswith(('SMA', 'EMA', 'RSI', 'MACD'))]]
+
+
+def feature_cache_path():
+    return cache_dir() / 'features.pkl'
+
+
+def _read_feature_cache(path):
+    try:
+        cached = pd.read_pickle(path)
+    except (OSError, ValueError, EOFError):
+        return None
+    if not isinstance(cached, dict) or cached.get('version') != FEATURE_VERSION:
+        return None
+    return cached['features']
+
+
+def load_features(candles=None, use_cache=True):
+    """
+    Returns (close, features) for the hourly candles. With the cache only the
+    bars after the last cached one (which may have been incomplete) are
+    recomputed; older history changing invalidates it.
+    """
+    if candles is None:
+        candles = load_price_frame(resample=FEATURE_RULE)
+    close = candles['close']
+    if not use_cache:
+        return close, compute_features(close)
+
+    path = feature_cache_path()
+    cached = _read_feature_cache(path)
+    head, start = None, 0
+    if cached is not None and len(cached) and len(close) and cached.index[0] == close.index[0] and cached.index[-1] in close.index:
+        start = close.index.get_loc(cached.index[-1])
+        head = cached.iloc[:-1]
+
+    warmup = max(0, start - WARMUP_BARS)
+    tail = compute_features(close.iloc[warmup:]).iloc[start - warmup:]
+    features = tail if head is None else pd.concat([head, tail])
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pd.to_pickle({'version': FEATURE_VERSION, 'features': features}, path)
+    return close, features
+
+
+def targets(close, bars):
+    """1 (buy), -1 (sell) or 0 (hold) by the move `bars` candles ahead; NaN while that candle is not closed."""
+    future = close.shift(-bars)
+    future.iloc[-1 - bars:] = np.nan
+    change = (future - close) / close
+    target = np.select([change > TARGET_THRESHOLD, change < -TARGET_THRESHOLD], [1, -1], 0).astype(float)
+    return pd.Series(np.where(change.isna(), np.nan, target), index=close.index)
+
+
+def _new_forest(n_jobs):
+    return RandomForestClassifier(n_estimators=N_ESTIMATORS, random_state=42, class_weight='balanced', n_jobs=n_jobs)
+
+
+def walk_forward_accuracy(X, y, bars, splits, n_jobs=1):
+    """Mean accuracy over expanding-window folds, each tested on later data only."""
+    scores = []
+    for train, test in TimeSeriesSplit(n_splits=splits, gap=bars).split(X):
+        model = _new_forest(n_jobs).fit(X.iloc[train], y.iloc[train])
+        scores.append(model.score(X.iloc[test], y.iloc[test]))
+    return float(np.mean(scores))
+
+
+def fit_horizon(horizon, X, y, bars, previous=None, splits=3, validate=False, n_jobs=1):
+    """
+    Fits one horizon's forest. A previous bundle trained on the same features is
+    warm-started with extra trees fitted on the rows labelled since, as long as
+    they cover the same classes; otherwise the forest is refit from scratch.
+    Walk-forward validation runs on full fits, or on every fit with `validate`.
+    Runs without database access so horizons can be trained in worker processes.
+    """
+    model, mode = None, 'full'
+    if previous is not None and previous['features'] == list(X.columns):
+        new = X.index > previous['trained_until']
+        old_model = previous['model']
+        if new.sum() < MIN_NEW_ROWS:
+            model, mode = old_model, 'reused'
+        elif set(np.unique(y[new])) == set(old_model.classes_) and old_model.n_estimators + WARM_START_TREES <= MAX_TREES:
+            model, mode = old_model, 'warm'
+            model.set_params(warm_start=True, n_estimators=old_model.n_estimators + WARM_START_TREES, n_jobs=n_jobs)
+            started = time.perf_counter()
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', UserWarning)  # balanced class weights are recomputed on the new rows only
+                model.fit(X[new], y[new])
+            fit_seconds = time.perf_counter() - started
+
+    if model is None:
+        model = _new_forest(n_jobs)
+        started = time.perf_counter()
+        model.fit(X, y)
+        fit_seconds = time.perf_counter() - started
+    elif mode == 'reused':
+        fit_seconds = 0.0
+
+    accuracy = walk_forward_accuracy(X, y, bars, splits, n_jobs) if splits and (validate or mode == 'full') else None
+    trained_until = previous['trained_until'] if mode == 'reused' else X.index[-1]
+    bundle = {'model': model, 'features': list(X.columns), 'trained_until': trained_until}
+    return horizon, bundle, {'mode': mode, 'rows': len(X), 'fit_seconds': fit_seconds, 'accuracy': accuracy, 'trees': model.n_estimators}
+
+
+def train_horizons(close, features, previous=None, horizons=HORIZONS, jobs=None, splits=3, validate=False):
+    """Trains every horizon in parallel, splitting the available cores between them."""
+    previous = previous or {}
+    jobs = jobs or joblib.cpu_count()
+    workers = min(len(horizons), jobs)
+    tasks = []
+    for horizon, bars in horizons.items():
+        y = targets(close, bars)
+        rows = features.notna().all(axis=1) & y.notna()
+        if rows.sum() < MIN_ROWS:
+            continue
+        tasks.append(delayed(fit_horizon)(
+            horizon, features[rows], y[rows].astype(int), bars, previous.get(horizon),
+            splits=splits, validate=validate, n_jobs=max(1, jobs // workers),
+        ))
+    return Parallel(n_jobs=workers)(tasks) if tasks else []
+
+
+def load_bundle(prediction):
+    """The bundle stored by `save_model`, or None if the file is missing or in an older format."""
+    if not prediction.model_file:
+        return None
+    try:
+        with prediction.model_file.open('rb') as handle:
+            bundle = joblib.load(handle)
+    except Exception:
+        return None
+    return bundle if isinstance(bundle, dict) and 'model' in bundle else None
+
+
+def save_model(horizon, bundle, latest_features, accuracy=None):
+    """Predicts from the latest features and stores the signal together with the model bundle."""
+    model = bundle['model']
+    proba = model.predict_proba(latest_features[bundle['features']])[0]
+    final_signal = SIGNAL_MAP[int(model.classes_[proba.argmax()])]
+    confidence = proba.max() * 100
+
+    defaults = {'signal': final_signal, 'confidence': confidence}
+    if accuracy is not None:
+        defaults['model_accuracy'] = accuracy
+    pred_obj, _ = PricePrediction.objects.update_or_create(horizon=horizon, defaults=defaults)
+
+    buffer = BytesIO()
+    joblib.dump(bundle, buffer)
+    if pred_obj.model_file:
+        pred_obj.model_file.delete(save=False)
+    pred_obj.model_file.save(f'{horizon}_model.joblib', ContentFile(buffer.getvalue()), save=True)
+    return final_signal, confidence
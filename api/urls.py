@@ -3,17 +3,17 @@ from rest_framework import permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
-from rest_framework_simplejwt.views import TokenRefreshView
 from rest_framework.routers import DefaultRouter
 from .views import (
     UserViewSet, FAQViewSet, LicenseViewSet, GoldTradeViewSet,
     RialWalletViewSet, GoldTransactionHistoryViewSet, RialTransactionHistoryViewSet, 
-    LogoutView, PaymentWebhookView, PriceChartView,MyTokenObtainPairView,
+    LogoutView, PaymentWebhookView, PriceChartView,MyTokenObtainPairView, MyTokenRefreshView,
     LatestPriceView, UserBankAccountViewSet, AdminBankAccountViewSet,
     TicketViewSet, AdminVerificationViewSet, UserVerificationView,
     AdminLicenseViewSet, TechnicalAnalysisView, SignalPredictionView,
     AdminUserViewSet, AdminGoldTransactionViewSet, AdminTicketViewSet,
     AdminFAQViewSet, ReportingDashboardView, AdminRialTransactionViewSet,
+    AdminMetricsView, AdminAnalyticsView,
 )
 
 router = DefaultRouter()
@@ -43,9 +43,11 @@ urlpatterns = [
     path('prices/chart/', PriceChartView.as_view(), name='price-chart'),
     path('prices/analysis/', TechnicalAnalysisView.as_view(), name='price-analysis'),
     path('auth/token/', MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
-    path('auth/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('auth/token/refresh/', MyTokenRefreshView.as_view(), name='token_refresh'),
     path('verification/status', UserVerificationView.as_view(), name='verification-status'),
     path('prices/predict-signal/', SignalPredictionView.as_view(), name='price-predict-signal'),
     path('admin/reports/dashboard/', ReportingDashboardView.as_view(), name='admin-report-dashboard'),
+    path('admin/reports/analytics/', AdminAnalyticsView.as_view(), name='admin-report-analytics'),
+    path('admin/metrics/', AdminMetricsView.as_view(), name='admin-metrics'),
     path('', include(router.urls)),
 ]
\ No newline at end of file
@@ -0,0 +1,71 @@
+import time
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from .metrics import counters
+from .models import User, UserVerification
+
+STATUS_KEY = 'verification-status:{}:{}'
+GENERATION_KEY = 'verification-status:{}:generation'
+LOCAL_CACHE_TTL = 5
+
+
+def cache_ttl():
+    """
+    VERIFICATION_CACHE_TTL, cut to LOCAL_CACHE_TTL seconds when the cache is
+    per process: other workers never see its invalidations, so a revoked
+    verification must not stay authorized there for long.
+    """
+    ttl = getattr(settings, 'VERIFICATION_CACHE_TTL', 300)
+    return min(ttl, LOCAL_CACHE_TTL) if isinstance(caches['default'], LocMemCache) else ttl
+
+
+def _generation(user_id):
+    key = GENERATION_KEY.format(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        # Never a reused number, so an entry of an older generation cannot come back.
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def verification_status(user_id):
+    """
+    The status of a user's latest verification, from the cache or the
+    denormalized User column. Entries are keyed by the user's generation,
+    which refresh_statuses() replaces on commit, so a read that raced with a
+    change can only cache its stale status under a generation nobody reads.
+    """
+    key = STATUS_KEY.format(user_id, _generation(user_id))
+    status = cache.get(key)
+    if status is not None:
+        counters.incr('verification.hit')
+        return status
+    counters.incr('verification.miss')
+    status = User.objects.filter(pk=user_id).values_list('verification_status', flat=True).first() or UserVerification.Status.NOT_SUBMITTED
+    cache.add(key, status, timeout=cache_ttl())
+    return status
+
+
+def refresh_status(user_id):
+    """Copies the latest verification's status onto the user and starts a new cache generation once committed."""
+    refresh_statuses([user_id])
+
+
+def refresh_statuses(user_ids):
+    """refresh_status() for many users with one UPDATE, e.g. after a bulk_update that sent no signals."""
+    latest = UserVerification.objects.filter(user_id=OuterRef('pk')).order_by('-id').values('status')[:1]
+    User.objects.filter(pk__in=user_ids).update(verification_status=Coalesce(Subquery(latest), Value(UserVerification.Status.NOT_SUBMITTED)))
+    keys = [GENERATION_KEY.format(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def stats():
+    data = counters.snapshot(prefix='verification.')
+    lookups = data.get('verification.hit', 0) + data.get('verification.miss', 0)
+    data['hit_rate'] = round(data.get('verification.hit', 0) / lookups, 4) if lookups else None
+    return data
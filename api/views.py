@@ -1,49 +1,71 @@
 import hashlib
 import hmac
-from decimal import Decimal
-from datetime import timedelta
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from django.conf import settings
 from django.db import transaction
-from django.core.mail import send_mail
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.utils import timezone
 from django.conf import settings
-from django.db.models import Sum
 from rest_framework import viewsets, permissions, status, mixins,generics
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.routers import APIRootView
 from rest_framework.reverse import reverse
 from rest_framework.parsers import MultiPartParser, FormParser
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .models import (
-    User, GoldTransaction, RialTransaction, Price, FAQ, License,
-    GoldWallet, RialWallet, BankAccount,Ticket, UserVerification,
-    TechnicalAnalysis, PricePrediction,
+    User, GoldTransaction, RialTransaction, FAQ, License,
+    BankAccount,Ticket, UserVerification,
+    TechnicalAnalysis, PricePrediction, LedgerEntry,
 )
 from .serializers import (
     UserSerializer, GoldTransactionSerializer, RialTransactionSerializer,
-    PriceSerializer, FAQSerializer, LicenseSerializer,GoldTradeSerializer,
-    MyTokenObtainPairSerializer, UserBankAccountSerializer, AdminBankAccountSerializer,
+    PriceSerializer, FAQSerializer, LicenseSerializer,GoldTradeSerializer, GoldQuoteSerializer,
+    MyTokenObtainPairSerializer, MyTokenRefreshSerializer, UserBankAccountSerializer, AdminBankAccountSerializer,
     EmptySerializer, RialTransactionActionSerializer, TicketCreateSerializer,
     TicketDetailSerializer, TicketAnswerSerializer, UserVerificationSerializer,
     AdminVerificationSerializer, UserVerificationSubmitSerializer,
     AdminRejectionSerializer, AdminLicenseSerializer, TechnicalAnalysisSerializer,
     UserCreateSerializer, SignalPredictionSerializer, AdminUserSerializer,
     AdminGoldTransactionSerializer, AdminTicketSerializer, AdminFAQSerializer,
-    AdminRialTransactionSerializer,
+    AdminRialTransactionSerializer, PriceCandleSerializer,
+    BulkActionSerializer, BulkRejectionSerializer,
 )
 
 from .filters import (
     GoldTransactionFilter, TicketFilter, RialTransactionFilter,
-
+    UserVerificationFilter, BankAccountFilter,
 )
 
+from .pagination import TransactionCursorPagination
+from . import bulk
+from . import notifications
 from .permissions import IsVerifiedUser
+from .price_cache import price_snapshot
+from . import candles
+from .metrics import counters
+from . import wallets
+from . import quotes
+from . import exports
+from . import reports
+from . import webhooks
+from . import analytics
+from .authentication import revoke_token
+from .verification import stats as verification_stats, verification_status
+from .trade_engine import TradeRejected, execute_trade, trade_engine, trade_value
+from .indicators import TIMEFRAMES, resolve_timeframe
+from .inference import model_registry
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -103,52 +125,79 @@ class LatestPriceView(generics.GenericAPIView):
     serializer_class = PriceSerializer
 
     def get(self, request, *args, **kwargs):
-        try:
-            latest_price = Price.objects.latest('timestamp')
-            serializer = self.get_serializer(latest_price)
-            return Response(serializer.data)
-        except Price.DoesNotExist:
+        latest_price = price_snapshot.get()
+        if latest_price is None:
             return Response({"error": "No price data available."}, status=status.HTTP_404_NOT_FOUND)
+        serializer = self.get_serializer(latest_price)
+        return Response(serializer.data)
 
 
 class GoldTradeViewSet(mixins.ListModelMixin,viewsets.GenericViewSet):
     permission_classes = [permissions.IsAuthenticated, IsVerifiedUser]
-    serializer_class = GoldTradeSerializer
     queryset = GoldTransaction.objects.none()
     
+    def get_serializer_class(self):
+        if self.action == 'quote':
+            return GoldQuoteSerializer
+        return GoldTradeSerializer
+
     def _trade(self, request, trade_type):
         user = request.user
 
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        quantity_in_milligrams = serializer.validated_data['quantity']
-        
-        try:
-            price_per_gram = Price.objects.latest('timestamp').price
-        except Price.DoesNotExist:
-            return Response({'error': 'Pricing unavailable.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
-
-        exact_value = (Decimal(quantity_in_milligrams) / Decimal(1000)) * Decimal(price_per_gram)
-        final_rial_value = int(round(exact_value))
-
-        with transaction.atomic():
-            gold_wallet = GoldWallet.objects.select_for_update().get(user=user)
-            rial_wallet = RialWallet.objects.select_for_update().get(user=user)
+        token = serializer.validated_data.get('quote')
+
+        if token:
+            try:
+                quantity_in_milligrams, price = quotes.redeem(token, user, trade_type)
+            except quotes.QuoteError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if serializer.validated_data.get('quantity', quantity_in_milligrams) != quantity_in_milligrams:
+                quotes.release(token)
+                return Response({'error': 'Quantity does not match the quote.'}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            quantity_in_milligrams = serializer.validated_data['quantity']
+            price = price_snapshot.get()
+            if price is None:
+                return Response({'error': 'Pricing unavailable.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
-            if trade_type == 'BUY':
-                if rial_wallet.balance < final_rial_value: return Response({'error': 'Insufficient funds'}, status=status.HTTP_400_BAD_REQUEST)
-                rial_wallet.balance -= final_rial_value
-                gold_wallet.balance += quantity_in_milligrams
+        try:
+            if trade_engine.enabled:
+                future = trade_engine.submit(user.pk, trade_type, quantity_in_milligrams, price)
+                try:
+                    tx = future.result(timeout=getattr(settings, 'TRADE_BATCH_TIMEOUT', 10))
+                except FutureTimeoutError:
+                    if not future.cancel():
+                        tx = future.result()  # Its batch is already executing; its outcome is what happened.
+                    else:
+                        raise TradeRejected('The trade timed out and was not executed.', status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                tx.user = user
             else:
-                if gold_wallet.balance < quantity_in_milligrams: return Response({'error': 'Insufficient gold'}, status=status.HTTP_400_BAD_REQUEST)
-                gold_wallet.balance -= quantity_in_milligrams
-                rial_wallet.balance += final_rial_value
-
-            rial_wallet.save()
-            gold_wallet.save()
-            tx = GoldTransaction.objects.create(user=user, transaction_type=trade_type, quantity=quantity_in_milligrams, price_per_unit=price_per_gram, total_price=final_rial_value, net_amount=final_rial_value, status='COMPLETED')
+                tx = execute_trade(user, trade_type, quantity_in_milligrams, price)
+        except TradeRejected as e:
+            if token:
+                quotes.release(token)
+            return Response({'error': str(e)}, status=e.status)
         return Response(GoldTransactionSerializer(tx).data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'])
+    def quote(self, request):
+        """Locks the current price for one trade for TRADE_QUOTE_TTL seconds."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        trade_type, quantity = serializer.validated_data['side'], serializer.validated_data['quantity']
+
+        latest_price = price_snapshot.get()
+        if latest_price is None:
+            return Response({'error': 'Pricing unavailable.'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        total = trade_value(quantity, latest_price.price)
+        token, expires_at = quotes.issue(request.user, trade_type, quantity, latest_price)
+        return Response({
+            'quote': token, 'side': trade_type, 'quantity': quantity, 'price_per_unit': latest_price.price,
+            'total_price': total, 'net_amount': total, 'expires_at': expires_at,
+        }, status=status.HTTP_201_CREATED)
+
     @action(detail=False, methods=['post'])
     def buy(self, request):
         return self._trade(request, 'BUY')
@@ -198,45 +247,80 @@ class RialWalletViewSet(mixins.ListModelMixin, viewsets.GenericViewSet):
         serializer.is_valid(raise_exception=True)
         data = serializer.validated_data
         
-        with transaction.atomic():
-            rial_wallet = RialWallet.objects.select_for_update().get(user=request.user)
-            if rial_wallet.balance < data['amount']:
-                return Response({'error': 'Insufficient funds'}, status=status.HTTP_400_BAD_REQUEST)
-            
-            rial_wallet.balance -= data['amount']
-            rial_wallet.save()
-            
-            tx = RialTransaction.objects.create(
-                user=request.user, 
-                transaction_type='WITHDRAWAL', 
-                amount=data['amount'], 
-                status='PENDING',
-                bank_account=data['bank_account']
-            )
+        try:
+            with transaction.atomic():
+                tx = RialTransaction.objects.create(
+                    user=request.user, 
+                    transaction_type='WITHDRAWAL', 
+                    amount=data['amount'], 
+                    status='PENDING',
+                    bank_account=data['bank_account']
+                )
+                wallets.adjust(request.user.pk, rial=-data['amount'], entry_type=LedgerEntry.EntryType.WITHDRAWAL, source=tx)
+        except wallets.InsufficientBalance:
+            return Response({'error': 'Insufficient funds'}, status=status.HTTP_400_BAD_REQUEST)
         response_serializer = RialTransactionSerializer(tx, context={'request': request})
         return Response({'message': 'Withdrawal request received', 'transaction': response_serializer.data}, status=status.HTTP_202_ACCEPTED)
 
 
 class TransactionHistoryViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TransactionCursorPagination
+    related_fields = ['user']
 
     def get_queryset(self):
         user = self.request.user
         model = self.serializer_class.Meta.model
-        return model.objects.filter(user=user).order_by('-timestamp')
+        return model.objects.filter(user=user).select_related(*self.related_fields).order_by('-timestamp', '-id')
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        """
+        Streams all of the user's transactions, oldest first, as `output`=csv
+        (default) or ndjson, optionally limited to `start` <= timestamp < `end`
+        (ISO dates or datetimes). Memory use does not grow with the row count.
+        """
+        output = request.query_params.get('output', 'csv')
+        if output not in exports.FORMATS:
+            return Response({'error': f"output must be one of: {', '.join(exports.FORMATS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            start = exports.parse_bound(request.query_params.get('start'))
+            end = exports.parse_bound(request.query_params.get('end'), end=True)
+        except exports.ExportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        model = self.serializer_class.Meta.model
+        chunks = exports.stream(model, exports.export_rows(model, user=request.user, start=start, end=end), output)
+        if isinstance(request._request, ASGIRequest):
+            chunks = exports.astream(chunks)
+        response = StreamingHttpResponse(chunks, content_type=exports.FORMATS[output])
+        response['Content-Disposition'] = f'attachment; filename="{model._meta.model_name}s.{output}"'
+        return response
 
 class GoldTransactionHistoryViewSet(TransactionHistoryViewSet):
     serializer_class = GoldTransactionSerializer
 
 class RialTransactionHistoryViewSet(TransactionHistoryViewSet):
     serializer_class = RialTransactionSerializer
+    related_fields = ['user', 'bank_account']
 
 
 class LogoutView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def post(self, request):
-        request.user.auth_token.delete()
+        """Revokes the access token used for this request and, if given, the `refresh` token."""
+        if request.auth is not None:
+            revoke_token(request.auth)
+        if request.data.get('refresh'):
+            try:
+                refresh = RefreshToken(request.data['refresh'])
+            except TokenError:
+                return Response({'error': 'Invalid refresh token.'}, status=status.HTTP_400_BAD_REQUEST)
+            if str(refresh.get(api_settings.USER_ID_CLAIM)) != str(request.user.pk):
+                return Response({'error': 'Invalid refresh token.'}, status=status.HTTP_400_BAD_REQUEST)
+            revoke_token(refresh)
+        Token.objects.filter(user_id=request.user.pk).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -254,32 +338,39 @@ class PaymentWebhookView(APIView):
             return Response({'error': 'Invalid signature'}, status=status.HTTP_403_FORBIDDEN)
 
         data = request.data
+        batched = isinstance(data, dict) and 'events' in data
+        if batched:
+            events = data['events']
+            if not isinstance(events, list):
+                return Response({'error': 'events must be a list.'}, status=status.HTTP_400_BAD_REQUEST)
+            if len(events) > getattr(settings, 'WEBHOOK_MAX_EVENTS', 1000):
+                return Response({'error': f"At most {getattr(settings, 'WEBHOOK_MAX_EVENTS', 1000)} events per request."}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            events = [data]
+            if isinstance(data, dict) and request.headers.get('Idempotency-Key') and not data.get('event_id'):
+                events = [{**data, 'event_id': request.headers['Idempotency-Key']}]
         try:
-            with transaction.atomic():
-                rial_tx = RialTransaction.objects.select_for_update().get(id=data.get('transaction_id'), status='PENDING')
-                if data.get('status') == 'completed':
-                    rial_tx.status = 'COMPLETED'
-                    rial_tx.notes = 'Payment confirmed via webhook.'
-                    wallet = RialWallet.objects.select_for_update().get(user=rial_tx.user)
-                    wallet.balance += rial_tx.amount
-                    wallet.save()
-                    try:
-                        send_mail('Deposit Successful!', f'Your deposit of {rial_tx.amount} has been processed.', settings.DEFAULT_FROM_EMAIL, [rial_tx.user.email])
-                    except Exception as e:
-                        print(f"Failed to send deposit confirmation email: {e}")
-                else:
-                    rial_tx.status = 'FAILED'
-                    rial_tx.notes = 'Payment failed via webhook.'
-                rial_tx.save()
-            return Response({'status': 'success'})
-        except RialTransaction.DoesNotExist:
-            return Response({'error': 'Transaction not found or already processed'}, status=status.HTTP_404_NOT_FOUND)
+            results = webhooks.process(events)
         except Exception as e:
             return Response({'error': f'Internal error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
+
+        if batched:
+            return Response({'results': [
+                {'transaction_id': event.get('transaction_id') if isinstance(event, dict) else None, 'result': result}
+                for event, result in zip(events, results)
+            ]})
+        result = results[0]
+        if result == webhooks.DUPLICATE:
+            return Response({'status': 'duplicate'})
+        if result == webhooks.INVALID:
+            return Response({'error': 'A transaction_id is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        if result in (webhooks.NOT_FOUND, webhooks.NOT_PENDING):
+            return Response({'error': 'Transaction not found or already processed'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'status': 'success'})
+
 class PriceChartView(APIView):
     """
-    Provides evenly sampled data for a simple chart.
+    Provides evenly sampled OHLC candles for a simple chart, read from the rollups.
     """
     permission_classes = [permissions.AllowAny]
 
@@ -291,35 +382,8 @@ class PriceChartView(APIView):
         except (ValueError, TypeError):
             points_count = 100
 
-        end_date = timezone.now()
-        
-        if timeframe == 'weekly':
-            start_date = end_date - timedelta(days=7)
-        elif timeframe == 'monthly':
-            start_date = end_date - timedelta(days=30)
-        else: # 'daily'
-            start_date = end_date - timedelta(days=1)
-        
-        queryset = Price.objects.filter(
-            timestamp__gte=start_date
-        ).order_by('timestamp')
-        
-        total_points_in_db = queryset.count()
-
-        if total_points_in_db > points_count:
-            all_pks = list(queryset.values_list('pk', flat=True))
-            
-            step = (total_points_in_db - 1) / (points_count - 1)
-            
-            sampled_indices = [int(round(i * step)) for i in range(points_count)]
-            
-            sampled_pks = [all_pks[i] for i in sampled_indices]
-            
-            sampled_queryset = Price.objects.filter(pk__in=sampled_pks).order_by('timestamp')
-        else:
-            sampled_queryset = queryset
-
-        serializer = PriceSerializer(sampled_queryset, many=True)
+        series = candles.chart_series(timeframe, points_count)
+        serializer = PriceCandleSerializer(series, many=True)
         return Response(serializer.data)
     
 class CustomAuthToken(ObtainAuthToken):
@@ -328,6 +392,9 @@ class CustomAuthToken(ObtainAuthToken):
 class MyTokenObtainPairView(TokenObtainPairView):
     serializer_class = MyTokenObtainPairSerializer
 
+class MyTokenRefreshView(TokenRefreshView):
+    serializer_class = MyTokenRefreshSerializer
+
 class UserBankAccountViewSet(viewsets.ModelViewSet):
     serializer_class = UserBankAccountSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -338,19 +405,57 @@ class UserBankAccountViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class AdminBankAccountViewSet(viewsets.ReadOnlyModelViewSet):
+class BulkActionMixin:
+    """
+    Bulk actions take `ids` or a `filter` (the list endpoint's filter
+    parameters) and answer with one result per object, in request order.
+    """
+    def bulk_ids(self):
+        serializer = self.get_serializer(data=self.request.data)
+        serializer.is_valid(raise_exception=True)
+        limit = getattr(settings, 'BULK_ACTION_MAX_ITEMS', 5000)
+        if 'ids' in serializer.validated_data:
+            ids = list(dict.fromkeys(serializer.validated_data['ids']))
+        else:
+            filterset = self.filterset_class(data=serializer.validated_data['filter'], queryset=self.get_queryset(), request=self.request)
+            if not filterset.is_valid():
+                raise ValidationError({'filter': filterset.errors})
+            ids = list(filterset.qs.order_by('pk').values_list('pk', flat=True)[:limit + 1])
+        if len(ids) > limit:
+            raise ValidationError({'error': f"At most {limit} objects per request."})
+        return ids, serializer.validated_data
+
+    def bulk_response(self, results):
+        return Response({'results': [{'id': pk, **result} for pk, result in results.items()]})
+
+class AdminBankAccountViewSet(BulkActionMixin, viewsets.ReadOnlyModelViewSet):
     """
     Allows admins to view all bank accounts and verify them.
     """
     serializer_class = AdminBankAccountSerializer
     permission_classes = [permissions.IsAdminUser]
     queryset = BankAccount.objects.all()
+    filterset_class = BankAccountFilter
 
     def get_serializer_class(self):
         if self.action in ['verify', 'reject']:
             return EmptySerializer
+        if self.action in ['bulk_verify', 'bulk_reject']:
+            return BulkActionSerializer
         return super().get_serializer_class()
 
+    @action(detail=False, methods=['post'], url_path='bulk-verify')
+    def bulk_verify(self, request):
+        """Marks many accounts as verified."""
+        ids, _ = self.bulk_ids()
+        return self.bulk_response(bulk.set_bank_account_status(ids, BankAccount.VerificationStatus.VERIFIED))
+
+    @action(detail=False, methods=['post'], url_path='bulk-reject')
+    def bulk_reject(self, request):
+        """Marks many accounts as rejected."""
+        ids, _ = self.bulk_ids()
+        return self.bulk_response(bulk.set_bank_account_status(ids, BankAccount.VerificationStatus.REJECTED))
+
 
     @action(detail=True, methods=['post'])
     def verify(self, request, pk=None):
@@ -376,7 +481,7 @@ class TicketViewSet(viewsets.ModelViewSet):
     parser_classes = [MultiPartParser, FormParser]
 
     def get_queryset(self):
-        return Ticket.objects.filter(user=self.request.user)
+        return Ticket.objects.filter(user=self.request.user).select_related('answered_by').prefetch_related('attachments')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -437,9 +542,7 @@ class UserVerificationView(generics.GenericAPIView):
 
     def post(self, request, *args, **kwargs):
         """Creates a NEW verification submission."""
-        latest_verification = UserVerification.objects.filter(user=request.user).last()
-        
-        if latest_verification and latest_verification.status in [UserVerification.Status.PENDING, UserVerification.Status.VERIFIED]:
+        if verification_status(request.user.pk) in [UserVerification.Status.PENDING, UserVerification.Status.VERIFIED]:
             return Response(
                 {'detail': 'You cannot submit a new verification while one is pending or already verified.'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -456,27 +559,46 @@ class UserVerificationView(generics.GenericAPIView):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class AdminVerificationViewSet(viewsets.ReadOnlyModelViewSet):
+class AdminVerificationViewSet(BulkActionMixin, viewsets.ReadOnlyModelViewSet):
     """
     Allows admins to list, review, and approve/reject submissions.
     """
     permission_classes = [permissions.IsAdminUser]
-    queryset = UserVerification.objects.filter(status=UserVerification.Status.PENDING)
+    queryset = UserVerification.objects.filter(status=UserVerification.Status.PENDING).select_related('user')
+    filterset_class = UserVerificationFilter
 
     def get_serializer_class(self):
         if self.action == 'reject':
             return AdminRejectionSerializer
         if self.action == 'verify':
             return EmptySerializer
+        if self.action == 'bulk_verify':
+            return BulkActionSerializer
+        if self.action == 'bulk_reject':
+            return BulkRejectionSerializer
         return AdminVerificationSerializer
 
+    @action(detail=False, methods=['post'], url_path='bulk-verify')
+    def bulk_verify(self, request):
+        """Marks many pending submissions as verified."""
+        ids, _ = self.bulk_ids()
+        return self.bulk_response(bulk.review_verifications(ids, UserVerification.Status.VERIFIED, "Your document has been approved."))
+
+    @action(detail=False, methods=['post'], url_path='bulk-reject')
+    def bulk_reject(self, request):
+        """Marks many pending submissions as rejected with the same note."""
+        ids, data = self.bulk_ids()
+        return self.bulk_response(bulk.review_verifications(ids, UserVerification.Status.REJECTED, data['admin_notes']))
+
     @action(detail=True, methods=['post'])
     def verify(self, request, pk=None):
         """Marks a submission as verified."""
         verification = self.get_object()
         verification.status = UserVerification.Status.VERIFIED
         verification.admin_notes = "Your document has been approved."
-        verification.save()
+        with transaction.atomic():
+            verification.save()
+            notifications.notify(verification.user_id, 'verification_verified')
         return Response({'status': 'Verification approved'})
 
     @action(detail=True, methods=['post'])
@@ -488,31 +610,57 @@ class AdminVerificationViewSet(viewsets.ReadOnlyModelViewSet):
         
         verification.status = UserVerification.Status.REJECTED
         verification.admin_notes = serializer.validated_data['admin_notes']
-        verification.save()
+        with transaction.atomic():
+            verification.save()
+            notifications.notify(verification.user_id, 'verification_rejected', notes=verification.admin_notes)
         return Response({'status': 'Verification rejected'})
     
 class TechnicalAnalysisView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def get(self, request, *args, **kwargs):
-        user_input = request.query_params.get('timeframe', '1d').lower()
-        
-        if user_input in ['weekly', '1w', '7d']:
-            db_timeframe = '1W'
-        else: # Default to daily
-            db_timeframe = '1D'
-            
-        latest_analysis = TechnicalAnalysis.objects.filter(timeframe=db_timeframe).first()
-        
-        if latest_analysis:
-            serializer = TechnicalAnalysisSerializer(latest_analysis)
-            return Response(serializer.data)
-        
-        return Response(
-            {"error": f"Analysis data for timeframe '{db_timeframe}' is not available yet."}, 
-            status=status.HTTP_404_NOT_FOUND
-        )
-    
+        """
+        `?timeframe=1h` returns one analysis (unknown values fall back to daily);
+        `?timeframe=1h,4h,1W` or `?timeframe=all` returns them keyed by label.
+        """
+        user_input = request.query_params.get('timeframe', '1D').strip()
+
+        if user_input.lower() == 'all':
+            labels = list(TIMEFRAMES)
+        elif ',' in user_input:
+            requested = [value.strip() for value in user_input.split(',') if value.strip()]
+            labels = [resolve_timeframe(value) for value in requested]
+            unknown = [value for value, label in zip(requested, labels) if label is None]
+            if unknown:
+                return Response(
+                    {"error": f"Unknown timeframe(s): {', '.join(unknown)}. Available: {', '.join(TIMEFRAMES)}."},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            labels = list(dict.fromkeys(labels))
+        else:
+            db_timeframe = resolve_timeframe(user_input) or '1D'
+            latest_analysis = TechnicalAnalysis.objects.filter(timeframe=db_timeframe).first()
+
+            if latest_analysis:
+                serializer = TechnicalAnalysisSerializer(latest_analysis)
+                return Response(serializer.data)
+
+            return Response(
+                {"error": f"Analysis data for timeframe '{db_timeframe}' is not available yet."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        analyses = {analysis.timeframe: analysis for analysis in TechnicalAnalysis.objects.filter(timeframe__in=labels)}
+        if not analyses:
+            return Response(
+                {"error": f"Analysis data for timeframes {', '.join(labels)} is not available yet."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response({
+            label: TechnicalAnalysisSerializer(analyses[label]).data if label in analyses else None
+            for label in labels
+        })
+
 
 class SignalPredictionView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -524,12 +672,15 @@ class SignalPredictionView(APIView):
         if horizon_param == 'WEEKLY':
             horizon = PricePrediction.Horizon.WEEKLY
         
-        try:
-            prediction = PricePrediction.objects.get(horizon=horizon)
-            serializer = SignalPredictionSerializer(prediction)
-            return Response(serializer.data)
-        except PricePrediction.DoesNotExist:
+        prediction, _ = model_registry.get_model(horizon)
+        if prediction is None:
             return Response({"error": f"Prediction for {horizon} not available yet."}, status=404)
+
+        data = SignalPredictionSerializer(prediction).data
+        live = model_registry.predict(horizon)
+        if live is not None: # Fall back to the signal stored at training time.
+            data.update(live)
+        return Response(data)
         
 
 class AdminUserViewSet(viewsets.ModelViewSet):
@@ -555,9 +706,19 @@ class AdminTicketViewSet(viewsets.ModelViewSet):
     """
     serializer_class = AdminTicketSerializer
     permission_classes = [permissions.IsAdminUser]
-    queryset = Ticket.objects.all().order_by('-created_at')
+    queryset = Ticket.objects.select_related('user', 'answered_by').prefetch_related('attachments').order_by('-created_at')
     filterset_class = TicketFilter
 
+    def perform_update(self, serializer):
+        """Records who answered and when, and notifies the ticket's owner, whenever the answer changes."""
+        answer = serializer.validated_data.get('answer')
+        if not answer or answer == serializer.instance.answer:
+            serializer.save()
+            return
+        with transaction.atomic():
+            ticket = serializer.save(answered_by=self.request.user, answered_at=timezone.now())
+            notifications.notify(ticket.user_id, 'ticket_answered', title=ticket.title)
+
 class AdminFAQViewSet(viewsets.ModelViewSet):
     """
     An endpoint for admins to create, update, and manage all FAQs.
@@ -570,84 +731,115 @@ class ReportingDashboardView(APIView):
     """
     An admin-only endpoint that provides a summary report of platform activity.
     Can be filtered by a 'period' query parameter: daily, monthly, yearly.
+    Answered from the summaries kept by api.reports (see refresh_reports),
+    including per-user volume for the `top` (default 10) users.
     """
     permission_classes = [permissions.IsAdminUser]
 
     def get(self, request, *args, **kwargs):
         period = request.query_params.get('period', None)
-        end_date = timezone.now()
-        start_date = None
-
-        if period == 'daily':
-            start_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        elif period == 'monthly':
-            start_date = end_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        elif period == 'yearly':
-            start_date = end_date.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
-
-        transactions = GoldTransaction.objects.all()
-        if start_date:
-            transactions = transactions.filter(timestamp__gte=start_date)
-
-        total_gold_bought = transactions.filter(transaction_type='BUY').aggregate(total=Sum('quantity'))['total'] or 0
-        total_gold_sold = transactions.filter(transaction_type='SELL').aggregate(total=Sum('quantity'))['total'] or 0
-        total_fees = transactions.aggregate(total=Sum('fees'))['total'] or 0
-        
-        total_rial_in_wallets = RialWallet.objects.aggregate(total=Sum('balance'))['total'] or 0
-        total_gold_in_wallets = GoldWallet.objects.aggregate(total=Sum('balance'))['total'] or 0
-        
-        data = {
-            'report_period': period or 'all_time',
-            'total_gold_bought_mg': total_gold_bought,
-            'total_gold_sold_mg': total_gold_sold,
-            'total_fees_earned_rials': total_fees,
-            'current_total_rial_in_wallets': total_rial_in_wallets,
-            'current_total_gold_in_wallets_mg': total_gold_in_wallets,
-        }
-        
-        return Response(data)
+        try:
+            top = min(int(request.query_params.get('top', 10)), 100)
+        except ValueError:
+            return Response({'error': 'top must be an integer.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(reports.dashboard(period, top=max(top, 0)))
     
-class AdminRialTransactionViewSet(viewsets.ModelViewSet):
+class AdminRialTransactionViewSet(BulkActionMixin, viewsets.ModelViewSet):
     """
     An endpoint for admins to view, filter, and manage all Rial transactions.
     """
     serializer_class = AdminRialTransactionSerializer
     permission_classes = [permissions.IsAdminUser]
-    queryset = RialTransaction.objects.all().order_by('-timestamp')
+    queryset = RialTransaction.objects.select_related('user', 'bank_account__user').order_by('-timestamp')
     filterset_class = RialTransactionFilter
 
+    def get_serializer_class(self):
+        if self.action in ['bulk_approve', 'bulk_reject']:
+            return BulkActionSerializer
+        return super().get_serializer_class()
+
+    def _settle(self, transaction_obj, new_status):
+        """Moves a pending transaction to `new_status`; False if another request settled it first."""
+        transaction_obj.status = new_status
+        if RialTransaction.objects.filter(pk=transaction_obj.pk, status='PENDING').update(status=new_status) != 1:
+            return False
+        transaction.on_commit(lambda: analytics.invalidate([transaction_obj.timestamp]))
+        return True
+
     @action(detail=True, methods=['post'])
     def approve(self, request, pk=None):
         """Approves a pending transaction and updates the user's wallet."""
         transaction_obj = self.get_object()
-        if transaction_obj.status != 'PENDING':
-            return Response({'error': 'This transaction is not pending.'}, status=status.HTTP_400_BAD_REQUEST)
-
         with transaction.atomic():
+            if not self._settle(transaction_obj, 'COMPLETED'):
+                return Response({'error': 'This transaction is not pending.'}, status=status.HTTP_400_BAD_REQUEST)
             if transaction_obj.transaction_type == 'DEPOSIT':
-                wallet = RialWallet.objects.select_for_update().get(user=transaction_obj.user)
-                wallet.balance += transaction_obj.amount
-                wallet.save()
-            
-            transaction_obj.status = 'COMPLETED'
-            transaction_obj.save()
-            
+                wallets.adjust(transaction_obj.user_id, rial=transaction_obj.amount, entry_type=LedgerEntry.EntryType.DEPOSIT, source=transaction_obj)
+                notifications.notify(transaction_obj.user_id, 'deposit_approved', amount=transaction_obj.amount)
+
         return Response({'status': f"Transaction {transaction_obj.id} approved."})
 
     @action(detail=True, methods=['post'])
     def reject(self, request, pk=None):
         """Rejects a pending transaction and refunds the user if it was a withdrawal."""
         transaction_obj = self.get_object()
-        if transaction_obj.status != 'PENDING':
-            return Response({'error': 'This transaction is not pending.'}, status=status.HTTP_400_BAD_REQUEST)
-
         with transaction.atomic():
+            if not self._settle(transaction_obj, 'FAILED'):
+                return Response({'error': 'This transaction is not pending.'}, status=status.HTTP_400_BAD_REQUEST)
             if transaction_obj.transaction_type == 'WITHDRAWAL':
-                wallet = RialWallet.objects.select_for_update().get(user=transaction_obj.user)
-                wallet.balance += transaction_obj.amount
-                wallet.save()
+                wallets.adjust(transaction_obj.user_id, rial=transaction_obj.amount, entry_type=LedgerEntry.EntryType.REFUND, source=transaction_obj)
+                notifications.notify(transaction_obj.user_id, 'withdrawal_rejected', amount=transaction_obj.amount)
+
+        return Response({'status': f"Transaction {transaction_obj.id} rejected."})
+
+    @action(detail=False, methods=['post'], url_path='bulk-approve')
+    def bulk_approve(self, request):
+        """Approves many pending transactions, crediting deposits, in chunks of BULK_ACTION_CHUNK_SIZE."""
+        ids, _ = self.bulk_ids()
+        return self.bulk_response(bulk.settle_rial_transactions(ids, approve=True))
+
+    @action(detail=False, methods=['post'], url_path='bulk-reject')
+    def bulk_reject(self, request):
+        """Rejects many pending transactions, refunding withdrawals, in chunks of BULK_ACTION_CHUNK_SIZE."""
+        ids, _ = self.bulk_ids()
+        return self.bulk_response(bulk.settle_rial_transactions(ids, approve=False))
+
+class AdminAnalyticsView(APIView):
+    """
+    An admin-only endpoint returning time series of trades, active traders,
+    gold bought and sold, fees and completed rial deposits and withdrawals,
+    bucketed by `interval` (hour, day or week, in UTC) between `start` and
+    `end` (ISO dates or datetimes; by default the last ANALYTICS_DEFAULT_BUCKETS).
+    """
+    permission_classes = [permissions.IsAdminUser]
 
-            transaction_obj.status = 'FAILED'
-            transaction_obj.save()
+    def get(self, request, *args, **kwargs):
+        interval = request.query_params.get('interval', 'day')
+        if interval not in analytics.INTERVALS:
+            return Response({'error': f"interval must be one of: {', '.join(analytics.INTERVALS)}."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            end = exports.parse_bound(request.query_params.get('end'), end=True, tz=analytics.UTC) or timezone.now()
+            start = exports.parse_bound(request.query_params.get('start'), tz=analytics.UTC)
+        except exports.ExportError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if start is None:
+            start = analytics.floor(end, interval) - (getattr(settings, 'ANALYTICS_DEFAULT_BUCKETS', 30) - 1) * analytics.INTERVALS[interval]
+        if start >= end:
+            return Response({'error': 'start must be before end.'}, status=status.HTTP_400_BAD_REQUEST)
+        if (end - start) / analytics.INTERVALS[interval] > getattr(settings, 'ANALYTICS_MAX_BUCKETS', 1000):
+            return Response({'error': 'Too many buckets; use a shorter range or a longer interval.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({'interval': interval, 'start': start, 'end': end, 'series': analytics.series(interval, start, end)})
+
+class AdminMetricsView(APIView):
+    """
+    An admin-only endpoint exposing the per-worker cache counters.
+    """
+    permission_classes = [permissions.IsAdminUser]
 
-        return Response({'status': f"Transaction {transaction_obj.id} rejected."})
\ No newline at end of file
+    def get(self, request, *args, **kwargs):
+        return Response({
+            'counters': counters.snapshot(),
+            'price_snapshot': price_snapshot.stats(),
+            'verification_status': verification_stats(),
+        })
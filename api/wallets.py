@@ -0,0 +1,156 @@
+from itertools import groupby
+from operator import itemgetter
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from .models import GoldTransaction, GoldWallet, LedgerCheckpoint, LedgerEntry, RialWallet
+
+GOLD_TABLE, RIAL_TABLE, LEDGER_TABLE = GoldWallet._meta.db_table, RialWallet._meta.db_table, LedgerEntry._meta.db_table
+GOLD, RIAL = LedgerEntry.Currency.GOLD, LedgerEntry.Currency.RIAL
+WALLET_MODELS = {GOLD: GoldWallet, RIAL: RialWallet}
+
+
+def _ledger_insert(currency, cte):
+    """Appends the entry for the change made by the `cte` wallet update, whose amount is the `cte` parameter."""
+    return (
+        f'INSERT INTO "{LEDGER_TABLE}" ("user_id", "currency", "amount", "balance_after", "entry_type", "gold_transaction_id", "rial_transaction_id", "timestamp") '
+        f"SELECT %(user)s, '{currency}', %({cte})s, \"balance\", %(entry_type)s, %(gold_transaction)s::bigint, %(rial_transaction)s::bigint, clock_timestamp() "
+        f'FROM {cte} WHERE %({cte})s <> 0'
+    )
+
+
+# Locks both wallets of the user only if neither balance would go negative,
+# applies both changes and appends their ledger entries; all in one statement.
+ADJUST_SQL = f'''
+WITH allowed AS (
+    SELECT 1 FROM "{GOLD_TABLE}" AS gold JOIN "{RIAL_TABLE}" AS rial ON rial."user_id" = gold."user_id"
+    WHERE gold."user_id" = %(user)s AND gold."balance" + %(gold)s >= 0 AND rial."balance" + %(rial)s >= 0
+    FOR UPDATE
+), gold AS (
+    UPDATE "{GOLD_TABLE}" SET "balance" = "balance" + %(gold)s
+    WHERE "user_id" = %(user)s AND EXISTS (SELECT 1 FROM allowed) RETURNING "balance"
+), rial AS (
+    UPDATE "{RIAL_TABLE}" SET "balance" = "balance" + %(rial)s
+    WHERE "user_id" = %(user)s AND EXISTS (SELECT 1 FROM allowed) RETURNING "balance"
+), gold_entry AS (
+    {_ledger_insert(GOLD, 'gold')}
+), rial_entry AS (
+    {_ledger_insert(RIAL, 'rial')}
+)
+SELECT (SELECT "balance" FROM gold), (SELECT "balance" FROM rial)
+'''
+
+
+class InsufficientBalance(Exception):
+    pass
+
+
+def _source_fields(source):
+    if source is None:
+        return {'gold_transaction': None, 'rial_transaction': None}
+    if isinstance(source, GoldTransaction):
+        return {'gold_transaction': source.pk, 'rial_transaction': None}
+    return {'gold_transaction': None, 'rial_transaction': source.pk}
+
+
+def adjust(user_id, gold=0, rial=0, entry_type=LedgerEntry.EntryType.ADJUSTMENT, source=None):
+    """
+    Adds `gold` milligrams and `rial` rials (either may be negative) to a
+    user's wallets and records them in the ledger against `source` (a gold or
+    rial transaction), all or nothing, unless a balance would go negative.
+    Returns the new (gold, rial) balances or raises InsufficientBalance.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(ADJUST_SQL, {'user': user_id, 'gold': gold, 'rial': rial, 'entry_type': entry_type, **_source_fields(source)})
+            balances = cursor.fetchone()
+        if balances[0] is None:
+            raise InsufficientBalance()
+        return balances
+
+    sources = _source_fields(source)
+    balances, entries = [], []
+    with transaction.atomic():
+        for currency, amount in ((GOLD, gold), (RIAL, rial)):
+            model = WALLET_MODELS[currency]
+            if not model.objects.filter(user_id=user_id, balance__gte=-amount).update(balance=F('balance') + amount):
+                raise InsufficientBalance()
+            balance = model.objects.filter(user_id=user_id).values_list('balance', flat=True).get()
+            balances.append(balance)
+            if amount:
+                entries.append(LedgerEntry(
+                    user_id=user_id, currency=currency, amount=amount, balance_after=balance, entry_type=entry_type,
+                    gold_transaction_id=sources['gold_transaction'], rial_transaction_id=sources['rial_transaction'],
+                ))
+        LedgerEntry.objects.bulk_create(entries)
+    return tuple(balances)
+
+
+def add_balances(model, deltas):
+    """Adds per-user amounts to the balances of many wallets of one kind in a single statement on PostgreSQL."""
+    if not deltas:
+        return
+    if connection.vendor == 'postgresql':
+        values = ', '.join(['(%s::bigint, %s::bigint)'] * len(deltas))
+        params = [value for item in deltas.items() for value in item]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE "{model._meta.db_table}" AS wallet SET "balance" = wallet."balance" + delta.amount '
+                f'FROM (VALUES {values}) AS delta(user_id, amount) WHERE wallet."user_id" = delta.user_id', params
+            )
+    else:
+        for user_id, amount in deltas.items():
+            model.objects.filter(user_id=user_id).update(balance=F('balance') + amount)
+
+
+def balance_at(user_id, currency, when):
+    """
+    A wallet's balance at `when`, read from the last ledger entry before it
+    with one index lookup. Every entry carries the running balance it left,
+    so no checkpoint is consulted; checkpoints only bound what reconcile()
+    replays.
+    """
+    return LedgerEntry.objects.filter(
+        user_id=user_id, currency=currency, timestamp__lte=when,
+    ).order_by('-timestamp', '-id').values_list('balance_after', flat=True).first() or 0
+
+
+def reconcile(first_user_id, last_user_id, checkpoint=False):
+    """
+    Verifies the wallets of users first_user_id..last_user_id against the
+    ledger, replaying only the entries after each wallet's latest checkpoint:
+    every entry's balance_after must follow from the previous one and the last
+    must equal the wallet. Reads one consistent snapshot. Returns the
+    mismatches as (user_id, currency, wallet balance, ledger balance); with
+    `checkpoint`, checkpoints every wallet that matched and has new entries.
+    """
+    mismatches, checkpoints = [], []
+    snapshot = connection.vendor == 'postgresql' and not connection.in_atomic_block
+    with transaction.atomic():
+        if snapshot:
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+
+        for currency, model in WALLET_MODELS.items():
+            latest = LedgerCheckpoint.objects.filter(user_id=OuterRef('user_id'), currency=currency).order_by('-last_entry_id')
+            wallets = model.objects.filter(user_id__gte=first_user_id, user_id__lte=last_user_id).annotate(
+                start_id=Coalesce(Subquery(latest.values('last_entry_id')[:1]), 0),
+                start_balance=Coalesce(Subquery(latest.values('balance')[:1]), 0),
+            ).order_by('user_id').values_list('user_id', 'balance', 'start_id', 'start_balance')
+            entries = LedgerEntry.objects.filter(
+                user_id__gte=first_user_id, user_id__lte=last_user_id, currency=currency,
+                id__gt=Coalesce(Subquery(latest.values('last_entry_id')[:1]), 0),
+            ).order_by('user_id', 'id').values_list('user_id', 'id', 'amount', 'balance_after')
+            history = {user_id: list(rows) for user_id, rows in groupby(entries.iterator(), key=itemgetter(0))}
+
+            for user_id, balance, start_id, running in wallets:
+                consistent, last_id = True, start_id
+                for _, last_id, amount, balance_after in history.get(user_id, ()):
+                    running += amount
+                    consistent = consistent and balance_after == running
+                if not consistent or running != balance:
+                    mismatches.append((user_id, currency, balance, running))
+                elif checkpoint and last_id != start_id:
+                    checkpoints.append(LedgerCheckpoint(user_id=user_id, currency=currency, last_entry_id=last_id, balance=running))
+    LedgerCheckpoint.objects.bulk_create(checkpoints, ignore_conflicts=True)
+    return mismatches
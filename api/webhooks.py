@@ -0,0 +1,117 @@
+from django.db import connection, transaction
+from django.utils import timezone
+from . import bulk
+from .metrics import counters
+from .models import LedgerEntry, RialTransaction, WebhookEvent
+
+DUPLICATE, NOT_FOUND, NOT_PENDING, INVALID = 'duplicate', 'not found', 'not pending', 'invalid'
+
+
+class WebhookError(Exception):
+    pass
+
+
+def _transaction_id(event):
+    value = event.get('transaction_id') if isinstance(event, dict) else None
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.isdigit():
+        return int(value)
+    return None
+
+
+def event_key(event):
+    """The gateway's event_id, or else the (transaction, status) pair it reports."""
+    return str(event.get('event_id') or f"{event['transaction_id']}:{event.get('status')}")[:100]
+
+
+def _claim(events):
+    """
+    Records {key: event} and returns the keys this call inserted. Postgres
+    makes a concurrent delivery of the same key wait for the first one's
+    transaction and then skip it, so each key is applied exactly once. Keys
+    are inserted in sorted order, so overlapping batches never wait on each
+    other in a cycle.
+    """
+    now = timezone.now()
+    rows = sorted((key, event['transaction_id'], str(event.get('status') or '')[:20], now) for key, event in events.items())
+    if not rows:
+        return set()
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {WebhookEvent._meta.db_table} (key, transaction_id, status, result, received_at) "
+                f"VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))} ON CONFLICT (key) DO NOTHING RETURNING key",
+                [value for key, tx_id, status, now in rows for value in (key, tx_id, status, '', now)],
+            )
+            return {key for key, in cursor.fetchall()}
+    known = set(WebhookEvent.objects.filter(key__in=events).values_list('key', flat=True))
+    WebhookEvent.objects.bulk_create([
+        WebhookEvent(key=key, transaction_id=tx_id, status=status, received_at=now)
+        for key, tx_id, status, now in rows if key not in known
+    ])
+    return set(events) - known
+
+
+def process(events):
+    """
+    Applies a batch of gateway callbacks ({'transaction_id', 'status' and
+    optionally 'event_id'}) in one database transaction: keys already applied
+    are skipped, the pending deposits are locked once in id order, and each
+    user's completed deposits are credited with a single wallet update. Keys of
+    events that applied nothing (NOT_FOUND, NOT_PENDING) are not kept. Returns one
+    result per event: 'COMPLETED', 'FAILED', or one of DUPLICATE, NOT_FOUND,
+    NOT_PENDING and INVALID. Raises WebhookError, applying nothing, if a
+    completed deposit's user has no wallet.
+    """
+    results, keyed = [None] * len(events), {}
+    events = [{**event, 'transaction_id': tx_id} if (tx_id := _transaction_id(event)) is not None else None for event in events]
+    for i, event in enumerate(events):
+        if event is None:
+            results[i] = INVALID
+        elif (key := event_key(event)) in keyed:
+            results[i] = DUPLICATE
+        else:
+            keyed[key] = i
+
+    with transaction.atomic():
+        claimed = _claim({key: events[i] for key, i in keyed.items()})
+        found = RialTransaction.objects.select_for_update().filter(
+            pk__in={events[keyed[key]]['transaction_id'] for key in claimed}, transaction_type='DEPOSIT',
+        ).order_by('pk').in_bulk()
+        completed, failed, seen = [], [], set()
+        for key, i in keyed.items():
+            tx = found.get(events[i]['transaction_id'])
+            if key not in claimed:
+                results[i] = DUPLICATE
+            elif tx is None:
+                results[i] = NOT_FOUND
+            elif tx.status != 'PENDING' or tx.pk in seen:
+                results[i] = NOT_PENDING
+            else:
+                seen.add(tx.pk)
+                (completed if events[i].get('status') == 'completed' else failed).append(tx)
+                results[i] = 'COMPLETED' if events[i].get('status') == 'completed' else 'FAILED'
+
+        missing = bulk.settle(
+            completed, 'COMPLETED', credit_type='DEPOSIT', entry_type=LedgerEntry.EntryType.DEPOSIT,
+            notice='deposit_completed', notes='Payment confirmed via webhook.',
+        )
+        if missing:
+            # A deposit without a wallet cannot be credited; roll the batch back so the gateway retries it.
+            raise WebhookError(f"No wallet for transactions {sorted(missing)}")
+        bulk.settle(failed, 'FAILED', notes='Payment failed via webhook.')
+
+        # Only applied events keep their key: a retry of one that found nothing to settle is looked at again.
+        by_result = {}
+        for key in claimed:
+            by_result.setdefault(results[keyed[key]], []).append(key)
+        for result, keys in by_result.items():
+            if result in (NOT_FOUND, NOT_PENDING):
+                WebhookEvent.objects.filter(key__in=keys).delete()
+            else:
+                WebhookEvent.objects.filter(key__in=keys).update(result=result)
+
+    counters.incr('webhook.applied', len(completed) + len(failed))
+    counters.incr('webhook.duplicate', results.count(DUPLICATE))
+    return results
@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'digital_gold.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api.streaming import PriceStreamRouter  # noqa: E402 (needs the app registry loaded above)
+
+# Serves the live price stream (SSE and WebSocket) next to the regular Django views.
+application = PriceStreamRouter(django_application)
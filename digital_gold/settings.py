@@ -124,4 +124,78 @@ SIMPLE_JWT = {
 CORS_ALLOW_ALL_ORIGINS = True
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Seconds a worker may serve its in-memory latest price before revalidating it.
+# Point CACHES at a shared backend (Redis/Memcached) so new prices reach every worker immediately.
+PRICE_SNAPSHOT_MAX_STALENESS = 5
+
+# On-disk cache of the price history used by the analysis/training commands.
+PRICE_FRAME_CACHE_DIR = BASE_DIR / 'cache'
+
+# Seconds between checks for a retrained prediction model in each worker.
+ML_MODEL_CHECK_INTERVAL = 30
+
+# Fee assumed per simulated trade by backtest_signals, as a fraction of its value (e.g. 0.005 for 0.5%).
+BACKTEST_FEE_RATE = 0
+
+# Price feed used by the ingest_prices daemon ('brsapi' or the local 'fake' provider) and its poll interval in seconds.
+PRICE_PROVIDER = 'brsapi'
+PRICE_POLL_INTERVAL = 60
+
+# Live price stream (digital_gold/asgi.py): seconds between checks for new ticks per process,
+# seconds between keep-alives on idle connections, and how many missed ticks a reconnect replays.
+PRICE_STREAM_POLL_INTERVAL = 1
+PRICE_STREAM_HEARTBEAT = 15
+PRICE_STREAM_REPLAY_LIMIT = 1000
+
+# Optional micro-batched trade execution (api/trade_engine.py): trades arriving within TRADE_BATCH_WINDOW seconds
+# (at most TRADE_BATCH_SIZE) share one price, one lock round-trip and one write per table. A trade still queued
+# after TRADE_BATCH_TIMEOUT seconds is withdrawn and answered with 503; one already executing is waited for.
+TRADE_BATCHING = False
+TRADE_BATCH_WINDOW = 0.005
+TRADE_BATCH_SIZE = 500
+TRADE_BATCH_TIMEOUT = 10
+
+# Seconds a signed trade quote (POST trade/gold/quote/) holds its price. Used quotes are recorded in the
+# RedeemedQuote table; `manage.py purge_expired` deletes the expired ones.
+TRADE_QUOTE_TTL = 10
+
+# Seconds a user's verification status may be served from CACHES. Changes invalidate it, but only in a shared
+# cache (Redis/Memcached): with the default per-process LocMemCache entries are kept at most 5 seconds instead.
+VERIFICATION_CACHE_TTL = 300
+
+# Build request.user from the JWT claims instead of loading the row on every request; only the
+# is_active flag is looked up, through a per-process LRU of this many users kept for this many seconds.
+JWT_CLAIMS_AUTH = False
+JWT_ACTIVE_CACHE_SIZE = 10000
+JWT_ACTIVE_CACHE_TTL = 60
+
+# Revoked tokens (logout, deactivation) are stored in the TokenRevocation table and read through CACHES for this
+# many seconds, or at most 5 with the per-process LocMemCache; `manage.py purge_expired` deletes expired ones.
+JWT_REVOCATION_CACHE_TTL = 60
+
+# Rows fetched per round trip by the server-side cursor behind transaction exports.
+EXPORT_CHUNK_SIZE = 2000
+
+# Reporting summaries (api.reports): rows younger than this are left for the next refresh, and ids folded per transaction.
+REPORT_SETTLE_SECONDS = 60
+REPORT_FOLD_BATCH = 50000
+
+# Admin analytics series: buckets returned when no start is given, and the most one request may ask for.
+ANALYTICS_DEFAULT_BUCKETS = 30
+ANALYTICS_MAX_BUCKETS = 1000
+
+# Admin bulk actions (e.g. admin/rial-transactions/bulk-approve/): objects per database transaction, and per request.
+BULK_ACTION_CHUNK_SIZE = 200
+BULK_ACTION_MAX_ITEMS = 5000
+
+# Notification outbox (api.notifications, sent by `manage.py deliver_notifications`): emails per claim,
+# seconds a claim is leased to one worker, first retry delay (doubling per attempt, at most an hour) and attempts before giving up.
+NOTIFICATION_BATCH_SIZE = 100
+NOTIFICATION_LEASE = 300
+NOTIFICATION_RETRY_DELAY = 30
+NOTIFICATION_MAX_ATTEMPTS = 8
+
+# Payment webhook (api.webhooks): callbacks accepted in one batched request ({"events": [...]}).
+WEBHOOK_MAX_EVENTS = 1000
@@ -37,7 +37,9 @@ class CustomAPIRootView(APIView):
             "admin-ticket": reverse("api:admin-ticket-list", request=request),
             "admin-faq": reverse("api:admin-faq-list", request=request),
             "admin-report-dashboard": reverse("api:admin-report-dashboard", request=request),
+            "admin-report-analytics": reverse("api:admin-report-analytics", request=request),
             "admin-rial-transaction": reverse("api:admin-rial-transaction-list", request=request),
+            "admin-metrics": reverse("api:admin-metrics", request=request),
         }
         return Response(dict(sorted(data.items())))
 